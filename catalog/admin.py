@@ -1,6 +1,13 @@
+import uuid
+
 from django.contrib import admin
+from django.core.paginator import Paginator
+from django.forms.models import BaseInlineFormSet
+from django.http import Http404, JsonResponse
+from django.urls import path
 
-from catalog.models import Author, Genre, Book, BookInstance, Language
+from catalog.models import Author, Genre, Book, BookInstance, BorrowerOverdue, Language, LoanEvent, OverdueLoan
+from catalog.pagination import EstimatedCountPaginator
 
 admin.site.register(Language)
 admin.site.register(Genre)
@@ -9,41 +16,227 @@ admin.site.register(Genre)
 # admin.site.register(BookInstance)
 
 
-class BooksInline(admin.TabularInline):
+def _stable_order(queryset):
+    """Order on the model's ordering, then pk, so that pages don't overlap."""
+    ordering = queryset.query.order_by or queryset.model._meta.ordering
+    return queryset.order_by(*ordering, 'pk')
+
+
+class PaginatedInlineFormSet(BaseInlineFormSet):
+    """Inline formset editing one page of the related rows, chosen by the <prefix>-page parameter."""
+    per_page = 20
+    total_count_field = None
+    params = {}
+
+    def get_queryset(self):
+        if not hasattr(self, 'page'):
+            queryset = _stable_order(super().get_queryset())
+            if self.total_count_field and self.instance.pk is not None:
+                # A counter kept on the parent row spares the COUNT(*)
+                count = getattr(self.instance, self.total_count_field)
+            else:
+                count = queryset.count()
+            paginator = Paginator(range(count), self.per_page)
+            self.page = paginator.get_page(self.params.get(f'{self.prefix}-page'))
+            self._queryset = queryset[self.page.start_index() - 1:self.page.end_index()] if count else queryset
+        return self._queryset
+
+    def page_links(self):
+        """(page number, query string) of the first, last and nearby pages; None marks a gap."""
+        self.get_queryset()
+        current, last = self.page.number, self.page.paginator.num_pages
+        numbers = sorted({1, last, *range(max(current - 3, 1), min(current + 3, last) + 1)})
+        links = []
+        for previous, number in zip([0] + numbers, numbers):
+            if number > previous + 1:
+                links.append((None, None))
+            params = self.params.copy()
+            params[f'{self.prefix}-page'] = number
+            links.append((number, params.urlencode()))
+        return links
+
+
+class PaginatedInline(admin.TabularInline):
+    """Tabular inline showing per_page related rows at a time, with their total count.
+
+    The rows are also served as JSON, a page at a time, by the parent's
+    InlineRowsMixin for loading them on demand; json_fields lists the
+    fields included.
+    """
+    formset = PaginatedInlineFormSet
+    template = 'catalog/admin/paginated_tabular.html'
+    per_page = 20
+    total_count_field = None
+    json_fields = ('pk',)
+
+    def get_formset(self, request, obj=None, **kwargs):
+        formset = super().get_formset(request, obj, **kwargs)
+        return type(formset.__name__, (formset,), {
+            'per_page': self.per_page,
+            'total_count_field': self.total_count_field,
+            'params': request.GET.copy(),
+        })
+
+
+class InlineRowsMixin:
+    """Serve the rows of the paginated inlines of a change page as JSON, at <id>/inline/<prefix>/?page=N."""
+
+    def get_urls(self):
+        info = self.model._meta.app_label, self.model._meta.model_name
+        return [
+            path('<path:object_id>/inline/<str:prefix>/', self.admin_site.admin_view(self.inline_rows_view),
+                 name='%s_%s_inline_rows' % info),
+        ] + super().get_urls()
+
+    def inline_rows_view(self, request, object_id, prefix):
+        obj = self.get_object(request, object_id)
+        if obj is None:
+            raise Http404('No such object.')
+        for inline in self.get_inline_instances(request, obj):
+            formset = inline.get_formset(request, obj)
+            if isinstance(inline, PaginatedInline) and formset.get_default_prefix() == prefix:
+                break
+        else:
+            raise Http404('No such inline.')
+
+        queryset = _stable_order(inline.get_queryset(request).filter(**{formset.fk.name: obj}))
+        page = Paginator(queryset.values(*inline.json_fields), inline.per_page).get_page(request.GET.get('page'))
+        return JsonResponse({
+            'count': page.paginator.count,
+            'page': page.number,
+            'pages': page.paginator.num_pages,
+            'rows': list(page.object_list),
+        })
+
+
+class BooksInline(PaginatedInline):
     model = Book
+    json_fields = ('pk', 'title', 'isbn', 'language__name', 'copies_total')
 
 
 # admin.site.register(Author)
 
 # Define the admin class
-class AuthorAdmin(admin.ModelAdmin):
+class AuthorAdmin(InlineRowsMixin, admin.ModelAdmin):
     list_display = ('last_name', 'first_name', 'date_of_birth', 'date_of_death')
     fields = ['first_name', 'last_name', ('date_of_birth', 'date_of_death')]
+    search_fields = ('last_name', 'first_name')
     inlines = [BooksInline]
 
 # Register the admin class with the associated model
 admin.site.register(Author, AuthorAdmin)
 
-class BooksInstanceInline(admin.TabularInline):
+class BooksInstanceInline(PaginatedInline):
     model = BookInstance
+    raw_id_fields = ('borrower',)
+    total_count_field = 'copies_total'
+    json_fields = ('uuid', 'imprint', 'status', 'due_back', 'borrower__username')
 
 # Register the Admin classes for Book using the decorator
 @admin.register(Book)
-class BookAdmin(admin.ModelAdmin):
+class BookAdmin(InlineRowsMixin, admin.ModelAdmin):
     list_display = ('title', 'author', 'display_genre')
+    list_select_related = ('author',)
+    search_fields = ('title', 'isbn')
+    autocomplete_fields = ('author',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     inlines = [BooksInstanceInline]
 
+    def get_queryset(self, request):
+        # display_genre() reads the prefetched genres instead of querying them per row
+        return super().get_queryset(request).prefetch_related('genre')
+
+class OverdueListFilter(admin.SimpleListFilter):
+    """Filter copies by the overdue loans found by the last overdue sweep."""
+    title = 'overdue'
+    parameter_name = 'overdue'
+
+    def lookups(self, request, model_admin):
+        return (('yes', 'Yes'), ('no', 'No'))
+
+    def queryset(self, request, queryset):
+        if self.value() == 'yes':
+            return queryset.filter(overdue__isnull=False)
+        if self.value() == 'no':
+            return queryset.filter(overdue__isnull=True)
+        return queryset
+
+
 # Register the Admin classes for BookInstance using the decorator
 @admin.register(BookInstance) 
 class BookInstanceAdmin(admin.ModelAdmin):
-    list_display = ('book', 'status', 'borrower', 'due_back', 'id')
-    list_filter = ('status', 'due_back')
+    list_display = ('book', 'status', 'borrower', 'due_back', 'uuid')
+    list_filter = ('status', OverdueListFilter, 'due_back')
+    list_select_related = ('book', 'borrower')
+    autocomplete_fields = ('book',)
+    raw_id_fields = ('borrower',)
+    paginator = EstimatedCountPaginator
+    # Filtered pages count their own rows only, not the whole table a second time
+    show_full_result_count = False
+
+    readonly_fields = ('uuid',)
 
     fieldsets = (
         (None, {
-            'fields': ('book', 'imprint', 'id')
+            'fields': ('book', 'imprint', 'uuid')
         }),
         ('Availability', {
             'fields': ('status', 'due_back', 'borrower')
         }),
-    )
\ No newline at end of file
+    )
+
+    def get_object(self, request, object_id, from_field=None):
+        # Links made when the UUID was the primary key keep working
+        try:
+            copy_uuid = uuid.UUID(object_id)
+        except ValueError:
+            return super().get_object(request, object_id, from_field)
+        return self.get_queryset(request).filter(uuid=copy_uuid).first()
+
+
+@admin.register(OverdueLoan)
+class OverdueLoanAdmin(admin.ModelAdmin):
+    list_display = ('copy', 'book', 'borrower', 'due_back', 'days_overdue', 'swept')
+    list_select_related = ('copy__book', 'book', 'borrower')
+    list_filter = ('swept',)
+    search_fields = ('borrower__username', 'book__title')
+
+    # Written by the overdue sweep only
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(BorrowerOverdue)
+class BorrowerOverdueAdmin(admin.ModelAdmin):
+    list_display = ('borrower', 'loans', 'max_days_overdue', 'oldest_due_back', 'swept')
+    list_select_related = ('borrower',)
+    search_fields = ('borrower__username',)
+
+    # Written by the overdue sweep only
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(LoanEvent)
+class LoanEventAdmin(admin.ModelAdmin):
+    list_display = ('at', 'action', 'book', 'borrower', 'due_back')
+    list_select_related = ('book', 'borrower')
+    list_filter = ('action',)
+    search_fields = ('borrower__username', 'book__title')
+    raw_id_fields = ('copy', 'book', 'borrower')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    # Written by the loan operations only
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
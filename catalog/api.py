@@ -0,0 +1,247 @@
+"""Read-only JSON API for books, authors and copies.
+
+Every response carries a strong ETag and a Last-Modified header derived from
+the `modified` version stamps of the rows it shows. The stamps are cached
+and invalidated by the signal handlers in catalog/signals.py, so a repeated
+conditional GET is answered with 304 without touching the database.
+"""
+import hashlib
+
+from django.core.cache import cache
+from django.db.models import Count, Max, Prefetch
+from django.http import Http404, JsonResponse
+from django.urls import reverse
+from django.views.decorators.http import condition, require_safe
+
+from catalog.caching import increment
+from catalog.models import COPY_COUNTERS, Author, Book, BookInstance
+
+STAMP_CACHE_KEY = 'catalog:api:stamp:{}:{}'
+GENERATION_CACHE_KEY = 'catalog:api:generation'
+STAMP_TIMEOUT = 24 * 60 * 60
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 500
+
+BOOK_FIELDS = ('id', 'title', 'summary', 'isbn', 'author', 'language', 'genres', 'availability', 'url')
+AUTHOR_FIELDS = ('id', 'first_name', 'last_name', 'date_of_birth', 'date_of_death', 'books', 'url')
+COPY_FIELDS = ('id', 'imprint', 'status', 'due_back')
+
+
+def _generation():
+    """Counter bumped by changes that affect many representations (authors, genres, languages)."""
+    return cache.get_or_set(GENERATION_CACHE_KEY, 1, None)
+
+
+def bump_generation():
+    increment(GENERATION_CACHE_KEY)
+
+
+def invalidate_stamps(*keys):
+    """Forget the cached stamps of the given (kind, pk) pairs; pk is '' for collections."""
+    generation = _generation()
+    cache.delete_many([STAMP_CACHE_KEY.format(generation, f'{kind}:{pk}') for kind, pk in keys])
+
+
+def invalidate_copy_stamps(book_ids, counts_changed=True):
+    """Forget the stamps of the copies of the books (and the books when their counts changed)."""
+    keys = [('copies', book_id) for book_id in book_ids]
+    if counts_changed:
+        keys += [('book', book_id) for book_id in book_ids] + [('books', '')]
+    invalidate_stamps(*keys)
+
+
+def _stamp(kind, pk, compute):
+    """Return (last modified, token) for an entity, from the cache when possible."""
+    key = STAMP_CACHE_KEY.format(_generation(), f'{kind}:{pk}')
+    stamp = cache.get(key)
+    if stamp is None:
+        last_modified, count = compute()
+        if count == 0 and kind in ('book', 'author'):
+            raise Http404(f'No such {kind}.')
+        stamp = (last_modified, f'{_generation()}:{last_modified and last_modified.isoformat()}:{count}')
+        cache.set(key, stamp, STAMP_TIMEOUT)
+    return stamp
+
+
+def _aggregate(queryset):
+    result = queryset.aggregate(last_modified=Max('modified'), count=Count('pk'))
+    return result['last_modified'], result['count']
+
+
+def _author_stamp(pk):
+    # An author's representation lists its books, so their stamps count too
+    last_modified, count = _aggregate(Author.objects.filter(pk=pk))
+    books_modified, _ = _aggregate(Book.objects.filter(author=pk))
+    if books_modified and (last_modified is None or books_modified > last_modified):
+        last_modified = books_modified
+    return last_modified, count
+
+
+# Kind of entity: function returning (last modified, row count) from the database
+STAMPS = {
+    'books': lambda pk: _aggregate(Book.objects.all()),
+    'book': lambda pk: _aggregate(Book.objects.filter(pk=pk)),
+    'copies': lambda pk: _aggregate(BookInstance.objects.filter(book=pk)),
+    'authors': lambda pk: _aggregate(Author.objects.all()),
+    'author': _author_stamp,
+}
+
+
+def _view_stamp(request, **kwargs):
+    kind = request.resolver_match.url_name.replace('api-', '')
+    pk = kwargs.get('pk', '')
+    return _stamp(kind, pk, lambda: STAMPS[kind](pk))
+
+
+def _etag(request, **kwargs):
+    last_modified, token = _view_stamp(request, **kwargs)
+    # The query string selects fields and pages, it is part of the representation
+    query = request.GET.urlencode()
+    return hashlib.sha1(f'{request.path}?{query}#{token}'.encode()).hexdigest()
+
+
+def _last_modified(request, **kwargs):
+    return _view_stamp(request, **kwargs)[0]
+
+
+def conditional(view):
+    return require_safe(condition(etag_func=_etag, last_modified_func=_last_modified)(view))
+
+
+def _selected_fields(request, allowed):
+    """The fields requested with ?fields=a,b, or every field."""
+    requested = request.GET.get('fields')
+    if not requested:
+        return list(allowed)
+    fields = [field for field in requested.split(',') if field in allowed]
+    return fields or list(allowed)
+
+
+def _page(request, queryset):
+    """Keyset page on the primary key: ?after=<pk>&limit=<n>."""
+    try:
+        limit = min(max(int(request.GET.get('limit', DEFAULT_LIMIT)), 1), MAX_LIMIT)
+        after = request.GET.get('after')
+        if after:
+            queryset = queryset.filter(pk__gt=int(after))
+    except ValueError:
+        raise Http404('Invalid page.')
+
+    rows = list(queryset.order_by('pk')[:limit + 1])
+    next_url = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        params = request.GET.copy()
+        params['after'] = rows[-1].pk
+        next_url = f'{request.path}?{params.urlencode()}'
+    return rows, next_url
+
+
+def _book_queryset(fields):
+    """Books loading only the columns and relations the selected fields need."""
+    columns = ['id'] + [field for field in ('title', 'summary', 'isbn') if field in fields]
+    queryset = Book.objects.all()
+    if 'author' in fields:
+        columns += ['author', 'author__first_name', 'author__last_name']
+        queryset = queryset.select_related('author')
+    if 'language' in fields:
+        columns += ['language', 'language__name']
+        queryset = queryset.select_related('language')
+    if 'availability' in fields:
+        columns += COPY_COUNTERS
+    if 'genres' in fields:
+        queryset = queryset.prefetch_related('genre')
+    return queryset.only(*columns)
+
+
+def serialize_book(book, fields):
+    data = {}
+    for field in fields:
+        if field == 'author':
+            data['author'] = book.author and {
+                'id': book.author_id,
+                'name': f'{book.author.first_name} {book.author.last_name}',
+                'url': reverse('api-author', args=[book.author_id]),
+            }
+        elif field == 'language':
+            data['language'] = book.language and book.language.name
+        elif field == 'genres':
+            data['genres'] = [genre.name for genre in book.genre.all()]
+        elif field == 'availability':
+            data['availability'] = {
+                'total': book.copies_total,
+                'available': book.copies_available,
+                'on_loan': book.copies_on_loan,
+                'maintenance': book.copies_maintenance,
+                'reserved': book.copies_reserved,
+            }
+        elif field == 'url':
+            data['url'] = reverse('api-book', args=[book.pk])
+        else:
+            data[field] = getattr(book, field)
+    return data
+
+
+def serialize_author(author, fields):
+    data = {}
+    for field in fields:
+        if field == 'books':
+            data['books'] = [
+                {'id': book.pk, 'title': book.title, 'url': reverse('api-book', args=[book.pk])}
+                for book in author.book_set.all()
+            ]
+        elif field == 'url':
+            data['url'] = reverse('api-author', args=[author.pk])
+        else:
+            data[field] = getattr(author, field)
+    return data
+
+
+def _author_queryset(fields):
+    queryset = Author.objects.all()
+    if 'books' in fields:
+        queryset = queryset.prefetch_related(
+            Prefetch('book_set', queryset=Book.objects.only('id', 'title', 'author')))
+    return queryset
+
+
+@conditional
+def book_list(request):
+    fields = _selected_fields(request, BOOK_FIELDS)
+    books, next_url = _page(request, _book_queryset(fields))
+    return JsonResponse({'results': [serialize_book(book, fields) for book in books], 'next': next_url})
+
+
+@conditional
+def book_detail(request, pk):
+    fields = _selected_fields(request, BOOK_FIELDS)
+    book = _book_queryset(fields).filter(pk=pk).first()
+    if book is None:
+        raise Http404('No such book.')
+    return JsonResponse(serialize_book(book, fields))
+
+
+@conditional
+def copy_list(request, pk):
+    fields = _selected_fields(request, COPY_FIELDS)
+    # Copies are identified publicly by their UUID
+    columns = ['uuid' if field == 'id' else field for field in fields]
+    copies = BookInstance.objects.filter(book=pk).order_by('due_back', 'id').values_list(*columns)
+    return JsonResponse({'results': [dict(zip(fields, copy)) for copy in copies]})
+
+
+@conditional
+def author_list(request):
+    fields = _selected_fields(request, AUTHOR_FIELDS)
+    authors, next_url = _page(request, _author_queryset(fields))
+    return JsonResponse({'results': [serialize_author(author, fields) for author in authors], 'next': next_url})
+
+
+@conditional
+def author_detail(request, pk):
+    fields = _selected_fields(request, AUTHOR_FIELDS)
+    author = _author_queryset(fields).filter(pk=pk).first()
+    if author is None:
+        raise Http404('No such author.')
+    return JsonResponse(serialize_author(author, fields))
@@ -0,0 +1,186 @@
+"""Build and serving of the hashed, pre-compressed static bundles.
+
+build_assets() concatenates the sources of each bundle of
+CATALOG_ASSET_BUNDLES (found like any static file), minifies them and
+writes them to CATALOG_ASSETS_ROOT under a name carrying a hash of their
+content, with gzip and, when the brotli package is installed, brotli
+variants next to them. manifest.json maps each bundle to its hashed name
+for the {% bundle_url %} template tag.
+serve_asset() serves the built files with far-future cache headers, as a
+new name is used whenever the content changes, choosing the pre-compressed
+variant the client accepts.
+"""
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+from functools import lru_cache
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.http import FileResponse, Http404
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from django.views.decorators.http import require_safe
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+MANIFEST_NAME = 'manifest.json'
+# A year, the longest lifetime RFC 7234 advises
+FAR_FUTURE = 365 * 24 * 60 * 60
+
+# Variants of a file by Accept-Encoding coding, in order of preference
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+_STRING = r'"(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\''
+# What minify_css leaves out of its rewriting: comments, which it drops, url()
+# values and strings, which it keeps. Found in one pass, so that a quote in a
+# comment or a comment in a string is taken for what it is
+CSS_VERBATIM = re.compile(r'/\*.*?\*/|url\(\s*(?:%s|[^)"\']*)\s*\)|%s' % (_STRING, _STRING), re.S | re.I)
+
+
+class MissingSources(Exception):
+    def __init__(self, missing):
+        super().__init__(f'Static files not found: {", ".join(missing)}')
+        self.missing = missing
+
+
+def assets_root():
+    return settings.CATALOG_ASSETS_ROOT
+
+
+def minify_css(css):
+    """Drop comments and the whitespace that doesn't separate tokens.
+
+    Strings and url() values are left as they are, and so are /*! comments,
+    which licenses like Bootstrap's use.
+    """
+    kept = []
+
+    def keep(match):
+        if match.group().startswith('/*') and not match.group().startswith('/*!'):
+            return ''
+        kept.append(match.group())
+        return f'\0{len(kept) - 1}\0'
+
+    css = CSS_VERBATIM.sub(keep, css)
+    css = re.sub(r'\s+', ' ', css)
+    css = re.sub(r'\s*([{};,>])\s*', r'\1', css)
+    # A space before a colon only goes in declarations: in a selector,
+    # "div :first-child" and "div:first-child" differ
+    css = re.sub(r'([{;][-\w]+)\s+:(?=[^{};]*[;}])', r'\1:', css)
+    css = re.sub(r':\s+', ':', css)
+    css = css.replace(';}', '}').strip()
+    return re.sub(r'\0(\d+)\0', lambda match: kept[int(match.group(1))], css)
+
+
+def hashed_name(name, content):
+    root, ext = os.path.splitext(name)
+    return f'{root}.{hashlib.md5(content).hexdigest()[:12]}{ext}'
+
+
+def _write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(content)
+
+
+def build_assets(bundles=None, root=None):
+    """Build the bundles into root and return {bundle name: (hashed name, sizes by encoding)}."""
+    bundles = settings.CATALOG_ASSET_BUNDLES if bundles is None else bundles
+    root = root or assets_root()
+
+    sources = {name: [(source, finders.find(source)) for source in files] for name, files in bundles.items()}
+    missing = [source for files in sources.values() for source, path in files if path is None]
+    if missing:
+        raise MissingSources(missing)
+
+    built = {}
+    for name, files in sources.items():
+        parts = []
+        for source, path in files:
+            with open(path, encoding='utf-8') as f:
+                parts.append(f.read())
+        text = '\n'.join(parts)
+        if name.endswith('.css'):
+            text = minify_css(text)
+        content = text.encode()
+
+        target = hashed_name(name, content)
+        path = os.path.join(root, target)
+        # mtime=0 keeps the gzip output the same for the same content
+        variants = {'identity': content, 'gzip': gzip.compress(content, 9, mtime=0)}
+        if brotli is not None:
+            variants['br'] = brotli.compress(content)
+        for encoding, data in variants.items():
+            _write(path + dict(ENCODINGS).get(encoding, ''), data)
+        built[name] = (target, {encoding: len(data) for encoding, data in variants.items()})
+
+    _write(os.path.join(root, MANIFEST_NAME), json.dumps(
+        {name: target for name, (target, sizes) in built.items()}, indent=2, sort_keys=True).encode())
+    load_manifest.cache_clear()
+    return built
+
+
+@lru_cache(maxsize=None)
+def load_manifest():
+    """Return {bundle name: hashed name} of the last build, empty when nothing was built."""
+    try:
+        with open(os.path.join(assets_root(), MANIFEST_NAME)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def bundle_url(name):
+    """URL of the built bundle, or None when it hasn't been built."""
+    target = load_manifest().get(name)
+    return settings.CATALOG_ASSETS_URL + target if target else None
+
+
+def _accepted(request):
+    """The codings of the Accept-Encoding header, without those refused with q=0."""
+    codings = set()
+    for part in request.META.get('HTTP_ACCEPT_ENCODING', '').split(','):
+        coding, _, params = part.strip().partition(';')
+        if coding and params.replace(' ', '') not in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+            codings.add(coding.lower())
+    return codings
+
+
+@require_safe
+def serve_asset(request, path):
+    """Serve a built file, pre-compressed when the client accepts it, to be cached for good."""
+    if path not in load_manifest().values():
+        raise Http404('No such asset.')
+    full_path = os.path.join(assets_root(), path)
+
+    accepted = _accepted(request)
+    encoding = None
+    for coding, suffix in ENCODINGS:
+        if coding in accepted and os.path.exists(full_path + suffix):
+            encoding, full_path = coding, full_path + suffix
+            break
+    try:
+        stat = os.stat(full_path)
+    except FileNotFoundError:
+        raise Http404('No such asset.')
+
+    # The name carries the content hash, the encoding tells the variants apart
+    etag = f'"{path}{"-" + encoding if encoding else ""}"'
+    response = get_conditional_response(request, etag=etag, last_modified=int(stat.st_mtime))
+    if response is None:
+        response = FileResponse(open(full_path, 'rb'), content_type=mimetypes.guess_type(path)[0])
+        response['Content-Length'] = stat.st_size
+        if encoding:
+            response['Content-Encoding'] = encoding
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    response['Cache-Control'] = f'public, max-age={FAR_FUTURE}, immutable'
+    response['Vary'] = 'Accept-Encoding'
+    return response
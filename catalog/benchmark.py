@@ -0,0 +1,469 @@
+"""Reproducible benchmark of the catalog views.
+
+seed_catalog() fills the database with a deterministic catalog of the
+requested size, benchmark_views() requests every URL of catalog/urls.py
+through the test client and measures latency, queries and peak memory, and
+compare_to_baseline() flags regressions against a stored JSON baseline.
+benchmark_concurrency() compares the throughput of the sync views and their
+concurrent variants under concurrent requests to the ASGI application. The
+benchmark_catalog command runs them against a throwaway test database.
+benchmark_sqlite_concurrency() measures mixed reads and renewals on an SQLite
+file under a database profile, for the benchmark_sqlite command.
+benchmark_copy_keys() compares the size and library page scans of the copy
+table with its former UUID primary key and its integer one, for the
+benchmark_copy_keys command.
+"""
+import asyncio
+import datetime
+import os
+import random
+import sqlite3
+import threading
+import statistics
+import time
+import tracemalloc
+import uuid
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.asgi import get_asgi_application
+from django.db import connection, reset_queries
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, reverse
+
+from catalog import facets, search, urls
+from catalog.database import pragma_statements
+from catalog.models import COPY_STATUS_COUNTERS, Author, Book, BookInstance, Genre, Language
+
+# Books generated per round of bulk inserts
+BATCH_SIZE = 5000
+
+# URL names not benchmarked: exports stream whole tables
+SKIPPED_URLS = {'catalog-export'}
+
+# Query strings of URLs that do nothing useful without one
+URL_PARAMS = {'book-search': {'q': 'book'}}
+
+# URL names of views and of their variants loading data concurrently
+CONCURRENT_VARIANTS = {
+    'index': 'index-concurrent',
+    'book-detail': 'book-detail-concurrent',
+    'author-detail': 'author-detail-concurrent',
+}
+
+WORDS = (
+    'river night garden stone shadow winter letter empire silver island king '
+    'daughter storm glass city secret war song forest house summer north'
+).split()
+
+
+def seed_catalog(authors=10_000, books=200_000, copies=2_000_000, users=1000, seed=0, log=None):
+    """Fill an empty database with a deterministic catalog of the given size."""
+    rng = random.Random(seed)
+    log = log or (lambda message: None)
+    today = datetime.date.today()
+
+    languages = Language.objects.bulk_create([
+        Language(pk=pk, name=name) for pk, name in enumerate(['English', 'French', 'German', 'Spanish'], 1)
+    ])
+    genres = Genre.objects.bulk_create([
+        Genre(pk=pk, name=name) for pk, name in enumerate(['Fiction', 'History', 'Science', 'Poetry', 'Fantasy'], 1)
+    ])
+    User.objects.bulk_create([User(pk=pk, username=f'reader{pk}') for pk in range(1, users + 1)])
+
+    Author.objects.bulk_create(
+        [Author(pk=pk, first_name=rng.choice(WORDS).title(), last_name=f'{rng.choice(WORDS).title()}{pk}')
+         for pk in range(1, authors + 1)]
+    )
+    log(f'{authors} authors')
+
+    # Spread the copies over the books, keeping the counters in step
+    copies_per_book = [0] * (books + 1)
+    for _ in range(copies):
+        copies_per_book[rng.randint(1, books)] += 1
+
+    through = Book.genre.through
+    copy_pk = 0
+    for start in range(1, books + 1, BATCH_SIZE):
+        batch, links, instances = [], [], []
+        for pk in range(start, min(start + BATCH_SIZE, books + 1)):
+            book = Book(
+                pk=pk,
+                title=' '.join(rng.choice(WORDS) for _ in range(3)).title(),
+                author_id=rng.randint(1, authors),
+                summary=' '.join(rng.choice(WORDS) for _ in range(30)),
+                isbn=f'{9780000000000 + pk}',
+                language_id=rng.choice(languages).pk,
+            )
+            for genre in rng.sample(genres, 2):
+                links.append(through(book_id=pk, genre_id=genre.pk))
+            for _ in range(copies_per_book[pk]):
+                copy_pk += 1
+                status = rng.choice('aaoomr')
+                on_loan = status == 'o'
+                instances.append(BookInstance(
+                    id=copy_pk,
+                    uuid=uuid.UUID(int=copy_pk),
+                    book_id=pk,
+                    imprint=f'Imprint {rng.randint(1, 50)}',
+                    status=status,
+                    due_back=today + datetime.timedelta(days=rng.randint(-30, 30)) if on_loan else None,
+                    borrower_id=rng.randint(1, users) if on_loan and users else None,
+                ))
+                book.copies_total += 1
+                setattr(book, COPY_STATUS_COUNTERS[status], getattr(book, COPY_STATUS_COUNTERS[status]) + 1)
+            batch.append(book)
+        Book.objects.bulk_create(batch)
+        through.objects.bulk_create(links)
+        BookInstance.objects.bulk_create(instances)
+        log(f'{batch[-1].pk} books, {copy_pk} copies')
+
+    if search.search_enabled():
+        search.rebuild_index()
+    facets.rebuild_facets()
+
+
+def catalog_urls():
+    """Yield (URL name, path, query params) for every catalog URL worth benchmarking."""
+    book = Book.objects.order_by('pk').only('pk').first()
+    author = Author.objects.order_by('pk').only('pk').first()
+    copy = BookInstance.objects.filter(status='o').only('uuid').first()
+    sample_args = {'int': book and book.pk, 'uuid': copy and copy.uuid}
+
+    for pattern in urls.urlpatterns:
+        if not isinstance(pattern, URLPattern) or not pattern.name or pattern.name in SKIPPED_URLS:
+            continue
+        converters = pattern.pattern.converters
+        kwargs = {}
+        for name, converter in converters.items():
+            kind = type(converter).__name__.replace('Converter', '').lower()
+            value = author.pk if author and 'author' in pattern.name else sample_args.get(kind)
+            if value is None:
+                break
+            kwargs[name] = value
+        else:
+            yield pattern.name, reverse(pattern.name, kwargs=kwargs), URL_PARAMS.get(pattern.name, {})
+
+
+def _percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def benchmark_views(client, requests=20, log=None):
+    """Request every catalog URL and return {URL name: measurements}."""
+    log = log or (lambda message: None)
+    results = {}
+    for name, path, params in catalog_urls():
+        client.get(path, params)  # warm up caches
+
+        latencies, queries = [], []
+        for _ in range(requests):
+            reset_queries()
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                response = client.get(path, params)
+                latencies.append((time.perf_counter() - started) * 1000)
+            queries.append(len(captured))
+
+        # Memory is measured on a separate request, tracing slows everything down
+        tracemalloc.start()
+        client.get(path, params)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        results[name] = {
+            'status': response.status_code,
+            'p50_ms': round(statistics.median(latencies), 3),
+            'p95_ms': round(_percentile(latencies, 0.95), 3),
+            'queries': max(queries),
+            'peak_kib': round(peak / 1024, 1),
+        }
+        log(f'{name}: {results[name]}')
+    return results
+
+
+def compare_to_baseline(results, baseline, threshold=0.2):
+    """Return descriptions of the measurements more than threshold worse than the baseline.
+
+    results are those of benchmark_views() or benchmark_concurrency().
+    """
+    regressions = []
+    for name, measured in results.items():
+        expected = baseline.get(name)
+        if not expected:
+            continue
+        if 'queries' in measured and measured['queries'] > expected['queries']:
+            regressions.append(f'{name}: {measured["queries"]} queries, baseline {expected["queries"]}')
+        for field in ('p50_ms', 'p95_ms', 'peak_kib'):
+            if field in measured and measured[field] > expected[field] * (1 + threshold):
+                regressions.append(f'{name}: {field} {measured[field]}, baseline {expected[field]}')
+        if 'requests_per_s' in measured and measured['requests_per_s'] < expected['requests_per_s'] * (1 - threshold):
+            regressions.append(f'{name}: requests_per_s {measured["requests_per_s"]}, '
+                               f'baseline {expected["requests_per_s"]}')
+    return regressions
+
+
+def compare_concurrency(throughput):
+    """Return {URL name: throughput of its concurrent variant over its own} from benchmark_concurrency()."""
+    return {
+        name: round(throughput[variant]['requests_per_s'] / throughput[name]['requests_per_s'], 2)
+        for name, variant in CONCURRENT_VARIANTS.items()
+        if name in throughput and variant in throughput and throughput[name]['requests_per_s']
+    }
+
+
+async def _asgi_get(app, path, headers):
+    """GET path from an ASGI application and return the response status."""
+    scope = {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': 'GET',
+        'scheme': 'http',
+        'path': path,
+        'query_string': b'',
+        'headers': headers,
+        'client': ('127.0.0.1', 0),
+        'server': ('testserver', 80),
+    }
+    messages = [{'type': 'http.request', 'body': b'', 'more_body': False}]
+    status = None
+
+    async def receive():
+        return messages.pop(0) if messages else {'type': 'http.disconnect'}
+
+    async def send(message):
+        nonlocal status
+        if message['type'] == 'http.response.start':
+            status = message['status']
+
+    await app(scope, receive, send)
+    return status
+
+
+async def _load(app, path, headers, concurrency, requests):
+    """Send requests GETs of path, concurrency at a time; return (statuses, elapsed seconds)."""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def request():
+        async with semaphore:
+            return await _asgi_get(app, path, headers)
+
+    started = time.perf_counter()
+    statuses = await asyncio.gather(*[request() for _ in range(requests)])
+    return statuses, time.perf_counter() - started
+
+
+def benchmark_concurrency(session_key=None, concurrency=8, requests=100, log=None):
+    """Return {URL name: throughput} of the views of CONCURRENT_VARIANTS and their variants.
+
+    A session_key makes the requests as a signed-in user, which bypasses
+    the page cache served to anonymous users.
+    """
+    log = log or (lambda message: None)
+    app = get_asgi_application()
+    headers = [(b'host', b'testserver')]
+    if session_key:
+        headers.append((b'cookie', f'{settings.SESSION_COOKIE_NAME}={session_key}'.encode()))
+    paths = {name: path for name, path, params in catalog_urls()}
+
+    results = {}
+    for name, variant in CONCURRENT_VARIANTS.items():
+        for url_name in (name, variant):
+            if url_name not in paths:
+                continue
+            asyncio.run(_load(app, paths[url_name], headers, 1, 1))  # warm up caches
+            statuses, elapsed = asyncio.run(_load(app, paths[url_name], headers, concurrency, requests))
+            results[url_name] = {
+                'status': max(statuses),
+                'requests_per_s': round(requests / elapsed, 1),
+                'concurrency': concurrency,
+            }
+            log(f'{url_name}: {results[url_name]}')
+    return results
+
+
+def _renew(db, pk, reserve_write):
+    """A renewal as the loan service runs it: read the copy, then move its due date."""
+    db.execute('BEGIN')
+    if reserve_write:
+        db.execute('UPDATE copy SET id = id WHERE 0')
+    (due_back,) = db.execute('SELECT due_back FROM copy WHERE id = ?', (pk,)).fetchone()
+    db.execute('UPDATE copy SET due_back = ? WHERE id = ?', (due_back + 7, pk))
+    db.execute('COMMIT')
+
+
+def benchmark_sqlite_concurrency(path, pragmas, reserve_write, threads=8, seconds=2.0,
+                                 write_share=0.25, rows=1000, seed=0):
+    """Run renewals and overdue counts from threads on a fresh SQLite file.
+
+    Returns the reads and writes per second and the number of "database is
+    locked" errors. pragmas and reserve_write describe the database profile:
+    the pragmas applied to each connection and whether transactions take the
+    write lock before reading.
+    """
+    for suffix in ('', '-wal', '-shm', '-journal'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    with sqlite3.connect(path) as db:
+        db.execute('CREATE TABLE copy (id INTEGER PRIMARY KEY, due_back INTEGER NOT NULL)')
+        db.executemany('INSERT INTO copy VALUES (?, ?)', [(pk, pk % 60) for pk in range(1, rows + 1)])
+
+    counts = {'reads': 0, 'writes': 0, 'errors': 0}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+
+    def work(worker):
+        rng = random.Random(seed + worker)
+        done = dict.fromkeys(counts, 0)
+        # Same connection settings as Django's SQLite backend
+        db = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        for statement in pragma_statements(pragmas):
+            db.execute(statement)
+        while time.perf_counter() < deadline:
+            try:
+                if rng.random() < write_share:
+                    _renew(db, rng.randint(1, rows), reserve_write)
+                    done['writes'] += 1
+                else:
+                    db.execute('SELECT COUNT(*) FROM copy WHERE due_back < ?', (rng.randint(0, 60),)).fetchone()
+                    done['reads'] += 1
+            except sqlite3.OperationalError as error:
+                if 'locked' not in str(error):
+                    raise
+                done['errors'] += 1
+                if db.in_transaction:
+                    db.execute('ROLLBACK')
+        db.close()
+        with lock:
+            for key, value in done.items():
+                counts[key] += value
+
+    workers = [threading.Thread(target=work, args=(worker,)) for worker in range(threads)]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - started
+
+    return {
+        'reads_per_s': round(counts['reads'] / elapsed, 1),
+        'writes_per_s': round(counts['writes'] / elapsed, 1),
+        'lock_errors': counts['errors'],
+    }
+
+
+# Schemas of the copies of BookInstance before (UUID primary key, stored as 32 hex characters
+# by Django's SQLite backend) and after (integer primary key and a unique UUID) migration 0013
+COPY_KEY_LAYOUTS = {
+    'uuid': (
+        'CREATE TABLE copy (id char(32) NOT NULL PRIMARY KEY, book_id integer, borrower_id integer, '
+        'imprint varchar(200) NOT NULL, due_back date, status varchar(1) NOT NULL)',
+        'CREATE TABLE overdue (copy_id char(32) NOT NULL PRIMARY KEY, days integer NOT NULL)',
+    ),
+    'integer': (
+        'CREATE TABLE copy (id integer NOT NULL PRIMARY KEY AUTOINCREMENT, uuid char(32) NOT NULL UNIQUE, '
+        'book_id integer, borrower_id integer, imprint varchar(200) NOT NULL, due_back date, '
+        'status varchar(1) NOT NULL)',
+        'CREATE TABLE overdue (copy_id integer NOT NULL PRIMARY KEY, days integer NOT NULL)',
+    ),
+}
+COPY_KEY_INDEXES = (
+    "CREATE INDEX on_loan ON copy (due_back, id) WHERE status = 'o'",
+    "CREATE INDEX borrowed ON copy (borrower_id, due_back, id) WHERE status = 'o'",
+    'CREATE INDEX book_status ON copy (book_id, status)',
+    'CREATE INDEX copy_book ON copy (book_id)',
+    'CREATE INDEX copy_borrower ON copy (borrower_id)',
+)
+# The query of a LibraryBooksListView page after the first one
+LIBRARY_PAGE_SQL = (
+    'SELECT copy.*, book.*, user.*, overdue.* FROM copy '
+    'LEFT OUTER JOIN book ON copy.book_id = book.id '
+    'LEFT OUTER JOIN user ON copy.borrower_id = user.id '
+    'LEFT OUTER JOIN overdue ON copy.id = overdue.copy_id '
+    "WHERE copy.status = 'o' AND copy.due_back >= ? AND (copy.due_back > ? OR (copy.due_back = ? AND copy.id > ?)) "
+    'ORDER BY copy.due_back, copy.id LIMIT ?'
+)
+
+
+def _seed_copy_layout(db, layout, rows, seed):
+    copy_table, overdue_table = COPY_KEY_LAYOUTS[layout]
+    for statement in (copy_table, overdue_table) + COPY_KEY_INDEXES:
+        db.execute(statement)
+    db.execute('CREATE TABLE book (id integer NOT NULL PRIMARY KEY, title varchar(200) NOT NULL)')
+    db.execute('CREATE TABLE user (id integer NOT NULL PRIMARY KEY, username varchar(150) NOT NULL)')
+    db.executemany('INSERT INTO book VALUES (?, ?)', [(pk, f'Book {pk}') for pk in range(1, rows // 10 + 2)])
+    db.executemany('INSERT INTO user VALUES (?, ?)', [(pk, f'reader{pk}') for pk in range(1, 1001)])
+
+    rng = random.Random(seed)
+    today = datetime.date.today()
+    copies, overdue = [], []
+    for number in range(1, rows + 1):
+        copy_uuid = uuid.UUID(int=rng.getrandbits(128), version=4).hex
+        on_loan = rng.random() < 0.3
+        due_back = today + datetime.timedelta(days=rng.randint(-30, 30)) if on_loan else None
+        values = (rng.randint(1, rows // 10 + 1), rng.randint(1, 1000) if on_loan else None,
+                  f'Imprint {number}', due_back and due_back.isoformat(), 'o' if on_loan else 'a')
+        key = copy_uuid if layout == 'uuid' else number
+        copies.append((key, copy_uuid) + values if layout == 'integer' else (key,) + values)
+        if on_loan and due_back < today:
+            overdue.append((key, (today - due_back).days))
+    placeholders = ', '.join('?' * len(copies[0]))
+    db.executemany(f'INSERT INTO copy VALUES ({placeholders})', copies)
+    db.executemany('INSERT INTO overdue VALUES (?, ?)', overdue)
+    db.commit()
+    db.execute('ANALYZE')
+
+
+def benchmark_copy_keys(directory, rows=200_000, page_size=10, seconds=2.0, seed=0):
+    """Compare the storage and LibraryBooksListView scans of the UUID and integer copy keys.
+
+    Builds the copy table of each layout with the same rows in a fresh
+    SQLite file of directory and returns, by layout, the bytes of the copy
+    table and of the indexes on copies (from the dbstat table, None when
+    SQLite lacks it), the file size, and how many library pages per second
+    a walk through every copy on loan reads.
+    """
+    results = {}
+    for layout in COPY_KEY_LAYOUTS:
+        path = os.path.join(directory, f'copies-{layout}.sqlite3')
+        if os.path.exists(path):
+            os.remove(path)
+        db = sqlite3.connect(path)
+        _seed_copy_layout(db, layout, rows, seed)
+
+        try:
+            sizes = dict(db.execute('SELECT name, SUM(pgsize) FROM dbstat GROUP BY name').fetchall())
+            indexes = [name for name, in db.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name IN ('copy', 'overdue')")]
+            table_bytes = sizes['copy'] + sizes['overdue']
+            index_bytes = sum(sizes.get(name, 0) for name in indexes)
+        except sqlite3.OperationalError:
+            table_bytes = index_bytes = None
+
+        # Position of due_back in the copy rows, and a key sorting before every other
+        due_back_column, first_key = (5, 0) if layout == 'integer' else (4, '')
+        pages = 0
+        deadline = time.perf_counter() + seconds
+        started = time.perf_counter()
+        while time.perf_counter() < deadline:
+            # Walk the pages as the view's next links do, over again until the time is up
+            due_back, pk = '0000-00-00', first_key
+            while time.perf_counter() < deadline:
+                page = db.execute(LIBRARY_PAGE_SQL, (due_back, due_back, due_back, pk, page_size)).fetchall()
+                pages += 1
+                if len(page) < page_size:
+                    break
+                pk, due_back = page[-1][0], page[-1][due_back_column]
+        elapsed = time.perf_counter() - started
+        db.close()
+
+        results[layout] = {
+            'table_bytes': table_bytes,
+            'index_bytes': index_bytes,
+            'file_bytes': os.path.getsize(path),
+            'pages_per_s': round(pages / elapsed, 1),
+        }
+    return results
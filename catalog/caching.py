@@ -0,0 +1,138 @@
+"""Response and fragment caching of the catalog pages.
+
+cache_anonymous_page caches the whole responses of GET requests by anonymous
+users, under a key made of the request path and a page generation that the
+signal handlers in catalog/signals.py bump whenever a book, author or copy
+changes. Templates cache fragments with the {% cache %} tag, keyed by the
+`modified` stamps of the objects they show. BoundedLocMemCache adds a memory
+cap to the local-memory backend, evicting the least recently used entries.
+"""
+import hashlib
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.core.cache.backends.locmem import LocMemCache
+
+PAGE_CACHE_KEY = 'catalog:page:{}:{}'
+PAGE_GENERATION_CACHE_KEY = 'catalog:page-generation'
+PAGE_CACHE_TIMEOUT = getattr(settings, 'CATALOG_PAGE_CACHE_TIMEOUT', 10 * 60)
+
+
+def _page_generation():
+    return cache.get_or_set(PAGE_GENERATION_CACHE_KEY, 1, None)
+
+
+def increment(key):
+    """Add 1 to a counter kept in the cache without expiry, creating it if needed; return its value."""
+    if cache.add(key, 1, None):
+        return 1
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # The key was evicted between add() and incr()
+        cache.set(key, 1, None)
+        return 1
+
+
+def invalidate_pages():
+    """Forget every cached page."""
+    increment(PAGE_GENERATION_CACHE_KEY)
+
+
+def cache_anonymous_page(view):
+    """Serve the responses of a view to anonymous users from the cache."""
+    @wraps(view)
+    def wrapped(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD') or request.user.is_authenticated:
+            return view(request, *args, **kwargs)
+
+        path = hashlib.md5(request.get_full_path().encode()).hexdigest()
+        key = PAGE_CACHE_KEY.format(_page_generation(), path)
+        response = cache.get(key)
+        if response is not None:
+            return response
+
+        response = view(request, *args, **kwargs)
+        if response.status_code == 200 and not response.streaming and not response.cookies:
+            def store(response):
+                # Pages carrying a CSRF token are specific to the visitor
+                if not request.META.get('CSRF_COOKIE_USED'):
+                    cache.set(key, response, PAGE_CACHE_TIMEOUT)
+
+            if hasattr(response, 'add_post_render_callback'):
+                response.add_post_render_callback(store)
+            else:
+                store(response)
+        return response
+    return wrapped
+
+
+class _Usage:
+    """Sizes of the pickled values of one named cache, and their total."""
+
+    def __init__(self):
+        self.sizes = {}
+        self.total = 0
+
+    def add(self, key, size):
+        self.total += size - self.sizes.get(key, 0)
+        self.sizes[key] = size
+
+    def remove(self, key):
+        self.total -= self.sizes.pop(key, 0)
+
+
+_usages = {}
+
+
+class BoundedLocMemCache(LocMemCache):
+    """Local-memory cache holding at most OPTIONS['MAX_BYTES'] of pickled values.
+
+    LocMemCache keeps its entries in least recently used order; entries are
+    evicted from that end until the values fit in the cap, on top of the
+    MAX_ENTRIES limit of the base class.
+    """
+
+    def __init__(self, name, params):
+        super().__init__(name, params)
+        self._max_bytes = int(params.get('OPTIONS', {}).get('MAX_BYTES', 0)) or None
+        self._usage = _usages.setdefault(name, _Usage())
+
+    @property
+    def used_bytes(self):
+        return self._usage.total
+
+    def _set(self, key, value, timeout=DEFAULT_TIMEOUT):
+        super()._set(key, value, timeout)
+        self._usage.add(key, len(value))
+        if self._max_bytes is not None:
+            while self._usage.total > self._max_bytes and self._cache:
+                evicted, _ = self._cache.popitem()
+                del self._expire_info[evicted]
+                self._usage.remove(evicted)
+
+    def incr(self, key, delta=1, version=None):
+        value = super().incr(key, delta, version)
+        key = self.make_key(key, version=version)
+        with self._lock:
+            if key in self._cache:
+                self._usage.add(key, len(self._cache[key]))
+        return value
+
+    def _cull(self):
+        super()._cull()
+        for key in self._usage.sizes.keys() - self._cache.keys():
+            self._usage.remove(key)
+
+    def _delete(self, key):
+        super()._delete(key)
+        self._usage.remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+            self._expire_info.clear()
+            self._usage.sizes.clear()
+            self._usage.total = 0
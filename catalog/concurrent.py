@@ -0,0 +1,67 @@
+"""Concurrent loading of the independent pieces of a page.
+
+Django 3.0 runs every view synchronously, under ASGI too (async views arrive
+in Django 3.1), so a view holds its worker thread for each of its queries in
+turn. fetch_concurrently() runs the independent loaders of a view as
+coroutines gathered with asyncio.gather(), each in an executor thread with a
+database connection of its own, so the page waits for its slowest query
+rather than for the sum of them. gather_loaders() is the coroutine itself,
+ready to back native async views on a Django version that has them.
+The execute wrappers of the calling thread's connections, such as the one
+of ViewCostMiddleware, are installed on the executor threads' connections
+too, so that their queries are counted with the request's.
+"""
+import asyncio
+from contextlib import ExitStack
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.db import close_old_connections, connection, connections
+
+
+def _execute_wrappers():
+    """The execute wrappers installed on each connection of the current thread, by alias."""
+    return {alias: list(connections[alias].execute_wrappers) for alias in connections}
+
+
+def _closing_connections(loader, wrappers):
+    def run():
+        try:
+            with ExitStack() as stack:
+                for alias, alias_wrappers in wrappers.items():
+                    for wrapper in alias_wrappers:
+                        stack.enter_context(connections[alias].execute_wrapper(wrapper))
+                return loader()
+        finally:
+            # Executor threads see no request_finished, release their connections here
+            close_old_connections()
+    return run
+
+
+async def gather_loaders(loaders, wrappers=None):
+    """Run the callables of a {name: loader} dict concurrently and return {name: result}."""
+    results = await asyncio.gather(*[
+        sync_to_async(_closing_connections(loader, wrappers or {}), thread_sensitive=False)()
+        for loader in loaders.values()
+    ])
+    return dict(zip(loaders, results))
+
+
+def fetch_concurrently(**loaders):
+    """Return {name: loader()} for the keyword loaders, run concurrently when possible."""
+    if connection.in_atomic_block:
+        # Other connections can't see the writes of this transaction, stay on it
+        return {name: loader() for name, loader in loaders.items()}
+    return async_to_sync(gather_loaders)(loaders, _execute_wrappers())
+
+
+def set_prefetched(instance, name, objects):
+    """Make instance.<name>.all() return objects without a query, as prefetch_related() does."""
+    manager = getattr(instance, name)
+    queryset = manager.get_queryset()
+    queryset._result_cache = list(objects)
+    queryset._prefetch_done = True
+    # Many-to-many managers name their cache, reverse foreign key managers use the field's
+    cache_name = getattr(manager, 'prefetch_cache_name', None) or manager.field.remote_field.get_cache_name()
+    if not hasattr(instance, '_prefetched_objects_cache'):
+        instance._prefetched_objects_cache = {}
+    instance._prefetched_objects_cache[cache_name] = queryset
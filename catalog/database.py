@@ -0,0 +1,101 @@
+"""SQLite tuning and health checks of persistent connections.
+
+apply_sqlite_pragmas() runs on connection_created and applies the
+CATALOG_SQLITE_PRAGMAS setting to every new connection to an SQLite file:
+WAL journaling lets readers run alongside a writer, busy_timeout makes a
+writer wait for the lock instead of failing, and synchronous, mmap_size and
+cache_size trade durability on power loss and memory for speed.
+check_connections() runs on request_started and closes persistent
+connections (CONN_MAX_AGE) that stopped answering, as the CONN_HEALTH_CHECKS
+setting of Django 4.1 does. estimated_row_count() reads the row count of a
+table from the planner statistics, for tables too large to COUNT(*) often.
+batches() splits the ids of IN lookups into statements SQLite accepts.
+"""
+from django.conf import settings
+from django.core.signals import request_started
+from django.db import DatabaseError, connections, router
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+# Ids per statement, keeping IN lists below SQLite's variable limit
+BATCH_SIZE = 500
+
+
+def batches(ids, size=BATCH_SIZE):
+    """Yield the ids in lists of at most size."""
+    ids = list(ids)
+    for start in range(0, len(ids), size):
+        yield ids[start:start + size]
+
+
+def pragma_statements(pragmas):
+    return [f'PRAGMA {name} = {value}' for name, value in pragmas.items()]
+
+
+@receiver(connection_created)
+def apply_sqlite_pragmas(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite' or connection.creation.is_in_memory_db(connection.settings_dict['NAME']):
+        return
+    # On the raw connection, these are not queries of the request being served
+    for statement in pragma_statements(getattr(settings, 'CATALOG_SQLITE_PRAGMAS', {})):
+        connection.connection.execute(statement)
+
+
+@receiver(request_started)
+def check_connections(**kwargs):
+    if not getattr(settings, 'CATALOG_DB_HEALTH_CHECKS', False):
+        return
+    for connection in connections.all():
+        if connection.connection is not None and not connection.in_atomic_block and not connection.is_usable():
+            connection.close()
+
+
+def reserve_write_lock(model, using=None):
+    """Take SQLite's write lock at the start of a transaction that reads before it writes.
+
+    SQLite starts transactions deferred: of two that read and then write,
+    one fails at once with "database is locked", whatever busy_timeout says.
+    Writing first makes the second one wait for the lock instead. Other
+    databases lock the rows read with select_for_update().
+    """
+    connection = connections[using or router.db_for_write(model)]
+    if connection.vendor != 'sqlite' or not connection.in_atomic_block:
+        return
+    table = connection.ops.quote_name(model._meta.db_table)
+    column = connection.ops.quote_name(model._meta.pk.column)
+    with connection.cursor() as cursor:
+        cursor.execute(f'UPDATE {table} SET {column} = {column} WHERE 0')
+
+
+def estimated_row_count(model, using=None):
+    """Return the number of rows of model's table as the statistics estimate it, or None.
+
+    SQLite keeps it in sqlite_stat1 from the last ANALYZE, PostgreSQL in
+    pg_class from the last VACUUM or ANALYZE, MySQL in its table status.
+    """
+    connection = connections[using or router.db_for_read(model) or 'default']
+    queries = {
+        # A row per index, starting with the number of rows it has: partial
+        # indexes have fewer, the largest is the table's
+        'sqlite': ('SELECT MAX(CAST(stat AS INTEGER)) FROM sqlite_stat1 WHERE tbl = %s', int),
+        'postgresql': ('SELECT reltuples FROM pg_class WHERE relname = %s', int),
+        'mysql': (
+            'SELECT table_rows FROM information_schema.tables WHERE table_schema = DATABASE() AND table_name = %s',
+            int,
+        ),
+    }
+    if connection.vendor not in queries:
+        return None
+    sql, parse = queries[connection.vendor]
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [model._meta.db_table])
+            row = cursor.fetchone()
+    except DatabaseError:
+        # No statistics yet, sqlite_stat1 only exists after the first ANALYZE
+        return None
+    if row is None or row[0] is None:
+        return None
+    count = parse(row[0])
+    # PostgreSQL reports -1 for tables never analyzed
+    return count if count >= 0 else None
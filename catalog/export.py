@@ -0,0 +1,88 @@
+"""Streaming exports of the catalog and the loan ledger.
+
+Rows are read with values_list() over QuerySet.iterator(), so an export of
+any size runs in constant memory and starts producing output right away.
+"""
+import csv
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from catalog.models import Author, Book, BookInstance
+
+# Rows read from the database per round trip
+CHUNK_SIZE = 2000
+
+# Export name: (model, [(column name, field lookup), ...])
+EXPORTS = {
+    'books': (Book, [
+        ('id', 'id'),
+        ('title', 'title'),
+        ('author_first_name', 'author__first_name'),
+        ('author_last_name', 'author__last_name'),
+        ('isbn', 'isbn'),
+        ('language', 'language__name'),
+        ('summary', 'summary'),
+    ]),
+    'authors': (Author, [
+        ('id', 'id'),
+        ('first_name', 'first_name'),
+        ('last_name', 'last_name'),
+        ('date_of_birth', 'date_of_birth'),
+        ('date_of_death', 'date_of_death'),
+    ]),
+    'copies': (BookInstance, [
+        ('id', 'uuid'),
+        ('book_id', 'book_id'),
+        ('book_title', 'book__title'),
+        ('imprint', 'imprint'),
+        ('status', 'status'),
+        ('due_back', 'due_back'),
+        ('borrower', 'borrower__username'),
+    ]),
+}
+
+FORMATS = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson',
+}
+
+
+def export_columns(name):
+    return [column for column, lookup in EXPORTS[name][1]]
+
+
+def export_rows(name):
+    """Yield the rows of an export as tuples, in primary key order."""
+    model, columns = EXPORTS[name]
+    lookups = [lookup for column, lookup in columns]
+    # values_list() joins the related tables itself, no instances are built
+    queryset = model.objects.order_by('pk').values_list(*lookups)
+    return queryset.iterator(chunk_size=CHUNK_SIZE)
+
+
+class _Echo:
+    """File-like object handing back what is written, for csv.writer."""
+
+    def write(self, value):
+        return value
+
+
+def _csv_lines(columns, rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(columns)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def _jsonl_lines(columns, rows):
+    encoder = DjangoJSONEncoder(ensure_ascii=False)
+    for row in rows:
+        yield encoder.encode(dict(zip(columns, row))) + '\n'
+
+
+def export_lines(name, fmt):
+    """Yield an export serialized as lines of text in the given format."""
+    columns, rows = export_columns(name), export_rows(name)
+    if fmt == 'csv':
+        return _csv_lines(columns, rows)
+    return _jsonl_lines(columns, rows)
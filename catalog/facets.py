@@ -0,0 +1,163 @@
+"""Facets of the book list: genre, language, author initial and availability.
+
+catalog_bookfacetvalue holds the facet values of each book and
+catalog_bookfacet the number of books per value, so that the sidebar of
+BookListView reads a few dozen rows instead of grouping the whole catalog.
+refresh_books() recomputes the values of some books from their rows and
+moves the counts by the difference; the signal handlers in catalog/signals.py
+and the bulk writers of loans, imports and copy counters call it for the
+books they change. The rebuild_facets command recomputes everything.
+
+The counts are over the whole catalog, they are not narrowed by the other
+selected facets: that would take the GROUP BY the table is there to avoid.
+"""
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import F
+from django.utils.http import urlencode
+
+from catalog.database import batches, reserve_write_lock
+from catalog.models import FACETS, Book, BookFacet, BookFacetValue, Genre, Language
+
+AVAILABILITY_LABELS = {'yes': 'Available now', 'no': 'All copies out'}
+
+# Author initials grouped under OTHER_INITIAL
+OTHER_INITIAL = '#'
+
+
+def author_initial(last_name):
+    initial = (last_name or '').strip()[:1].upper()
+    return initial if initial.isalpha() else OTHER_INITIAL
+
+
+def _current_values(book_ids):
+    """The (book id, facet, value) triples the books have in their rows."""
+    values = set()
+    books = Book.objects.select_for_update().filter(pk__in=book_ids) \
+        .values_list('pk', 'language_id', 'author_id', 'author__last_name', 'copies_available')
+    for book_id, language_id, author_id, last_name, available in books:
+        if language_id is not None:
+            values.add((book_id, 'language', str(language_id)))
+        if author_id is not None:
+            values.add((book_id, 'initial', author_initial(last_name)))
+        values.add((book_id, 'available', 'yes' if available else 'no'))
+    genres = Book.genre.through.objects.filter(book_id__in=book_ids).values_list('book_id', 'genre_id')
+    values.update((book_id, 'genre', str(genre_id)) for book_id, genre_id in genres)
+    return values
+
+
+def _labels(facet, values):
+    if facet == 'genre':
+        return {str(pk): name for pk, name in Genre.objects.filter(pk__in=values).values_list('pk', 'name')}
+    if facet == 'language':
+        return {str(pk): name for pk, name in Language.objects.filter(pk__in=values).values_list('pk', 'name')}
+    if facet == 'available':
+        return AVAILABILITY_LABELS
+    return {value: value for value in values}
+
+
+def _adjust_counts(deltas):
+    """Add deltas, a Counter of (facet, value) pairs, to the book counts."""
+    added = {}
+    for (facet, value), delta in deltas.items():
+        if delta > 0:
+            added.setdefault(facet, []).append(value)
+    new_rows = []
+    for facet, values in added.items():
+        labels = _labels(facet, values)
+        new_rows.extend(BookFacet(facet=facet, value=value, label=labels.get(value, value)) for value in values)
+    # Values seen for the first time start at zero books
+    BookFacet.objects.bulk_create(new_rows, ignore_conflicts=True)
+
+    for (facet, value), delta in deltas.items():
+        if delta:
+            BookFacet.objects.filter(facet=facet, value=value).update(books=F('books') + delta)
+    if any(delta < 0 for delta in deltas.values()):
+        # Values of deleted genres and languages, or that no book has any more
+        BookFacet.objects.filter(books=0).delete()
+
+
+def _change_values(book_ids, new_values):
+    """Replace the stored values of the books with new_values and adjust the counts."""
+    old_values = set(BookFacetValue.objects.filter(book_id__in=book_ids).values_list('book_id', 'facet', 'value'))
+    removed, added = old_values - new_values, new_values - old_values
+
+    removed_books = {}
+    for book_id, facet, value in removed:
+        removed_books.setdefault((facet, value), []).append(book_id)
+    for (facet, value), ids in removed_books.items():
+        BookFacetValue.objects.filter(facet=facet, value=value, book_id__in=ids).delete()
+    BookFacetValue.objects.bulk_create([
+        BookFacetValue(book_id=book_id, facet=facet, value=value) for book_id, facet, value in added
+    ])
+
+    deltas = Counter((facet, value) for _, facet, value in added)
+    deltas.subtract((facet, value) for _, facet, value in removed)
+    _adjust_counts(deltas)
+
+
+def refresh_books(book_ids):
+    """Bring the facet values of the given books, and the counts, in line with their rows."""
+    with transaction.atomic():
+        reserve_write_lock(BookFacetValue)
+        for batch in batches(book_ids):
+            _change_values(batch, _current_values(batch))
+
+
+def remove_books(book_ids):
+    """Take the books, which are about to be deleted, out of the counts."""
+    with transaction.atomic():
+        reserve_write_lock(BookFacetValue)
+        for batch in batches(book_ids):
+            _change_values(batch, set())
+
+
+def rename_value(facet, value, label):
+    BookFacet.objects.filter(facet=facet, value=str(value)).update(label=label)
+
+
+def rebuild_facets():
+    """Recompute the values of every book and the counts from scratch; return the number of books."""
+    with transaction.atomic():
+        reserve_write_lock(BookFacetValue)
+        BookFacetValue.objects.all().delete()
+        BookFacet.objects.all().delete()
+        book_ids = list(Book.objects.order_by('pk').values_list('pk', flat=True))
+        deltas = Counter()
+        for batch in batches(book_ids):
+            values = _current_values(batch)
+            BookFacetValue.objects.bulk_create([
+                BookFacetValue(book_id=book_id, facet=facet, value=value) for book_id, facet, value in values
+            ])
+            deltas.update((facet, value) for _, facet, value in values)
+        _adjust_counts(deltas)
+    return len(book_ids)
+
+
+def selected_facets(params):
+    """The facet values selected in params (request.GET), one per facet."""
+    return {facet: params[facet] for facet, _ in FACETS if params.get(facet)}
+
+
+def filter_books(queryset, selected):
+    """Narrow a Book queryset to the books having every selected facet value."""
+    for facet, value in selected.items():
+        queryset = queryset.filter(
+            pk__in=BookFacetValue.objects.filter(facet=facet, value=value).values('book_id'))
+    return queryset
+
+
+def facet_sidebar(selected):
+    """The values of each facet with their counts and the query string toggling them."""
+    sidebar = {facet: {'facet': facet, 'name': name, 'values': []} for facet, name in FACETS}
+    for row in BookFacet.objects.all():
+        chosen = selected.get(row.facet) == row.value
+        # Choosing a value replaces the one selected for its facet, choosing it again drops it
+        query = {facet: value for facet, value in selected.items() if facet != row.facet}
+        if not chosen:
+            query[row.facet] = row.value
+        sidebar[row.facet]['values'].append({
+            'label': row.label, 'books': row.books, 'selected': chosen, 'query': urlencode(sorted(query.items())),
+        })
+    return [facet for facet in sidebar.values() if facet['values']]
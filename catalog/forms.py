@@ -1,22 +1,29 @@
 from django import forms
 from django.forms import ModelForm
 from django.core.exceptions import ValidationError
+from django.contrib.auth.models import User
 from django.utils.translation import ugettext_lazy as _
 import datetime
+import uuid
 
 from catalog.models import BookInstance
 
+
+def validate_renewal_date(data):
+    """Check a due date is between today and 4 weeks ahead."""
+    # Check if a date is not in the past.
+    if data < datetime.date.today():
+        raise ValidationError(_('Invalid date - renewal in past'))
+
+    # Check if a date is in the allowed range (+4 weeks from today).
+    if data > datetime.date.today() + datetime.timedelta(weeks=4):
+        raise ValidationError(_('Invalid date - renewal more than 4 weeks ahead'))
+
+
 class RenewBookForm(ModelForm):
     def clean_due_back(self):
        data = self.cleaned_data['due_back']
-       
-       # Check if a date is not in the past.
-       if data < datetime.date.today():
-           raise ValidationError(_('Invalid date - renewal in past'))
-
-       # Check if a date is in the allowed range (+4 weeks from today).
-       if data > datetime.date.today() + datetime.timedelta(weeks=4):
-           raise ValidationError(_('Invalid date - renewal more than 4 weeks ahead'))
+       validate_renewal_date(data)
 
        # Remember to always return the cleaned data.
        return data
@@ -26,3 +33,77 @@ class RenewBookForm(ModelForm):
         fields = ['due_back']
         labels = {'due_back': _('Renewal date')}
         help_texts = {'due_back': _('Enter a date between now and 4 weeks (default 3).')} 
+
+
+class BatchLoanForm(forms.Form):
+    """Form for checking out, returning or renewing many copies at once.
+
+    The copies are given by id, or for returns and renewals by borrower
+    (all of the borrower's copies on loan). The due date rules of
+    RenewBookForm are checked once for the whole batch.
+    """
+    CHECK_OUT, RETURN, RENEW = 'checkout', 'return', 'renew'
+    ACTIONS = (
+        (CHECK_OUT, _('Check out')),
+        (RETURN, _('Return')),
+        (RENEW, _('Renew')),
+    )
+
+    action = forms.ChoiceField(choices=ACTIONS)
+    copies = forms.CharField(
+        required=False,
+        widget=forms.Textarea(attrs={'rows': 3}),
+        help_text=_('Copy ids, separated by spaces, commas or new lines.'),
+    )
+    borrower = forms.CharField(required=False, help_text=_('Username of the borrower.'))
+    due_back = forms.DateField(required=False, label=_('Due date'))
+
+    def __init__(self, data=None, *args, **kwargs):
+        # Ids may also come as repeated "copies" values (the library list checkboxes)
+        if data is not None and hasattr(data, 'getlist') and len(data.getlist('copies')) > 1:
+            data = data.copy()
+            data['copies'] = ' '.join(data.getlist('copies'))
+        super().__init__(data, *args, **kwargs)
+
+    def clean_copies(self):
+        ids = []
+        for value in self.cleaned_data['copies'].replace(',', ' ').split():
+            try:
+                ids.append(uuid.UUID(value))
+            except ValueError:
+                raise ValidationError(_('Invalid copy id: %(id)s'), params={'id': value})
+        return ids
+
+    def clean_borrower(self):
+        username = self.cleaned_data['borrower']
+        if not username:
+            return None
+        try:
+            return User.objects.get(username=username)
+        except User.DoesNotExist:
+            raise ValidationError(_('Unknown borrower: %(username)s'), params={'username': username})
+
+    def clean(self):
+        cleaned_data = super().clean()
+        action = cleaned_data.get('action')
+        copies = cleaned_data.get('copies')
+        borrower = cleaned_data.get('borrower')
+        due_back = cleaned_data.get('due_back')
+
+        if action == self.CHECK_OUT:
+            if not borrower:
+                self.add_error('borrower', _('A borrower is required to check out copies.'))
+            if not copies:
+                self.add_error('copies', _('Select the copies to check out.'))
+        elif action in (self.RETURN, self.RENEW) and not copies and not borrower:
+            self.add_error('copies', _('Select copies or a borrower.'))
+
+        if action in (self.CHECK_OUT, self.RENEW):
+            if due_back is None:
+                self.add_error('due_back', _('A due date is required.'))
+            else:
+                try:
+                    validate_renewal_date(due_back)
+                except ValidationError as error:
+                    self.add_error('due_back', error)
+        return cleaned_data
@@ -0,0 +1,222 @@
+"""Bulk import of catalog data from CSV or JSON lines files.
+
+Related authors, genres, languages, books and borrowers are resolved through
+in-memory lookup maps loaded once per import, and rows are written with
+bulk_create() one batch per transaction. bulk_create() skips the model
+signals, so each batch also updates the copy counters, the search index,
+the book facets, the loan history and the cached statistics, pages and API
+stamps itself.
+"""
+import csv
+import json
+import uuid
+
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils.dateparse import parse_date
+
+from catalog import api, facets, loans, search
+from catalog.caching import invalidate_pages
+from catalog.models import Author, Book, BookInstance, Genre, Language, LoanEvent
+from catalog.routers import pin_to_primary
+from catalog.stats import invalidate_home_stats
+
+KINDS = ('authors', 'books', 'copies')
+
+LOAN_STATUSES = {status for status, label in BookInstance.LOAN_STATUS}
+
+
+def read_rows(path):
+    """Yield the rows of a .csv or .jsonl file as dicts."""
+    with open(path, newline='', encoding='utf-8') as source:
+        if path.endswith('.jsonl'):
+            for line in source:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            yield from csv.DictReader(source)
+
+
+def _text(row, key):
+    value = row.get(key)
+    return '' if value is None else str(value).strip()
+
+
+def _date(row, key):
+    value = _text(row, key)
+    return parse_date(value) if value else None
+
+
+def _uuid(row, key):
+    """The UUID of the row, None without one; a malformed one raises ValueError."""
+    value = _text(row, key)
+    return uuid.UUID(value) if value else None
+
+
+def _names(value):
+    """Genre names from a JSON list or a ';' separated CSV cell."""
+    if isinstance(value, list):
+        names = value
+    else:
+        names = (value or '').split(';')
+    return [name.strip() for name in names if name and name.strip()]
+
+
+def _assign_pks(model, objs):
+    """Give new objects explicit primary keys when bulk_create can't return them."""
+    if connection.features.can_return_rows_from_bulk_insert:
+        return
+    next_pk = (model.objects.aggregate(max_pk=Max('pk'))['max_pk'] or 0) + 1
+    for offset, obj in enumerate(objs):
+        obj.pk = next_pk + offset
+
+
+class CatalogImporter:
+    """Import batches of rows of one kind, keeping lookup maps across batches."""
+
+    def __init__(self):
+        self._authors = None
+        self._genres = None
+        self._languages = None
+        self._books = None
+        self._book_pks = None
+        self._users = None
+        self.skipped = 0
+
+    @pin_to_primary()
+    def _load_maps(self, kind):
+        # The maps must match the primary the batches are written to
+        if kind in ('books', 'authors') and self._authors is None:
+            self._authors = {
+                (first, last): pk for pk, first, last
+                in Author.objects.values_list('pk', 'first_name', 'last_name').iterator()
+            }
+        if kind == 'books' and self._genres is None:
+            self._genres = dict(Genre.objects.values_list('name', 'pk'))
+            self._languages = dict(Language.objects.values_list('name', 'pk'))
+        if kind in ('books', 'copies') and self._books is None:
+            self._books = dict(Book.objects.values_list('isbn', 'pk').iterator())
+            self._book_pks = set(self._books.values())
+        if kind == 'copies' and self._users is None:
+            self._users = dict(User.objects.values_list('username', 'pk').iterator())
+
+    def _resolve(self, model, lookup, keys, build):
+        """Make sure lookup maps every key to a pk, bulk creating the missing objects."""
+        missing = [key for key in dict.fromkeys(keys) if key and key not in lookup]
+        if missing:
+            objs = [build(key) for key in missing]
+            _assign_pks(model, objs)
+            model.objects.bulk_create(objs)
+            for key, obj in zip(missing, objs):
+                lookup[key] = obj.pk
+
+    def import_batch(self, kind, rows):
+        """Import one batch of rows inside a transaction and return the number written."""
+        self._load_maps(kind)
+        with transaction.atomic():
+            written = getattr(self, f'_import_{kind}')(rows)
+        invalidate_home_stats()
+        invalidate_pages()
+        api.bump_generation()
+        return written
+
+    def _import_authors(self, rows):
+        keys = [(_text(row, 'first_name'), _text(row, 'last_name')) for row in rows]
+        new_rows = {}
+        for key, row in zip(keys, rows):
+            if key in self._authors or key in new_rows:
+                self.skipped += 1
+            else:
+                new_rows[key] = row
+        self._resolve(Author, self._authors, new_rows, lambda key: Author(
+            first_name=key[0],
+            last_name=key[1],
+            date_of_birth=_date(new_rows[key], 'date_of_birth'),
+            date_of_death=_date(new_rows[key], 'date_of_death'),
+        ))
+        return len(new_rows)
+
+    def _import_books(self, rows):
+        new_rows = {}
+        for row in rows:
+            isbn = _text(row, 'isbn')
+            if not isbn or isbn in self._books or isbn in new_rows:
+                self.skipped += 1
+            else:
+                new_rows[isbn] = row
+        rows = list(new_rows.values())
+
+        author_keys = [(_text(row, 'author_first_name'), _text(row, 'author_last_name')) for row in rows]
+        self._resolve(Author, self._authors, [key for key in author_keys if any(key)],
+                      lambda key: Author(first_name=key[0], last_name=key[1]))
+        self._resolve(Language, self._languages, [_text(row, 'language') for row in rows],
+                      lambda name: Language(name=name))
+        genre_names = [_names(row.get('genres')) for row in rows]
+        self._resolve(Genre, self._genres, [name for names in genre_names for name in names],
+                      lambda name: Genre(name=name))
+
+        books = [
+            Book(
+                title=_text(row, 'title'),
+                author_id=self._authors.get(author_key),
+                summary=_text(row, 'summary'),
+                isbn=_text(row, 'isbn'),
+                language_id=self._languages.get(_text(row, 'language')),
+            )
+            for row, author_key in zip(rows, author_keys)
+        ]
+        _assign_pks(Book, books)
+        Book.objects.bulk_create(books)
+
+        Book.genre.through.objects.bulk_create([
+            Book.genre.through(book_id=book.pk, genre_id=self._genres[name])
+            for book, names in zip(books, genre_names)
+            for name in dict.fromkeys(names)
+        ])
+        for book in books:
+            self._books[book.isbn] = book.pk
+            self._book_pks.add(book.pk)
+        search.index_books([book.pk for book in books])
+        facets.refresh_books([book.pk for book in books])
+        return len(books)
+
+    def _import_copies(self, rows):
+        copies = []
+        for row in rows:
+            book_id = self._books.get(_text(row, 'book_isbn'))
+            if book_id is None and _text(row, 'book_id').isdigit():
+                book_id = int(_text(row, 'book_id'))
+            status = _text(row, 'status')
+            try:
+                copy_uuid = _uuid(row, 'id')
+            except ValueError:
+                self.skipped += 1
+                continue
+            if book_id not in self._book_pks or (status and status not in LOAN_STATUSES):
+                self.skipped += 1
+                continue
+            copy = BookInstance(
+                book_id=book_id,
+                imprint=_text(row, 'imprint'),
+                status=status or 'm',
+                due_back=_date(row, 'due_back'),
+                borrower_id=self._users.get(_text(row, 'borrower')),
+            )
+            if copy_uuid:
+                copy.uuid = copy_uuid
+            copies.append(copy)
+        _assign_pks(BookInstance, copies)
+        BookInstance.objects.bulk_create(copies)
+        # Copies imported on loan start their loan history
+        LoanEvent.objects.bulk_create([event for copy in copies for event in loans.saved_loan_events(copy, None)])
+
+        # bulk_create() doesn't send post_save, update the copy counters per book and status
+        deltas = {}
+        for copy in copies:
+            key = (copy.book_id, copy.status)
+            deltas[key] = deltas.get(key, 0) + 1
+        for (book_id, status), delta in deltas.items():
+            Book.objects.filter(pk=book_id).adjust_copy_counts(status, delta)
+        facets.refresh_books({book_id for book_id, status in deltas})
+        return len(copies)
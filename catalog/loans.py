@@ -0,0 +1,167 @@
+"""Loan operations on many copies at once.
+
+Each operation runs in one transaction: the selected rows are locked with
+select_for_update() (SQLite takes its write lock up front instead), checked,
+and changed with a single QuerySet.update(), and a LoanEvent per copy is
+added to the loan history with one bulk_create().
+update() sends no signals, so the copy counters, the book facets, the stored
+overdue loans, the home page statistics, the cached pages and the API stamps
+are adjusted here, once per batch.
+Copies saved one at a time, as the admin does, get their LoanEvents from
+saved_loan_events(), which the post_save handlers of catalog/signals.py call.
+"""
+from collections import Counter
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Count, F, Min, Q
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from catalog import api, facets
+from catalog.caching import invalidate_pages
+from catalog.database import reserve_write_lock
+from catalog.overdue import forget_loans
+from catalog.models import COPY_STATUS_COUNTERS, Book, BookInstance, LoanEvent
+from catalog.stats import invalidate_home_stats
+
+ON_LOAN, AVAILABLE, RESERVED = 'o', 'a', 'r'
+
+
+def _select(copy_ids=None, borrower=None):
+    """Lock and return the id, UUID, book id, status, borrower id and due date of the selected copies."""
+    if not copy_ids and borrower is None:
+        # Without either, the operation would apply to every copy of the library
+        raise ValidationError('Select copies or a borrower.')
+    queryset = BookInstance.objects.select_for_update()
+    if copy_ids:
+        queryset = queryset.filter(uuid__in=copy_ids)
+    if borrower is not None:
+        queryset = queryset.filter(borrower=borrower, status=ON_LOAN)
+    rows = list(queryset.order_by('pk').values_list('pk', 'uuid', 'book_id', 'status', 'borrower_id', 'due_back', named=True))
+
+    if copy_ids:
+        missing = set(copy_ids) - {row.uuid for row in rows}
+        if missing:
+            raise ValidationError(
+                'Unknown copies: %(ids)s', params={'ids': ', '.join(sorted(str(pk) for pk in missing))})
+    return rows
+
+
+def _check_status(rows, allowed, action):
+    wrong = [str(row.uuid) for row in rows if row.status not in allowed]
+    if wrong:
+        raise ValidationError(
+            'These copies cannot be %(action)s: %(ids)s', params={'action': action, 'ids': ', '.join(wrong)})
+
+
+def _move_copy_counts(rows, new_status):
+    """Move the counters of the books of rows from each copy's status to new_status."""
+    changes = {}
+    for (book_id, old_status), count in Counter((row.book_id, row.status) for row in rows).items():
+        if book_id is None or old_status == new_status:
+            continue
+        deltas = changes.setdefault(book_id, Counter())
+        if old_status in COPY_STATUS_COUNTERS:
+            deltas[COPY_STATUS_COUNTERS[old_status]] -= count
+        deltas[COPY_STATUS_COUNTERS[new_status]] += count
+
+    now = timezone.now()
+    for book_id, deltas in changes.items():
+        Book.objects.filter(pk=book_id).update(
+            modified=now, **{field: F(field) + delta for field, delta in deltas.items() if delta})
+
+
+def _events(rows, event, changes, now):
+    """LoanEvents recording the change of rows, for the borrower the loans belong to."""
+    return [
+        LoanEvent(
+            copy_id=row.pk,
+            book_id=row.book_id,
+            borrower_id=changes['borrower'].pk if event == LoanEvent.CHECKED_OUT else row.borrower_id,
+            action=event,
+            due_back=row.due_back if event == LoanEvent.RETURNED else changes['due_back'],
+            at=now,
+        )
+        for row in rows
+        if event == LoanEvent.CHECKED_OUT or row.borrower_id is not None
+    ]
+
+
+def saved_loan_events(copy, old_state):
+    """LoanEvents recording the loan changes of a saved copy.
+
+    old_state is the (book id, status, borrower id, due date) the copy had
+    before the save, None for a new copy.
+    """
+    old_book_id, old_status, old_borrower_id, old_due_back = old_state or (None, None, None, None)
+    was_lent = old_status == ON_LOAN and old_borrower_id is not None
+    is_lent = copy.status == ON_LOAN and copy.borrower_id is not None
+    now = timezone.now()
+    events = []
+    # Lending a copy on loan to someone else returns it first
+    if was_lent and (not is_lent or copy.borrower_id != old_borrower_id):
+        events.append(LoanEvent(copy_id=copy.pk, book_id=old_book_id, borrower_id=old_borrower_id,
+                                action=LoanEvent.RETURNED, due_back=old_due_back, at=now))
+    if is_lent and (not was_lent or copy.borrower_id != old_borrower_id):
+        events.append(LoanEvent(copy_id=copy.pk, book_id=copy.book_id, borrower_id=copy.borrower_id,
+                                action=LoanEvent.CHECKED_OUT, due_back=copy.due_back, at=now))
+    elif is_lent and copy.due_back != old_due_back:
+        events.append(LoanEvent(copy_id=copy.pk, book_id=copy.book_id, borrower_id=copy.borrower_id,
+                                action=LoanEvent.RENEWED, due_back=copy.due_back, at=now))
+    return events
+
+
+def _apply(copy_ids, borrower, allowed, action, event, changes, new_status=None):
+    """Change the selected copies in one transaction and return how many changed."""
+    with transaction.atomic():
+        reserve_write_lock(BookInstance)
+        rows = _select(copy_ids, borrower)
+        _check_status(rows, allowed, action)
+        book_ids = {row.book_id for row in rows if row.book_id}
+        now = timezone.now()
+        BookInstance.objects.filter(pk__in=[row.pk for row in rows]).update(modified=now, **changes)
+        LoanEvent.objects.bulk_create(_events(rows, event, changes, now))
+        if new_status:
+            _move_copy_counts(rows, new_status)
+            facets.refresh_books(book_ids)
+        else:
+            # The books' stamps version the cached fragments listing their copies
+            Book.objects.filter(pk__in=book_ids).update(modified=now)
+        # Returned and renewed copies are no longer overdue
+        forget_loans([row.pk for row in rows])
+
+    api.invalidate_copy_stamps(book_ids, counts_changed=bool(new_status))
+    if new_status:
+        invalidate_home_stats()
+    invalidate_pages()
+    return len(rows)
+
+
+def check_out_copies(copy_ids, borrower, due_back):
+    """Lend available or reserved copies, by UUID, to borrower until due_back."""
+    return _apply(copy_ids, None, (AVAILABLE, RESERVED), 'checked out', LoanEvent.CHECKED_OUT,
+                  {'status': ON_LOAN, 'borrower': borrower, 'due_back': due_back}, ON_LOAN)
+
+
+def return_copies(copy_ids=None, borrower=None):
+    """Mark copies on loan, by UUID or all those of borrower, as returned and available."""
+    return _apply(copy_ids, borrower, (ON_LOAN,), 'returned', LoanEvent.RETURNED,
+                  {'status': AVAILABLE, 'borrower': None, 'due_back': None}, AVAILABLE)
+
+
+def renew_copies(copy_ids=None, borrower=None, due_back=None):
+    """Move the due date of copies on loan, by UUID or all those of borrower, to due_back."""
+    return _apply(copy_ids, borrower, (ON_LOAN,), 'renewed', LoanEvent.RENEWED, {'due_back': due_back})
+
+
+def loan_totals(borrower):
+    """Totals of the loan history of borrower, in one aggregate query."""
+    return LoanEvent.objects.filter(borrower=borrower).aggregate(
+        loans=Count('pk', filter=Q(action=LoanEvent.CHECKED_OUT)),
+        renewals=Count('pk', filter=Q(action=LoanEvent.RENEWED)),
+        returns=Count('pk', filter=Q(action=LoanEvent.RETURNED)),
+        late_returns=Count('pk', filter=Q(action=LoanEvent.RETURNED, due_back__lt=TruncDate('at'))),
+        books=Count('book', distinct=True),
+        first_loan=Min('at'),
+    )
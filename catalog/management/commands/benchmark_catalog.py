@@ -0,0 +1,115 @@
+import json
+import os
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from catalog.benchmark import (
+    CONCURRENT_VARIANTS, benchmark_concurrency, benchmark_views, compare_concurrency, compare_to_baseline,
+    seed_catalog,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed a throwaway test database with a catalog of the given size, benchmark every catalog URL '
+        'and compare latency, queries, peak memory and, with --concurrency, throughput with a JSON baseline.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--authors', type=int, default=1000)
+        parser.add_argument('--books', type=int, default=20_000)
+        parser.add_argument('--copies', type=int, default=200_000)
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--seed', type=int, default=0, help='Seed of the data generator.')
+        parser.add_argument('--requests', type=int, default=20, help='Measured requests per URL.')
+        parser.add_argument(
+            '--baseline', default=os.path.join(settings.BASE_DIR, 'benchmarks', 'catalog.json'),
+            help='JSON file with the baseline measurements.',
+        )
+        parser.add_argument(
+            '--save-baseline', action='store_true',
+            help='Store the measurements as the new baseline instead of comparing.',
+        )
+        parser.add_argument(
+            '--threshold', type=float, default=0.2,
+            help='Allowed slowdown or memory growth over the baseline, as a fraction.',
+        )
+        parser.add_argument('--keepdb', action='store_true', help='Keep the test database afterwards.')
+        parser.add_argument(
+            '--concurrency', type=int, default=0,
+            help='Also compare the throughput of the concurrent view variants with this many '
+                 'simultaneous ASGI requests.',
+        )
+
+    def handle(self, *args, **options):
+        log = self.stdout.write if options['verbosity'] > 1 else None
+        throughput = {}
+        scale = {field: options[field] for field in ('authors', 'books', 'copies', 'users', 'seed')}
+
+        setup_test_environment()
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=options['keepdb'])
+        try:
+            cache.clear()
+            started = time.monotonic()
+            if not User.objects.filter(username='benchmark').exists():
+                seed_catalog(log=log, **scale)
+                User.objects.create_superuser('benchmark', 'benchmark@example.com', 'benchmark')
+            self.stdout.write(f'Seeded {scale} in {time.monotonic() - started:.1f}s.')
+
+            client = Client()
+            client.login(username='benchmark', password='benchmark')
+            results = benchmark_views(client, options['requests'], log=log)
+            if options['concurrency']:
+                throughput = benchmark_concurrency(
+                    client.session.session_key, options['concurrency'], options['requests'] * 5, log=log)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options['keepdb'])
+            teardown_test_environment()
+
+        for name, measured in results.items():
+            self.stdout.write(
+                f'{name:24} {measured["p50_ms"]:9.1f} ms p50 {measured["p95_ms"]:9.1f} ms p95 '
+                f'{measured["queries"]:4} queries {measured["peak_kib"]:10.1f} KiB'
+            )
+
+        for name, measured in throughput.items():
+            self.stdout.write(
+                f'{name:24} {measured["requests_per_s"]:9.1f} requests/s '
+                f'at concurrency {measured["concurrency"]} (status {measured["status"]})'
+            )
+        for name, ratio in compare_concurrency(throughput).items():
+            self.stdout.write(f'{CONCURRENT_VARIANTS[name]:24} {ratio:9.2f}x the requests/s of {name}')
+
+        path = options['baseline']
+        if options['save_baseline']:
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            with open(path, 'w') as output:
+                json.dump({'scale': scale, 'views': results, 'throughput': throughput}, output, indent=2, sort_keys=True)
+            self.stdout.write(self.style.SUCCESS(f'Baseline saved to {path}.'))
+            return
+
+        if not os.path.exists(path):
+            self.stdout.write(f'No baseline at {path}, run with --save-baseline to create one.')
+            return
+        with open(path) as source:
+            baseline = json.load(source)
+        if baseline.get('scale') != scale:
+            raise CommandError(f'The baseline was measured at another scale: {baseline.get("scale")}.')
+
+        regressions = compare_to_baseline(results, baseline['views'], options['threshold'])
+        baseline_throughput = baseline.get('throughput', {})
+        # Throughput is only compared with a baseline measured at the same concurrency
+        comparable = {name: measured for name, measured in throughput.items()
+                      if baseline_throughput.get(name, {}).get('concurrency') == measured['concurrency']}
+        regressions += compare_to_baseline(comparable, baseline_throughput, options['threshold'])
+        if regressions:
+            raise CommandError('Regressions against the baseline:\n' + '\n'.join(regressions))
+        self.stdout.write(self.style.SUCCESS('No regressions against the baseline.'))
@@ -0,0 +1,29 @@
+import tempfile
+
+from django.core.management.base import BaseCommand
+
+from catalog.benchmark import benchmark_copy_keys
+
+
+def _mib(size):
+    return 'n/a' if size is None else f'{size / 1024 / 1024:.1f} MiB'
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare the table and index sizes and the LibraryBooksListView page scans of the copies '
+        'with a UUID primary key (before migration 0013) and an integer one, on scratch SQLite files.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=200_000, help='Number of copies.')
+        parser.add_argument('--seconds', type=float, default=3.0, help='Duration of each scan.')
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory() as directory:
+            results = benchmark_copy_keys(directory, rows=options['rows'], seconds=options['seconds'])
+        for layout, result in results.items():
+            self.stdout.write(
+                f'{layout:8} table {_mib(result["table_bytes"]):>10}  indexes {_mib(result["index_bytes"]):>10}  '
+                f'file {_mib(result["file_bytes"]):>10}  {result["pages_per_s"]:9.1f} library pages/s'
+            )
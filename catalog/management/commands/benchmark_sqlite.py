@@ -0,0 +1,33 @@
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from catalog.benchmark import benchmark_sqlite_concurrency
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare mixed read and renewal throughput and lock errors of the database profiles '
+        'of CATALOG_DATABASE_PROFILES on a scratch SQLite file.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--seconds', type=float, default=3.0, help='Duration of each run.')
+        parser.add_argument('--write-share', type=float, default=0.25, help='Fraction of operations that write.')
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'benchmark.sqlite3')
+            for name, profile in settings.CATALOG_DATABASE_PROFILES.items():
+                # Tuned profiles run the loan service's transactions, which take the write lock first
+                result = benchmark_sqlite_concurrency(
+                    path, profile['PRAGMAS'], reserve_write=bool(profile['PRAGMAS']),
+                    threads=options['threads'], seconds=options['seconds'], write_share=options['write_share'],
+                )
+                self.stdout.write(
+                    f'{name:10} {result["reads_per_s"]:9.1f} reads/s {result["writes_per_s"]:9.1f} writes/s '
+                    f'{result["lock_errors"]:6} lock errors'
+                )
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from catalog.assets import MissingSources, assets_root, brotli, build_assets
+from catalog.caching import invalidate_pages
+
+
+class Command(BaseCommand):
+    help = (
+        'Bundle and minify the static files of CATALOG_ASSET_BUNDLES into CATALOG_ASSETS_ROOT, '
+        'under content-hashed names, with gzip and brotli variants.'
+    )
+
+    def handle(self, *args, **options):
+        try:
+            built = build_assets()
+        except MissingSources as e:
+            raise CommandError(f'{e}. Vendored files, such as Bootstrap, go in catalog/static/vendor/.')
+        # Cached pages still link the previous bundles
+        invalidate_pages()
+
+        for name, (target, sizes) in sorted(built.items()):
+            details = ', '.join(f'{encoding} {size} bytes' for encoding, size in sizes.items())
+            self.stdout.write(f'{name} -> {target} ({details})')
+        if brotli is None:
+            self.stdout.write(self.style.WARNING('The brotli package is not installed, no brotli variants were written.'))
+        self.stdout.write(self.style.SUCCESS(f'Built {len(built)} bundles into {assets_root()}.'))
@@ -0,0 +1,85 @@
+import datetime
+import re
+import uuid
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import RequestFactory
+
+from catalog import views
+from catalog.overdue import overdue_copies
+from catalog.models import Book, BookInstance
+
+# Plan lines reading a whole table rather than seeking through an index
+FULL_SCAN_PATTERNS = {
+    'sqlite': re.compile(r'\bSCAN (?:TABLE )?(?!CONSTANT ROW)(\w+)(?!.*\bUSING\b)'),
+    'postgresql': re.compile(r'\bSeq Scan on (\w+)'),
+}
+
+
+def get_query_shapes():
+    """Yield (url name, description, queryset) for the queries the catalog views run."""
+    def make_view(view_class, params=None, **kwargs):
+        request = RequestFactory().get('/', params)
+        request.user = User(pk=1)
+        view = view_class()
+        view.setup(request, **kwargs)
+        return view
+
+    list_views = [
+        ('books', views.BookListView, None, ['M', 1]),
+        ('my-borrowed', views.LoanedBookByUserListView, None, [datetime.date.today(), 1]),
+        ('library-books', views.LibraryBooksListView, None, [datetime.date.today(), 1]),
+        ('library-books', views.LibraryBooksListView, {'overdue': '1'}, [datetime.date.today(), 1]),
+    ]
+    for name, view_class, params, cursor_values in list_views:
+        view = make_view(view_class, params)
+        queryset = view.get_queryset()
+        page_size = view.get_paginate_by(queryset) + 1
+        prefix = 'overdue, ' if params else ''
+        yield name, f'{prefix}first page', view.get_keyset_queryset(queryset)[:page_size]
+        yield name, f'{prefix}next page', view.get_keyset_queryset(queryset, cursor_values)[:page_size]
+        yield name, f'{prefix}previous page', \
+            view.get_keyset_queryset(queryset, cursor_values, forward=False)[:page_size]
+
+    yield 'authors', 'author list', make_view(views.AuthorsView).get_queryset()
+
+    yield 'book-detail', 'book', make_view(views.BookDetailView, pk=1).get_queryset().filter(pk=1)
+    yield 'book-detail', 'copies', BookInstance.objects.filter(book__in=[1])
+    yield 'book-detail', 'genres', Book.genre.through.objects.filter(book__in=[1])
+
+    yield 'author-detail', 'author', make_view(views.AuthorDetail, pk=1).get_queryset().filter(pk=1)
+    yield 'author-detail', 'books', Book.objects.select_related('language').filter(author__in=[1])
+    yield 'author-detail', 'copies', BookInstance.objects.filter(book__in=[1, 2])
+
+    yield 'renew-book-librarian', 'copy', BookInstance.objects.filter(uuid=uuid.uuid4())
+
+    yield 'sweep_overdue_loans', 'overdue copies', overdue_copies(datetime.date.today())
+
+
+class Command(BaseCommand):
+    help = 'Run EXPLAIN on the queries of the catalog views and fail if any does a full table scan.'
+
+    def handle(self, *args, **options):
+        pattern = FULL_SCAN_PATTERNS.get(connection.vendor)
+        if pattern is None:
+            raise CommandError(f'Query plans of the {connection.vendor} backend are not supported.')
+
+        failures = 0
+        for name, description, queryset in get_query_shapes():
+            plan = queryset.explain()
+            scanned = sorted({match.group(1) for match in pattern.finditer(plan)})
+            if scanned:
+                failures += 1
+                self.stdout.write(self.style.ERROR(
+                    f'{name} ({description}): full scan of {", ".join(scanned)}'
+                ))
+            else:
+                self.stdout.write(f'{name} ({description}): ok')
+            if options['verbosity'] > 1 or scanned:
+                self.stdout.write(plan)
+
+        if failures:
+            raise CommandError(f'{failures} queries fall back to a full table scan.')
+        self.stdout.write(self.style.SUCCESS('All catalog queries use indexes.'))
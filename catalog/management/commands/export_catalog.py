@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from catalog.export import EXPORTS, FORMATS, export_lines
+
+
+class Command(BaseCommand):
+    help = 'Stream an export of the catalog (books, authors or copies) as CSV or JSON lines.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('name', choices=sorted(EXPORTS))
+        parser.add_argument('--format', dest='fmt', choices=sorted(FORMATS), default='csv')
+        parser.add_argument('--output', help='File to write to, defaults to standard output.')
+
+    def handle(self, *args, **options):
+        lines = export_lines(options['name'], options['fmt'])
+        if options['output']:
+            with open(options['output'], 'w', newline='', encoding='utf-8') as output:
+                output.writelines(lines)
+        else:
+            for line in lines:
+                self.stdout.write(line, ending='')
@@ -0,0 +1,67 @@
+import itertools
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from catalog.importer import KINDS, CatalogImporter, read_rows
+
+
+class Command(BaseCommand):
+    help = (
+        'Import authors, books (with their genres and language) or copies from a CSV or JSON lines file. '
+        'Progress is checkpointed after every batch so an interrupted import can be resumed.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='A .csv or .jsonl file.')
+        parser.add_argument('--kind', choices=KINDS, required=True, help='What the rows of the file are.')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows written per transaction.')
+        parser.add_argument(
+            '--checkpoint',
+            help='File recording the rows already imported, defaults to PATH.checkpoint.',
+        )
+        parser.add_argument(
+            '--restart', action='store_true',
+            help='Ignore an existing checkpoint and import the whole file.',
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        batch_size = options['batch_size']
+        checkpoint = options['checkpoint'] or f'{path}.checkpoint'
+        if not os.path.exists(path):
+            raise CommandError(f'{path} does not exist.')
+        if batch_size < 1:
+            raise CommandError('--batch-size must be positive.')
+
+        done = 0
+        if not options['restart'] and os.path.exists(checkpoint):
+            with open(checkpoint) as checkpoint_file:
+                done = int(checkpoint_file.read().strip() or 0)
+            self.stdout.write(f'Resuming after row {done}.')
+
+        importer = CatalogImporter()
+        rows = itertools.islice(read_rows(path), done, None)
+        written = 0
+        started = time.monotonic()
+
+        while True:
+            batch = list(itertools.islice(rows, batch_size))
+            if not batch:
+                break
+            written += importer.import_batch(options['kind'], batch)
+            done += len(batch)
+            with open(checkpoint, 'w') as checkpoint_file:
+                checkpoint_file.write(str(done))
+
+            elapsed = time.monotonic() - started
+            self.stdout.write(f'{done} rows read, {written} written ({written / elapsed:.0f} rows/s)')
+
+        if os.path.exists(checkpoint):
+            os.remove(checkpoint)
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {written} {options["kind"]} in {elapsed:.2f}s '
+            f'({written / elapsed if elapsed else 0:.0f} rows/s), skipped {importer.skipped} rows.'
+        ))
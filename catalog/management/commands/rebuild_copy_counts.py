@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from catalog import api, facets
+from catalog.caching import invalidate_pages
+from catalog.models import Book, COPY_COUNTERS
+
+
+class Command(BaseCommand):
+    help = 'Recompute the denormalized copy counters of every book and report drift.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Only report books whose counters drifted, do not fix them.',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Number of books written per UPDATE batch.',
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        batch_size = options['batch_size']
+        drifted = []
+        checked = 0
+
+        with transaction.atomic():
+            books = Book.objects.with_counted_copies().only('title', *COPY_COUNTERS).order_by('pk')
+            for book in books.iterator(chunk_size=batch_size):
+                checked += 1
+                changes = {}
+                for field in COPY_COUNTERS:
+                    counted = getattr(book, f'counted_{field}')
+                    if getattr(book, field) != counted:
+                        changes[field] = (getattr(book, field), counted)
+                        setattr(book, field, counted)
+                if changes:
+                    book.modified = timezone.now()
+                    drifted.append(book)
+                    details = ', '.join(f'{field} {old} -> {new}' for field, (old, new) in changes.items())
+                    self.stdout.write(f'Drift in "{book}" (id={book.pk}): {details}')
+
+            if drifted and not dry_run:
+                Book.objects.bulk_update(drifted, COPY_COUNTERS + ('modified',), batch_size=batch_size)
+                facets.refresh_books([book.pk for book in drifted])
+                api.bump_generation()
+                invalidate_pages()
+
+        action = 'found' if dry_run else 'fixed'
+        self.stdout.write(self.style.SUCCESS(
+            f'Checked {checked} books, {action} {len(drifted)} with drifted counters.'
+        ))
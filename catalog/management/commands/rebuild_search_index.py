@@ -0,0 +1,20 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from catalog import search
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search index of the catalog from scratch.'
+
+    def handle(self, *args, **options):
+        if not search.search_enabled():
+            raise CommandError('Full-text search is only available on SQLite.')
+
+        started = time.monotonic()
+        with transaction.atomic():
+            indexed = search.rebuild_index()
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(f'Indexed {indexed} books in {elapsed:.2f}s.'))
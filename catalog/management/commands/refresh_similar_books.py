@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from catalog import recommendations
+
+
+class Command(BaseCommand):
+    help = 'Compute the books borrowed together from the loans, only from the new loans unless --full.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full', action='store_true',
+            help='Read every loan and recompute the similar books of every book.',
+        )
+        parser.add_argument(
+            '--engine', choices=('scipy', 'python'),
+            help='Compute with SciPy sparse matrices or in pure Python (default: SciPy when installed).',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            run = recommendations.refresh_similar_books(full=options['full'], engine=options['engine'])
+        except ValueError as error:
+            raise CommandError(error)
+        kind = 'Full' if run.full else 'Incremental'
+        self.stdout.write(self.style.SUCCESS(
+            f'{kind} run with {run.engine}: {run.loans} loans read, similar books of {run.books} books '
+            f'computed in {run.seconds:.2f}s (up to loan event {run.last_event}).'
+        ))
@@ -0,0 +1,32 @@
+import sqlite3
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from catalog.routers import read_replicas
+
+
+class Command(BaseCommand):
+    help = (
+        'Copy the default SQLite database into the SQLite files of the CATALOG_READ_REPLICAS aliases, '
+        'standing in for replication in development and tests.'
+    )
+
+    def handle(self, *args, **options):
+        primary = connections[DEFAULT_DB_ALIAS]
+        replicas = read_replicas()
+        if not replicas:
+            raise CommandError('No read replicas are configured.')
+        if primary.vendor != 'sqlite' or any(connections[alias].vendor != 'sqlite' for alias in replicas):
+            raise CommandError('Only SQLite databases can be copied.')
+
+        primary.ensure_connection()
+        for alias in replicas:
+            replica = connections[alias]
+            replica.close()
+            target = sqlite3.connect(replica.settings_dict['NAME'])
+            try:
+                primary.connection.backup(target)
+            finally:
+                target.close()
+            self.stdout.write(f'Copied {DEFAULT_DB_ALIAS} to {alias} ({replica.settings_dict["NAME"]}).')
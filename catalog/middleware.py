@@ -0,0 +1,152 @@
+"""Per-view query count and latency instrumentation.
+
+ViewCostMiddleware times every request resolved to a named URL and records,
+per URL name, the number of SQL queries and their time (through
+connection.execute_wrapper, also on the threads of catalog.concurrent, whose
+query times add up even when they overlap), the render time of
+TemplateResponses and the total latency. Catalog views return
+TemplateResponses, so that their rendering is timed. The figures are kept in memory per process and shown on the
+staff-only stats pages. Views exceeding their budget from
+CATALOG_VIEW_BUDGETS are logged, or raise ViewBudgetExceeded when
+CATALOG_VIEW_BUDGET_ACTION is 'raise'.
+"""
+import logging
+import threading
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+
+class ViewBudgetExceeded(Exception):
+    pass
+
+
+class ViewStats:
+    """Running totals of the cost of the requests of one URL name."""
+    FIELDS = ('queries', 'sql_ms', 'template_ms', 'total_ms')
+
+    def __init__(self):
+        self.requests = 0
+        self.totals = dict.fromkeys(self.FIELDS, 0)
+        self.maximums = dict.fromkeys(self.FIELDS, 0)
+        self.over_budget = 0
+
+    def add(self, sample):
+        self.requests += 1
+        for field in self.FIELDS:
+            self.totals[field] += sample[field]
+            self.maximums[field] = max(self.maximums[field], sample[field])
+
+    def as_dict(self):
+        return {
+            'requests': self.requests,
+            'over_budget': self.over_budget,
+            'mean': {field: round(self.totals[field] / self.requests, 2) for field in self.FIELDS},
+            'max': {field: round(self.maximums[field], 2) for field in self.FIELDS},
+        }
+
+
+_stats = {}
+_lock = threading.Lock()
+
+
+def get_view_stats():
+    """Return a snapshot of the recorded stats, by URL name."""
+    with _lock:
+        return {name: stats.as_dict() for name, stats in sorted(_stats.items())}
+
+
+def reset_view_stats():
+    with _lock:
+        _stats.clear()
+
+
+def check_budget(url_name, sample):
+    """Return the budget limits a sample exceeds, as 'measure value > limit' strings."""
+    budget = getattr(settings, 'CATALOG_VIEW_BUDGETS', {}).get(url_name, {})
+    return [
+        f'{field} {sample[field]:.0f} > {limit}'
+        for field, limit in budget.items()
+        if field in sample and sample[field] > limit
+    ]
+
+
+class _RequestCost:
+    """Cost of one request, installed as an execute wrapper on every connection."""
+
+    def __init__(self):
+        self.queries = 0
+        self.sql_time = 0.0
+        self.template_time = 0.0
+        # Concurrent views run queries from several threads
+        self._lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                self.sql_time += elapsed
+                self.queries += 1
+
+
+class ViewCostMiddleware:
+    """Record the query count, SQL time, template time and latency of each named view."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self._local = threading.local()
+
+    def __call__(self, request):
+        cost = _RequestCost()
+        self._local.cost = cost
+        started = time.perf_counter()
+
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(cost))
+                response = self.get_response(request)
+        finally:
+            self._local.cost = None
+
+        match = getattr(request, 'resolver_match', None)
+        if match is not None and match.url_name:
+            self.record(match.url_name, {
+                'queries': cost.queries,
+                'sql_ms': cost.sql_time * 1000,
+                'template_ms': cost.template_time * 1000,
+                'total_ms': (time.perf_counter() - started) * 1000,
+            })
+        return response
+
+    def process_template_response(self, request, response):
+        # Render here, timed, rather than letting the handler render untimed.
+        # This is the last process_template_response hook as long as the
+        # middleware is listed first in MIDDLEWARE.
+        cost = getattr(self._local, 'cost', None)
+        if cost is not None and not response.is_rendered:
+            started = time.perf_counter()
+            response.render()
+            cost.template_time += time.perf_counter() - started
+        return response
+
+    def record(self, url_name, sample):
+        exceeded = check_budget(url_name, sample)
+        with _lock:
+            stats = _stats.setdefault(url_name, ViewStats())
+            stats.add(sample)
+            if exceeded:
+                stats.over_budget += 1
+
+        if exceeded:
+            message = f'View {url_name} exceeded its budget: {", ".join(exceeded)}'
+            if getattr(settings, 'CATALOG_VIEW_BUDGET_ACTION', 'log') == 'raise':
+                raise ViewBudgetExceeded(message)
+            logger.warning(message)
@@ -0,0 +1,61 @@
+# Generated by Django 3.0.14 on 2026-10-18 08:36
+
+from django.db import migrations, models
+
+
+STATUS_COUNTERS = {
+    'a': 'copies_available',
+    'o': 'copies_on_loan',
+    'm': 'copies_maintenance',
+    'r': 'copies_reserved',
+}
+
+
+def populate_copy_counts(apps, schema_editor):
+    Book = apps.get_model('catalog', 'Book')
+    annotations = {'counted_copies_total': models.Count('bookinstance')}
+    for status, field in STATUS_COUNTERS.items():
+        annotations[f'counted_{field}'] = models.Count(
+            'bookinstance', filter=models.Q(bookinstance__status=status))
+
+    for row in Book.objects.values('pk').annotate(**annotations).iterator():
+        pk = row.pop('pk')
+        Book.objects.filter(pk=pk).update(**{
+            name[len('counted_'):]: value for name, value in row.items()
+        })
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0005_auto_20200109_1801'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='copies_available',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='copies_maintenance',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='copies_on_loan',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='copies_reserved',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='copies_total',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(populate_copy_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,34 @@
+from django.db import migrations
+
+
+def create_search_table(apps, schema_editor):
+    # The full-text index only exists on SQLite, other backends fall back to LIKE lookups
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(
+        "CREATE VIRTUAL TABLE catalog_book_fts USING fts5("
+        "title, summary, isbn, author, tokenize = 'unicode61 remove_diacritics 2')"
+    )
+    schema_editor.execute(
+        "INSERT INTO catalog_book_fts (rowid, title, summary, isbn, author) "
+        "SELECT book.id, book.title, book.summary, book.isbn, "
+        "COALESCE(author.first_name || ' ' || author.last_name, '') "
+        "FROM catalog_book AS book LEFT JOIN catalog_author AS author ON author.id = book.author_id"
+    )
+
+
+def drop_search_table(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute('DROP TABLE IF EXISTS catalog_book_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0007_catalog_query_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_table, drop_search_table),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 3.0.14 on 2026-10-18 08:51
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('auth', '0011_update_proxy_permissions'),
+        ('catalog', '0009_modified_stamps'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BorrowerOverdue',
+            fields=[
+                ('borrower', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='overdue_rollup', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('loans', models.PositiveIntegerField()),
+                ('max_days_overdue', models.PositiveIntegerField()),
+                ('oldest_due_back', models.DateField()),
+                ('swept', models.DateField()),
+            ],
+            options={
+                'verbose_name_plural': 'borrower overdues',
+                'ordering': ['-max_days_overdue', '-loans'],
+            },
+        ),
+        migrations.CreateModel(
+            name='OverdueLoan',
+            fields=[
+                ('copy', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='overdue', serialize=False, to='catalog.BookInstance')),
+                ('due_back', models.DateField()),
+                ('days_overdue', models.PositiveIntegerField()),
+                ('swept', models.DateField()),
+                ('book', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to='catalog.Book')),
+                ('borrower', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-days_overdue', 'copy'],
+            },
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 3.0.14 on 2026-10-18 09:06
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('catalog', '0010_overdue_loans'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LoanEvent',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('action', models.CharField(choices=[('c', 'Checked out'), ('r', 'Returned'), ('n', 'Renewed')], max_length=1)),
+                ('due_back', models.DateField(blank=True, null=True)),
+                ('at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('book', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to='catalog.Book')),
+                ('borrower', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='loan_events', to=settings.AUTH_USER_MODEL)),
+                ('copy', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='loan_events', to='catalog.BookInstance')),
+            ],
+            options={
+                'ordering': ['-at', '-id'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='loanevent',
+            index=models.Index(fields=['borrower', 'at', 'id'], name='loanevent_borrower_at_idx'),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 3.0.14 on 2026-10-18 09:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0011_loan_events'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VisitCount',
+            fields=[
+                ('visitor', models.CharField(max_length=32, primary_key=True, serialize=False)),
+                ('visits', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+    ]
@@ -0,0 +1,197 @@
+# Generated by Django 3.0.14 on 2026-10-18 09:30
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+# The UUID primary key of BookInstance becomes the unique uuid column of a new
+# table with an integer primary key, which then takes the name of the old one.
+# Loan events are relinked to the new keys. Overdue loans are derived data,
+# the sweep_overdue_loans command fills them again. The indexes and constraints
+# created for the new table are finally renamed after the table they belong to.
+
+COPY_COLUMNS = ('book_id', 'imprint', 'due_back', 'borrower_id', 'status', 'modified')
+
+TEMPORARY_TABLE = 'catalog_newbookinstance'
+
+
+def _tables(apps, schema_editor):
+    quote = schema_editor.connection.ops.quote_name
+    return (
+        quote(apps.get_model('catalog', 'BookInstance')._meta.db_table),
+        quote(apps.get_model('catalog', 'NewBookInstance')._meta.db_table),
+        quote(apps.get_model('catalog', 'LoanEvent')._meta.db_table),
+    )
+
+
+def copy_copies(apps, schema_editor):
+    old, new, _ = _tables(apps, schema_editor)
+    columns = ', '.join(COPY_COLUMNS)
+    # Copies of a book get neighbouring ids
+    schema_editor.execute(
+        f'INSERT INTO {new} (uuid, {columns}) SELECT id, {columns} FROM {old} ORDER BY book_id, id')
+
+
+def copy_copies_back(apps, schema_editor):
+    old, new, _ = _tables(apps, schema_editor)
+    columns = ', '.join(COPY_COLUMNS)
+    schema_editor.execute(f'INSERT INTO {old} (id, {columns}) SELECT uuid, {columns} FROM {new}')
+
+
+def link_loan_events(apps, schema_editor):
+    old, new, events = _tables(apps, schema_editor)
+    schema_editor.execute(
+        f'UPDATE {events} SET new_copy_id = (SELECT id FROM {new} WHERE {new}.uuid = {events}.copy_id) '
+        f'WHERE copy_id IS NOT NULL')
+
+
+def unlink_loan_events(apps, schema_editor):
+    old, new, events = _tables(apps, schema_editor)
+    schema_editor.execute(
+        f'UPDATE {events} SET copy_id = (SELECT uuid FROM {new} WHERE {new}.id = {events}.new_copy_id) '
+        f'WHERE new_copy_id IS NOT NULL')
+
+
+def _constraint_name(schema_editor, table, constraint):
+    """The name Django, or PostgreSQL for the inline constraints, gives the index or constraint on table."""
+    columns = constraint['columns']
+    if constraint['primary_key']:
+        return f'{table}_pkey'
+    if constraint['foreign_key']:
+        return schema_editor._create_index_name(table, columns, suffix='_fk_%s_%s' % constraint['foreign_key'])
+    if constraint['unique']:
+        return f'{table}_{"_".join(columns)}_key'
+    return schema_editor._create_index_name(table, columns, suffix='')
+
+
+def _rename_constraints(apps, schema_editor, old_table, new_table):
+    """Give the indexes and constraints named after old_table the names they have on new_table.
+
+    MySQL can't rename its foreign keys, they keep their names.
+    """
+    model = apps.get_model('catalog', 'BookInstance')
+    table = model._meta.db_table
+    connection = schema_editor.connection
+    quote = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        constraints = connection.introspection.get_constraints(cursor, table)
+    fields = {field.column: field for field in model._meta.local_fields}
+
+    for name, constraint in constraints.items():
+        # Django truncates the table name in long names, to 17 characters at least
+        if not name.startswith(old_table[:17]):
+            continue
+        new_name = _constraint_name(schema_editor, new_table, constraint)
+        is_index = constraint['index'] and not (constraint['primary_key'] or constraint['unique'])
+        if connection.vendor == 'postgresql':
+            if is_index:
+                schema_editor.execute(f'ALTER INDEX {quote(name)} RENAME TO {quote(new_name)}')
+            else:
+                schema_editor.execute(
+                    f'ALTER TABLE {quote(table)} RENAME CONSTRAINT {quote(name)} TO {quote(new_name)}')
+        elif connection.vendor == 'mysql' and is_index:
+            schema_editor.execute(f'ALTER TABLE {quote(table)} RENAME INDEX {quote(name)} TO {quote(new_name)}')
+        elif is_index:
+            # SQLite can't rename an index
+            schema_editor.execute(schema_editor._delete_index_sql(model, name))
+            schema_editor.execute(schema_editor._create_index_sql(
+                model, [fields[column] for column in constraint['columns']], name=new_name))
+    if connection.vendor == 'postgresql':
+        schema_editor.execute(
+            f'ALTER SEQUENCE IF EXISTS {quote(old_table + "_id_seq")} RENAME TO {quote(new_table + "_id_seq")}')
+
+
+def rename_constraints(apps, schema_editor):
+    _rename_constraints(apps, schema_editor, TEMPORARY_TABLE, apps.get_model('catalog', 'BookInstance')._meta.db_table)
+
+
+def rename_constraints_back(apps, schema_editor):
+    # The old table is created again with the names it had, which must be free
+    _rename_constraints(apps, schema_editor, apps.get_model('catalog', 'BookInstance')._meta.db_table, TEMPORARY_TABLE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('catalog', '0012_visit_counts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NewBookInstance',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('uuid', models.UUIDField(default=uuid.uuid4, editable=False, help_text='Unique ID from this particular book instance', unique=True, verbose_name='ID')),
+                ('imprint', models.CharField(max_length=200)),
+                ('due_back', models.DateField(blank=True, null=True)),
+                ('status', models.CharField(blank=True, choices=[('m', 'Maintenance'), ('o', 'On loan'), ('a', 'Available'), ('r', 'Reserved')], default='m', help_text='Book availability', max_length=1)),
+                ('modified', models.DateTimeField(auto_now=True)),
+                ('book', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to='catalog.Book')),
+                ('borrower', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.RunPython(copy_copies, copy_copies_back),
+        migrations.AddField(
+            model_name='loanevent',
+            name='new_copy',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='catalog.NewBookInstance'),
+        ),
+        migrations.RunPython(link_loan_events, unlink_loan_events),
+        migrations.RemoveField(
+            model_name='loanevent',
+            name='copy',
+        ),
+        migrations.DeleteModel(
+            name='OverdueLoan',
+        ),
+        migrations.DeleteModel(
+            name='BookInstance',
+        ),
+        migrations.RenameModel(
+            old_name='NewBookInstance',
+            new_name='BookInstance',
+        ),
+        migrations.RenameField(
+            model_name='loanevent',
+            old_name='new_copy',
+            new_name='copy',
+        ),
+        migrations.AlterField(
+            model_name='loanevent',
+            name='copy',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='loan_events', to='catalog.BookInstance'),
+        ),
+        migrations.AlterModelOptions(
+            name='bookinstance',
+            options={'ordering': ['due_back'], 'permissions': (('can_mark_returned', 'Set book as returned'),)},
+        ),
+        migrations.AddIndex(
+            model_name='bookinstance',
+            index=models.Index(condition=models.Q(status='o'), fields=['due_back', 'id'], name='bookinstance_on_loan_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bookinstance',
+            index=models.Index(condition=models.Q(status='o'), fields=['borrower', 'due_back', 'id'], name='bookinstance_borrowed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bookinstance',
+            index=models.Index(fields=['book', 'status'], name='bookinstance_book_status_idx'),
+        ),
+        migrations.CreateModel(
+            name='OverdueLoan',
+            fields=[
+                ('copy', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='overdue', serialize=False, to='catalog.BookInstance')),
+                ('due_back', models.DateField()),
+                ('days_overdue', models.PositiveIntegerField()),
+                ('swept', models.DateField()),
+                ('book', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to='catalog.Book')),
+                ('borrower', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-days_overdue', 'copy'],
+            },
+        ),
+        migrations.RunPython(rename_constraints, rename_constraints_back),
+    ]
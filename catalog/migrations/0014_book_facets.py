@@ -0,0 +1,86 @@
+# Generated by Django 3.0.14 on 2026-10-18 09:17
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+AVAILABILITY_LABELS = {'yes': 'Available now', 'no': 'All copies out'}
+
+
+def _initial(last_name):
+    initial = (last_name or '').strip()[:1].upper()
+    return initial if initial.isalpha() else '#'
+
+
+def populate_facets(apps, schema_editor):
+    Book = apps.get_model('catalog', 'Book')
+    BookFacet = apps.get_model('catalog', 'BookFacet')
+    BookFacetValue = apps.get_model('catalog', 'BookFacetValue')
+    values = []
+    books = Book.objects.values_list('pk', 'language_id', 'author_id', 'author__last_name', 'copies_available')
+    for book_id, language_id, author_id, last_name, available in books.iterator():
+        if language_id is not None:
+            values.append(BookFacetValue(book_id=book_id, facet='language', value=str(language_id)))
+        if author_id is not None:
+            values.append(BookFacetValue(book_id=book_id, facet='initial', value=_initial(last_name)))
+        values.append(BookFacetValue(book_id=book_id, facet='available', value='yes' if available else 'no'))
+    for book_id, genre_id in Book.genre.through.objects.values_list('book_id', 'genre_id').iterator():
+        values.append(BookFacetValue(book_id=book_id, facet='genre', value=str(genre_id)))
+    BookFacetValue.objects.bulk_create(values, batch_size=1000)
+
+    labels = {
+        'genre': {str(pk): name for pk, name in apps.get_model('catalog', 'Genre').objects.values_list('pk', 'name')},
+        'language': {
+            str(pk): name for pk, name in apps.get_model('catalog', 'Language').objects.values_list('pk', 'name')},
+        'available': AVAILABILITY_LABELS,
+    }
+    counts = BookFacetValue.objects.values('facet', 'value').annotate(books=models.Count('*')).order_by()
+    BookFacet.objects.bulk_create([
+        BookFacet(facet=row['facet'], value=row['value'], books=row['books'],
+                  label=labels.get(row['facet'], {}).get(row['value'], row['value']))
+        for row in counts
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0013_bookinstance_integer_pk'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookFacet',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('facet', models.CharField(choices=[('genre', 'Genre'), ('language', 'Language'), ('initial', 'Author'), ('available', 'Availability')], max_length=10)),
+                ('value', models.CharField(max_length=20)),
+                ('label', models.CharField(max_length=200)),
+                ('books', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['facet', 'label', 'value'],
+            },
+        ),
+        migrations.CreateModel(
+            name='BookFacetValue',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('facet', models.CharField(choices=[('genre', 'Genre'), ('language', 'Language'), ('initial', 'Author'), ('available', 'Availability')], max_length=10)),
+                ('value', models.CharField(max_length=20)),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='facet_values', to='catalog.Book')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='bookfacet',
+            constraint=models.UniqueConstraint(fields=('facet', 'value'), name='bookfacet_unique'),
+        ),
+        migrations.AddIndex(
+            model_name='bookfacetvalue',
+            index=models.Index(fields=['facet', 'value', 'book'], name='bookfacetvalue_books_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='bookfacetvalue',
+            constraint=models.UniqueConstraint(fields=('book', 'facet', 'value'), name='bookfacetvalue_unique'),
+        ),
+        migrations.RunPython(populate_facets, migrations.RunPython.noop),
+    ]
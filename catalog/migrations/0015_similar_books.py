@@ -0,0 +1,48 @@
+# Generated by Django 3.0.14 on 2026-10-18 09:21
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0014_book_facets'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SimilarBooksRun',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_event', models.IntegerField(help_text='Id of the last LoanEvent included')),
+                ('full', models.BooleanField(help_text='Whether every loan was read, or only the loans since the previous run')),
+                ('loans', models.PositiveIntegerField(help_text='Distinct borrower and book pairs read')),
+                ('books', models.PositiveIntegerField(help_text='Books whose similar books were computed')),
+                ('engine', models.CharField(max_length=10)),
+                ('started', models.DateTimeField()),
+                ('seconds', models.FloatField()),
+            ],
+            options={
+                'ordering': ['-id'],
+            },
+        ),
+        migrations.CreateModel(
+            name='SimilarBook',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('score', models.FloatField()),
+                ('borrowers', models.PositiveIntegerField(help_text='Borrowers who borrowed both books')),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='similar_books', to='catalog.Book')),
+                ('similar', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='catalog.Book')),
+            ],
+            options={
+                'ordering': ['book', 'rank'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='similarbook',
+            constraint=models.UniqueConstraint(fields=('book', 'rank'), name='similarbook_rank_unique'),
+        ),
+    ]
@@ -1,5 +1,6 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.utils import timezone
 from datetime import date
 
 import uuid # Required for unique book instances
@@ -32,8 +33,15 @@ class Author(models.Model):
     date_of_birth = models.DateField(null=True, blank=True)
     date_of_death = models.DateField('Died', null=True, blank=True)
 
+    # Version stamp of the row, used for the API's ETag and Last-Modified headers
+    modified = models.DateTimeField(auto_now=True)
+
     class Meta:
         ordering = [ 'last_name', 'first_name' ]
+        indexes = [
+            # AuthorsView lists authors in name order
+            models.Index(fields=['last_name', 'first_name'], name='author_name_idx'),
+        ]
 
     def get_absolute_url(self):
         """Returns the url to access a particular author instance."""
@@ -52,6 +60,37 @@ class Genre(models.Model):
         return self.name
 
 
+# Book counter field for each BookInstance status
+COPY_STATUS_COUNTERS = {
+    'a': 'copies_available',
+    'o': 'copies_on_loan',
+    'm': 'copies_maintenance',
+    'r': 'copies_reserved',
+}
+
+COPY_COUNTERS = ('copies_total',) + tuple(COPY_STATUS_COUNTERS.values())
+
+
+class BookQuerySet(models.QuerySet):
+    """QuerySet for books with helpers for the denormalized copy counters"""
+
+    def with_counted_copies(self):
+        """Annotate each book with copy counts computed from the BookInstance table."""
+        annotations = {'counted_copies_total': models.Count('bookinstance')}
+        for status, field in COPY_STATUS_COUNTERS.items():
+            annotations[f'counted_{field}'] = models.Count(
+                'bookinstance', filter=models.Q(bookinstance__status=status))
+        return self.annotate(**annotations)
+
+    def adjust_copy_counts(self, status, delta):
+        """Atomically add delta to the total and to the counter of the given status."""
+        changes = {'copies_total': models.F('copies_total') + delta, 'modified': timezone.now()}
+        field = COPY_STATUS_COUNTERS.get(status)
+        if field:
+            changes[field] = models.F(field) + delta
+        return self.update(**changes)
+
+
 class Book(models.Model):
     """Model representing a book (but not a specific copy of a book)"""
     title = models.CharField(max_length=200)
@@ -69,6 +108,30 @@ class Book(models.Model):
 
     language = models.ForeignKey(Language, on_delete=models.SET_NULL, null=True)
 
+    # Denormalized copy counters, kept up to date by the BookInstance signals
+    # (see catalog/signals.py) and rebuilt by the rebuild_copy_counts command
+    copies_total = models.PositiveIntegerField(default=0, editable=False)
+    copies_available = models.PositiveIntegerField(default=0, editable=False)
+    copies_on_loan = models.PositiveIntegerField(default=0, editable=False)
+    copies_maintenance = models.PositiveIntegerField(default=0, editable=False)
+    copies_reserved = models.PositiveIntegerField(default=0, editable=False)
+
+    # Version stamp of the row, also bumped when the copy counters change
+    modified = models.DateTimeField(auto_now=True)
+
+    objects = BookQuerySet.as_manager()
+
+    def save(self, *args, **kwargs):
+        # The copy counters are only written with F() updates: the values of
+        # an instance loaded before its copies changed would undo them
+        if not self._state.adding and not kwargs.get('force_insert') and kwargs.get('update_fields') is None:
+            deferred = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in COPY_COUNTERS and field.attname not in deferred
+            ]
+        super().save(*args, **kwargs)
+
     def __str__(self):
         """String for representing the Model object."""
         return self.title
@@ -79,18 +142,28 @@ class Book(models.Model):
 
     def display_genre(self):
         """Create a string for the Genre. This is required to display genre in Admin."""
-        return ', '.join(genre.name for genre in self.genre.all()[:3])
-        
-        display_genre.short_description = 'Genre'
+        # Slice the list rather than the queryset, so genres from prefetch_related() are used
+        return ', '.join(genre.name for genre in list(self.genre.all())[:3])
+
+    display_genre.short_description = 'Genre'
 
     class Meta:
         ordering = [ 'title' ]
+        indexes = [
+            # BookListView seeks on (title, id)
+            models.Index(fields=['title', 'id'], name='book_title_id_idx'),
+        ]
 
 
 class BookInstance(models.Model):
     """Model representing a specific copy of a book (i.e. that can be borrowed from the library)."""
 
-    id = models.UUIDField(primary_key=True, default=uuid.uuid4, help_text='Unique ID from this particular book instance')
+    # An integer primary key keeps this largest table, its indexes and the rows referencing it compact;
+    # the UUID identifies copies publicly (URLs, exports, the API, the batch loan form)
+    uuid = models.UUIDField(
+        'ID', unique=True, default=uuid.uuid4, editable=False,
+        help_text='Unique ID from this particular book instance',
+    )
     book = models.ForeignKey(Book, on_delete=models.SET_NULL, null=True)
     imprint = models.CharField(max_length=200)
     due_back = models.DateField(null=True, blank=True)
@@ -113,13 +186,32 @@ class BookInstance(models.Model):
         help_text='Book availability',
     )
 
+    # Version stamp of the row
+    modified = models.DateTimeField(auto_now=True)
+
     class Meta:
         ordering = [ 'due_back' ]
         permissions = (("can_mark_returned", "Set book as returned"),)
+        indexes = [
+            # Copies on loan in due date order (LibraryBooksListView)
+            models.Index(
+                fields=['due_back', 'id'],
+                name='bookinstance_on_loan_idx',
+                condition=models.Q(status='o'),
+            ),
+            # A user's copies on loan in due date order (LoanedBookByUserListView)
+            models.Index(
+                fields=['borrower', 'due_back', 'id'],
+                name='bookinstance_borrowed_idx',
+                condition=models.Q(status='o'),
+            ),
+            # Copies of a book by status (copy counters, book detail)
+            models.Index(fields=['book', 'status'], name='bookinstance_book_status_idx'),
+        ]
 
     def __str__(self):
         """String for representing the Model object."""
-        return f'{self.id} ({self.book.title})'
+        return f'{self.uuid} ({self.book.title})'
 
     @property
     def is_overdue(self):
@@ -128,4 +220,161 @@ class BookInstance(models.Model):
         return False
 
 
+class OverdueLoan(models.Model):
+    """A copy on loan past its due date, as found by the last overdue sweep."""
+    copy = models.OneToOneField(BookInstance, on_delete=models.CASCADE, primary_key=True, related_name='overdue')
+    book = models.ForeignKey(Book, on_delete=models.SET_NULL, null=True)
+    borrower = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
+    due_back = models.DateField()
+    days_overdue = models.PositiveIntegerField()
+
+    # Day the sweep computed days_overdue for
+    swept = models.DateField()
+
+    class Meta:
+        ordering = ['-days_overdue', 'copy']
+
+    def __str__(self):
+        return f'{self.copy_id} ({self.days_overdue} days overdue)'
+
+
+class BorrowerOverdue(models.Model):
+    """Rollup of a borrower's overdue loans, as found by the last overdue sweep."""
+    borrower = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='overdue_rollup')
+    loans = models.PositiveIntegerField()
+    max_days_overdue = models.PositiveIntegerField()
+    oldest_due_back = models.DateField()
+    swept = models.DateField()
+
+    class Meta:
+        ordering = ['-max_days_overdue', '-loans']
+        verbose_name_plural = 'borrower overdues'
+
+    def __str__(self):
+        return f'{self.borrower} ({self.loans} overdue)'
+
+
+class LoanEvent(models.Model):
+    """A check-out, return or renewal of a copy, written by catalog/loans.py whichever way the copy changed."""
+    CHECKED_OUT, RETURNED, RENEWED = 'c', 'r', 'n'
+    ACTIONS = (
+        (CHECKED_OUT, 'Checked out'),
+        (RETURNED, 'Returned'),
+        (RENEWED, 'Renewed'),
+    )
+
+    # The history outlives the copies and books it mentions
+    copy = models.ForeignKey(BookInstance, on_delete=models.SET_NULL, null=True, related_name='loan_events')
+    book = models.ForeignKey(Book, on_delete=models.SET_NULL, null=True)
+    borrower = models.ForeignKey(User, on_delete=models.CASCADE, related_name='loan_events')
+    action = models.CharField(max_length=1, choices=ACTIONS)
+
+    # Due date set by a check-out or renewal, or the one a return was due on
+    due_back = models.DateField(null=True, blank=True)
+    at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ['-at', '-id']
+        indexes = [
+            # A borrower's history, newest first, and its totals (BorrowerDashboardView)
+            models.Index(fields=['borrower', 'at', 'id'], name='loanevent_borrower_at_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.get_action_display()} {self.copy_id} by {self.borrower_id} at {self.at}'
+
+    @property
+    def returned_late(self):
+        return self.action == self.RETURNED and self.due_back is not None and self.at.date() > self.due_back
+
+
+class VisitCount(models.Model):
+    """Home page visits of a browser, flushed in bulk from the cache by catalog.stats.flush_visits()."""
+    visitor = models.CharField(max_length=32, primary_key=True)
+    visits = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f'{self.visitor} ({self.visits} visits)'
+
+
+FACETS = (
+    ('genre', 'Genre'),
+    ('language', 'Language'),
+    ('initial', 'Author'),
+    ('available', 'Availability'),
+)
+
+
+class BookFacetValue(models.Model):
+    """A facet value a book has, maintained by catalog.facets.refresh_books()."""
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='facet_values')
+    facet = models.CharField(max_length=10, choices=FACETS)
+    value = models.CharField(max_length=20)
+
+    class Meta:
+        constraints = [
+            # Also the index the refreshes read a book's values with
+            models.UniqueConstraint(fields=['book', 'facet', 'value'], name='bookfacetvalue_unique'),
+        ]
+        indexes = [
+            # The books having a value, for the filters of BookListView
+            models.Index(fields=['facet', 'value', 'book'], name='bookfacetvalue_books_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.book_id}: {self.facet}={self.value}'
+
 
+class BookFacet(models.Model):
+    """Number of books having a facet value, counted as catalog.facets.refresh_books() changes them."""
+    facet = models.CharField(max_length=10, choices=FACETS)
+    value = models.CharField(max_length=20)
+    # Denormalized name of the genre or language, so that the sidebar needs no join
+    label = models.CharField(max_length=200)
+    books = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['facet', 'label', 'value']
+        constraints = [
+            models.UniqueConstraint(fields=['facet', 'value'], name='bookfacet_unique'),
+        ]
+
+    def __str__(self):
+        return f'{self.facet}={self.label} ({self.books} books)'
+
+
+class SimilarBook(models.Model):
+    """A book borrowed by the borrowers of another, ranked by catalog.recommendations."""
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='similar_books')
+    similar = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='+')
+    rank = models.PositiveSmallIntegerField()
+    # Cosine similarity of the two books' sets of borrowers
+    score = models.FloatField()
+    borrowers = models.PositiveIntegerField(help_text='Borrowers who borrowed both books')
+
+    class Meta:
+        ordering = ['book', 'rank']
+        constraints = [
+            # Also the index BookDetailView reads a book's list with
+            models.UniqueConstraint(fields=['book', 'rank'], name='similarbook_rank_unique'),
+        ]
+
+    def __str__(self):
+        return f'{self.book_id} -> {self.similar_id} ({self.score:.3f})'
+
+
+class SimilarBooksRun(models.Model):
+    """A run of catalog.recommendations.refresh_similar_books(), up to the last loan event it read."""
+    last_event = models.IntegerField(help_text='Id of the last LoanEvent included')
+    full = models.BooleanField(help_text='Whether every loan was read, or only the loans since the previous run')
+    loans = models.PositiveIntegerField(help_text='Distinct borrower and book pairs read')
+    books = models.PositiveIntegerField(help_text='Books whose similar books were computed')
+    engine = models.CharField(max_length=10)
+    started = models.DateTimeField()
+    seconds = models.FloatField()
+
+    class Meta:
+        ordering = ['-id']
+
+    def __str__(self):
+        return f'{"Full" if self.full else "Incremental"} run up to event {self.last_event}'
@@ -0,0 +1,86 @@
+"""Precomputed overdue loans.
+
+sweep_overdue() finds the copies on loan past their due date with a single
+`due_back < today` query on the partial index of copies on loan, and stores
+them in OverdueLoan along with a per-borrower rollup in BorrowerOverdue. The
+sweep_overdue_loans command runs it and is meant to be scheduled daily;
+between sweeps the loan service forgets the loans it returns or renews.
+"""
+import datetime
+
+from django.db import transaction
+from django.db.models import Count, Max, Min
+
+from catalog.models import BookInstance, BorrowerOverdue, OverdueLoan
+
+# OverdueLoan rows written per bulk insert
+BATCH_SIZE = 500
+
+
+def overdue_copies(today):
+    """(id, book id, borrower id, due date) of the copies on loan due before today."""
+    return BookInstance.objects \
+        .filter(status__exact='o', due_back__lt=today) \
+        .order_by('due_back', 'id') \
+        .values_list('pk', 'book_id', 'borrower_id', 'due_back')
+
+
+def sweep_overdue(today=None):
+    """Replace the stored overdue loans by those overdue on today; return (loans, borrowers)."""
+    today = today or datetime.date.today()
+    copies = overdue_copies(today)
+
+    loans, rollup = 0, {}
+    with transaction.atomic():
+        OverdueLoan.objects.all().delete()
+        batch = []
+        for pk, book_id, borrower_id, due_back in copies.iterator(chunk_size=2000):
+            days = (today - due_back).days
+            batch.append(OverdueLoan(
+                copy_id=pk, book_id=book_id, borrower_id=borrower_id,
+                due_back=due_back, days_overdue=days, swept=today,
+            ))
+            if borrower_id is not None:
+                # Copies come in due date order, the first one of a borrower is the oldest
+                count, oldest = rollup.get(borrower_id, (0, due_back))
+                rollup[borrower_id] = (count + 1, oldest)
+            if len(batch) == BATCH_SIZE:
+                OverdueLoan.objects.bulk_create(batch)
+                loans += len(batch)
+                batch = []
+        OverdueLoan.objects.bulk_create(batch)
+        loans += len(batch)
+
+        BorrowerOverdue.objects.all().delete()
+        BorrowerOverdue.objects.bulk_create([
+            BorrowerOverdue(
+                borrower_id=borrower_id, loans=count, oldest_due_back=oldest,
+                max_days_overdue=(today - oldest).days, swept=today,
+            )
+            for borrower_id, (count, oldest) in rollup.items()
+        ])
+    return loans, len(rollup)
+
+
+def forget_loans(copy_ids):
+    """Drop stored overdue loans of copies no longer overdue and refresh their borrowers' rollups."""
+    loans = OverdueLoan.objects.filter(copy__in=copy_ids)
+    borrower_ids = set(loans.exclude(borrower=None).values_list('borrower_id', flat=True))
+    deleted, _ = loans.delete()
+    if not deleted or not borrower_ids:
+        return
+
+    remaining = OverdueLoan.objects \
+        .filter(borrower__in=borrower_ids) \
+        .values('borrower') \
+        .annotate(count=Count('pk'), oldest=Min('due_back'), max_days=Max('days_overdue'))
+    updated = {row['borrower']: row for row in remaining}
+    BorrowerOverdue.objects.filter(borrower__in=borrower_ids - set(updated)).delete()
+    for borrower_id, row in updated.items():
+        BorrowerOverdue.objects.filter(borrower=borrower_id).update(
+            loans=row['count'], oldest_due_back=row['oldest'], max_days_overdue=row['max_days'])
+
+
+def overdue_summary():
+    """Count of stored overdue loans and the day of the sweep that found them."""
+    return OverdueLoan.objects.aggregate(count=Count('pk'), swept=Max('swept'))
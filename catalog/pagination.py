@@ -0,0 +1,188 @@
+"""Keyset (seek) pagination for the catalog list views.
+
+Instead of OFFSET/LIMIT plus a COUNT(*), each page is fetched with a WHERE
+clause seeking past the last row of the previous page on the view's ordering
+columns, so any page costs the same single query as the first one.
+
+EstimatedCountPaginator keeps offset pages, for the admin, but takes the
+count of a large unfiltered table from the database statistics instead of
+scanning it with COUNT(*) on every page.
+"""
+import base64
+import json
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+from django.db.models import F, Q
+from django.http import Http404
+from django.utils.functional import cached_property
+
+from catalog.database import estimated_row_count
+
+
+def encode_cursor(values, direction):
+    """Encode the ordering values of a row into an opaque URL-safe cursor."""
+    data = json.dumps([direction, values], cls=DjangoJSONEncoder, separators=(',', ':'))
+    return base64.urlsafe_b64encode(data.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, size):
+    """Return (direction, values) of a cursor, raising ValueError if it is malformed."""
+    padded = cursor + '=' * (-len(cursor) % 4)
+    try:
+        direction, values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (TypeError, ValueError, UnicodeDecodeError):
+        raise ValueError('Malformed cursor')
+    if direction not in ('next', 'prev') or not isinstance(values, list) or len(values) != size:
+        raise ValueError('Malformed cursor')
+    return direction, values
+
+
+def _seek_filter(model, fields, values, forward):
+    """Build the WHERE clause selecting rows after (or before) the given values.
+
+    NULLs are sorted first, matching the ordering applied by the mixin.
+    """
+    condition = Q(pk__in=[])
+    equal = Q()
+    for field, value in zip(fields, values):
+        nullable = model._meta.get_field(field).null
+        if forward:
+            step = Q(**{f'{field}__isnull': False}) if value is None else Q(**{f'{field}__gt': value})
+        elif value is None:
+            step = Q(pk__in=[])
+        else:
+            step = Q(**{f'{field}__lt': value})
+            if nullable:
+                step |= Q(**{f'{field}__isnull': True})
+        condition |= equal & step
+        equal &= Q(**{f'{field}__isnull': True}) if value is None else Q(**{field: value})
+
+    # A redundant bound on the leading field lets the database seek an index
+    # range instead of evaluating the OR-ed terms over the whole index
+    field, value = fields[0], values[0]
+    if value is not None:
+        bound = Q(**{f'{field}__gte' if forward else f'{field}__lte': value})
+        if not forward and model._meta.get_field(field).null:
+            bound |= Q(**{f'{field}__isnull': True})
+        condition &= bound
+    return condition
+
+
+class KeysetPage:
+    """A page of results, with the cursors of its neighbouring pages."""
+    is_keyset = True
+
+    def __init__(self, object_list, fields, has_next, has_previous):
+        self.object_list = object_list
+        self._has_next = has_next
+        self._has_previous = has_previous
+        self.next_cursor = self._cursor(object_list[-1], fields, 'next') if has_next else None
+        self.previous_cursor = self._cursor(object_list[0], fields, 'prev') if has_previous else None
+
+    @staticmethod
+    def _cursor(obj, fields, direction):
+        return encode_cursor([getattr(obj, field) for field in fields], direction)
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+class KeysetPaginationMixin:
+    """Paginate a ListView by seeking on keyset_ordering instead of using offsets.
+
+    The last field of keyset_ordering must be unique (usually 'id') so that
+    every row has a distinct position.
+    """
+    keyset_ordering = ('id',)
+    cursor_kwarg = 'cursor'
+
+    def get_keyset_ordering(self):
+        return self.keyset_ordering
+
+    @staticmethod
+    def _ordering(queryset, fields, forward):
+        """Order on fields with NULLs first, so the ordering stays index friendly."""
+        # Backends sorting NULLs as the smallest value already put them first,
+        # explicit NULLS FIRST would only be emulated there with an extra sort key
+        nulls_largest = connections[queryset.db].features.nulls_order_largest
+        ordering = []
+        for field in fields:
+            if not (nulls_largest and queryset.model._meta.get_field(field).null):
+                ordering.append(field if forward else f'-{field}')
+            elif forward:
+                ordering.append(F(field).asc(nulls_first=True))
+            else:
+                ordering.append(F(field).desc(nulls_last=True))
+        return ordering
+
+    def get_keyset_queryset(self, queryset, values=None, forward=True):
+        """Order queryset on the keyset and seek past values (a row's ordering values)."""
+        fields = self.get_keyset_ordering()
+        queryset = queryset.order_by(*self._ordering(queryset, fields, forward))
+        if values is not None:
+            queryset = queryset.filter(_seek_filter(queryset.model, fields, values, forward))
+        return queryset
+
+    def paginate_queryset(self, queryset, page_size):
+        fields = self.get_keyset_ordering()
+        cursor = self.request.GET.get(self.cursor_kwarg)
+
+        direction, values = 'next', None
+        if cursor:
+            try:
+                direction, values = decode_cursor(cursor, len(fields))
+            except ValueError:
+                raise Http404('Invalid cursor.')
+        forward = direction == 'next'
+
+        try:
+            queryset = self.get_keyset_queryset(queryset, values, forward)
+        except (ValidationError, ValueError, TypeError):
+            raise Http404('Invalid cursor.')
+
+        # Fetch one extra row to know whether there is a page beyond this one
+        rows = list(queryset[:page_size + 1])
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+
+        if forward:
+            has_next, has_previous = has_more, values is not None
+        else:
+            rows.reverse()
+            has_next, has_previous = True, has_more
+
+        page = KeysetPage(rows, fields, has_next and bool(rows), has_previous and bool(rows))
+        return None, page, page.object_list, page.has_other_pages()
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator taking the count of unfiltered querysets from the table statistics.
+
+    The count is exact for filtered querysets, without statistics, and for
+    tables of up to CATALOG_ESTIMATED_COUNT_ABOVE rows.
+    """
+
+    @cached_property
+    def count(self):
+        query = getattr(self.object_list, 'query', None)
+        if query is not None and not query.where and not query.distinct and not query.is_sliced:
+            estimate = estimated_row_count(self.object_list.model, self.object_list.db)
+            if estimate is not None and estimate > getattr(settings, 'CATALOG_ESTIMATED_COUNT_ABOVE', 100000):
+                return estimate
+        return super().count
@@ -0,0 +1,201 @@
+"""Books borrowed together, computed from the loans.
+
+refresh_similar_books() reads the distinct (borrower, book) pairs of the
+check-outs recorded in LoanEvent, which every way of lending a copy writes,
+and of the copies on loan now: a sparse
+borrower by book matrix B. The co-borrowing matrix C = BᵀB counts, for any
+two books, the borrowers who borrowed both; divided by the square roots of
+the books' own borrower counts (its diagonal) it gives their cosine
+similarity. The CATALOG_SIMILAR_BOOKS best of each row are stored in
+SimilarBook, which BookDetailView reads with one indexed query.
+
+C is computed CHUNK_SIZE rows at a time, so memory is bounded by a chunk
+and not by the square of the catalog. SciPy's sparse products compute it
+when NumPy and SciPy are installed, a pure-Python loop over the same pairs
+otherwise.
+
+An incremental run only reads the check-outs after the last event of the
+previous run: the rows of C that changed are those of the books their
+borrowers borrowed, and only these are recomputed, from the pairs of every
+borrower of theirs. The lists of other books keep the scores they had
+against these books until the next full run.
+"""
+import math
+import time
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from catalog.caching import invalidate_pages
+from catalog.database import BATCH_SIZE, batches
+from catalog.models import BookInstance, LoanEvent, SimilarBook, SimilarBooksRun
+from catalog.routers import pin_to_primary
+
+try:
+    import numpy
+    from scipy import sparse
+except ImportError:
+    numpy = sparse = None
+
+# Rows of the co-borrowing matrix computed per sparse product
+CHUNK_SIZE = 1000
+
+
+def engines():
+    """Names of the engines available here, the fastest first."""
+    return ('scipy', 'python') if sparse is not None else ('python',)
+
+
+def similar_books(book_id):
+    """The stored similar books of a book, best first."""
+    return SimilarBook.objects.filter(book=book_id).select_related('similar__author').order_by('rank')
+
+
+def _pair_querysets():
+    # Unordered, the default orderings would break DISTINCT and UNION
+    checked_out = LoanEvent.objects.filter(action=LoanEvent.CHECKED_OUT, book__isnull=False).order_by()
+    on_loan = BookInstance.objects.filter(status='o', borrower__isnull=False, book__isnull=False).order_by()
+    return checked_out, on_loan
+
+
+def loan_pairs(borrower_ids=None):
+    """Yield the distinct (borrower id, book id) pairs of all loans, or of the loans of some borrowers."""
+    checked_out, on_loan = _pair_querysets()
+    for batch in [None] if borrower_ids is None else batches(borrower_ids):
+        events, copies = checked_out, on_loan
+        if batch is not None:
+            events, copies = events.filter(borrower_id__in=batch), copies.filter(borrower_id__in=batch)
+        # UNION drops the duplicates in the database
+        pairs = events.values_list('borrower_id', 'book_id') \
+            .union(copies.values_list('borrower_id', 'book_id'))
+        yield from pairs.iterator()
+
+
+def _borrowers_of(book_ids):
+    checked_out, on_loan = _pair_querysets()
+    borrowers = set()
+    for batch in batches(book_ids):
+        borrowers.update(checked_out.filter(book_id__in=batch).values_list('borrower_id', flat=True).distinct())
+        borrowers.update(on_loan.filter(book_id__in=batch).values_list('borrower_id', flat=True).distinct())
+    return borrowers
+
+
+def _ranked(candidates, limit):
+    """The limit best (similar id, score, borrowers) candidates, ties broken by book id."""
+    return sorted(candidates, key=lambda row: (-row[1], row[0]))[:limit]
+
+
+def _similar_python(pairs, book_ids, limit, min_borrowers):
+    borrowers_of = defaultdict(set)
+    books_of = defaultdict(set)
+    for borrower_id, book_id in pairs:
+        borrowers_of[book_id].add(borrower_id)
+        books_of[borrower_id].add(book_id)
+
+    for book_id in (borrowers_of if book_ids is None else book_ids):
+        borrowers = borrowers_of.get(book_id, ())
+        # The book's row of the co-borrowing matrix
+        together = Counter()
+        for borrower_id in borrowers:
+            together.update(books_of[borrower_id])
+        together.pop(book_id, None)
+        yield book_id, _ranked([
+            (other, count / math.sqrt(len(borrowers) * len(borrowers_of[other])), count)
+            for other, count in together.items() if count >= min_borrowers
+        ], limit)
+
+
+def _similar_scipy(pairs, book_ids, limit, min_borrowers):
+    pairs = numpy.array(list(pairs), dtype=numpy.int64).reshape(-1, 2)
+    borrower_keys, rows = numpy.unique(pairs[:, 0], return_inverse=True)
+    book_keys, columns = numpy.unique(pairs[:, 1], return_inverse=True)
+    matrix = sparse.csc_matrix(
+        (numpy.ones(len(pairs)), (rows, columns)), shape=(len(borrower_keys), len(book_keys)))
+    counts = numpy.asarray(matrix.sum(axis=0)).ravel()
+
+    if book_ids is None:
+        targets = numpy.arange(len(book_keys))
+    else:
+        wanted = numpy.array(sorted(book_ids), dtype=numpy.int64)
+        targets = numpy.searchsorted(book_keys, wanted)
+        known = (targets < len(book_keys)) & (book_keys[numpy.minimum(targets, len(book_keys) - 1)] == wanted)
+        # Books nobody borrows any more have no similar books
+        for book_id in wanted[~known]:
+            yield int(book_id), []
+        targets = targets[known]
+
+    for start in range(0, len(targets), CHUNK_SIZE):
+        chunk = targets[start:start + CHUNK_SIZE]
+        together = (matrix[:, chunk].T @ matrix).tocsr()
+        for row, column in enumerate(chunk):
+            others = together.indices[together.indptr[row]:together.indptr[row + 1]]
+            shared = together.data[together.indptr[row]:together.indptr[row + 1]]
+            keep = (others != column) & (shared >= min_borrowers)
+            others, shared = others[keep], shared[keep]
+            scores = shared / numpy.sqrt(counts[column] * counts[others])
+            best = numpy.lexsort((book_keys[others], -scores))[:limit]
+            yield int(book_keys[column]), [
+                (int(book_keys[others[i]]), float(scores[i]), int(shared[i])) for i in best
+            ]
+
+
+def _store(results, full):
+    """Replace the stored similar books of the books in results; return how many books they are."""
+    rows, book_ids = [], []
+    for book_id, similar in results:
+        book_ids.append(book_id)
+        rows.extend(
+            SimilarBook(book_id=book_id, similar_id=similar_id, rank=rank, score=score, borrowers=borrowers)
+            for rank, (similar_id, score, borrowers) in enumerate(similar, 1)
+        )
+    if full:
+        SimilarBook.objects.all().delete()
+    else:
+        for batch in batches(book_ids):
+            SimilarBook.objects.filter(book_id__in=batch).delete()
+    SimilarBook.objects.bulk_create(rows, batch_size=BATCH_SIZE)
+    return len(book_ids)
+
+
+@pin_to_primary()
+def refresh_similar_books(full=False, engine=None):
+    """Compute the similar books of every book, or of those changed by the loans since the last run.
+
+    Return the SimilarBooksRun recording the run.
+    """
+    engine = engine or engines()[0]
+    if engine not in engines():
+        raise ValueError(f'Unknown or unavailable engine {engine!r}, choose from {", ".join(engines())}.')
+    limit = getattr(settings, 'CATALOG_SIMILAR_BOOKS', 5)
+    min_borrowers = getattr(settings, 'CATALOG_SIMILAR_MIN_BORROWERS', 2)
+
+    started, clock = timezone.now(), time.monotonic()
+    previous = SimilarBooksRun.objects.first()
+    full = full or previous is None
+    # Loans recorded while this run reads are read again by the next one
+    last_event = LoanEvent.objects.aggregate(last=Max('id'))['last'] or 0
+
+    if full:
+        book_ids = None
+        pairs = list(loan_pairs())
+    else:
+        borrowers = LoanEvent.objects \
+            .filter(pk__gt=previous.last_event, pk__lte=last_event, action=LoanEvent.CHECKED_OUT) \
+            .order_by().values_list('borrower_id', flat=True).distinct()
+        book_ids = {book_id for _, book_id in loan_pairs(set(borrowers))}
+        pairs = list(loan_pairs(_borrowers_of(book_ids))) if book_ids else []
+
+    compute = _similar_scipy if engine == 'scipy' else _similar_python
+    results = compute(pairs, book_ids, limit, min_borrowers) if pairs else []
+    with transaction.atomic():
+        books = _store(list(results), full)
+        run = SimilarBooksRun.objects.create(
+            last_event=last_event, full=full, loans=len(pairs), books=books, engine=engine,
+            started=started, seconds=time.monotonic() - clock,
+        )
+    if books or full:
+        invalidate_pages()
+    return run
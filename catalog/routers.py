@@ -0,0 +1,86 @@
+"""Routing of catalog reads to read replicas.
+
+ReplicaRouter sends reads of catalog models to one of the database aliases
+listed in CATALOG_READ_REPLICAS and every write to the primary (default).
+Reads stay on the primary when they could miss recent writes: inside a
+transaction, after a write to the catalog in the same request or context,
+within pin_to_primary(), and for CATALOG_REPLICA_LAG seconds after a client
+wrote, through the cookie set by ReplicaPinningMiddleware.
+"""
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+PIN_COOKIE = 'catalog_primary'
+
+_pinned = ContextVar('catalog_pinned', default=False)
+_wrote = ContextVar('catalog_wrote', default=False)
+
+
+def read_replicas():
+    return getattr(settings, 'CATALOG_READ_REPLICAS', [])
+
+
+@contextmanager
+def pin_to_primary():
+    """Read from the primary within the block, or the decorated function."""
+    token = _pinned.set(True)
+    try:
+        yield
+    finally:
+        _pinned.reset(token)
+
+
+class ReplicaRouter:
+    """Read catalog models from a random replica unless fresh data is needed."""
+
+    def db_for_read(self, model, **hints):
+        replicas = read_replicas()
+        if model._meta.app_label != 'catalog' or not replicas:
+            return None
+        if _pinned.get() or _wrote.get() or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        if model._meta.app_label == 'catalog':
+            _wrote.set(True)
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *read_replicas()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema from the primary
+        if db in read_replicas():
+            return False
+        return None
+
+
+class ReplicaPinningMiddleware:
+    """Keep the reads of unsafe requests, and of clients that just wrote, on the primary."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        pinned = request.method not in ('GET', 'HEAD', 'OPTIONS') or PIN_COOKIE in request.COOKIES
+        pinned_token = _pinned.set(pinned)
+        wrote_token = _wrote.set(False)
+        try:
+            response = self.get_response(request)
+            wrote = _wrote.get()
+        finally:
+            _pinned.reset(pinned_token)
+            _wrote.reset(wrote_token)
+
+        if wrote and read_replicas():
+            # The replicas may lag behind the write, read this client's next requests from the primary
+            response.set_cookie(PIN_COOKIE, '1', max_age=getattr(settings, 'CATALOG_REPLICA_LAG', 5), httponly=True)
+        return response
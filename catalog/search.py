@@ -0,0 +1,121 @@
+"""Full-text search over the catalog, backed by an SQLite FTS5 table.
+
+The catalog_book_fts table holds one row per book (rowid = book id) with the
+title, summary, ISBN and author name. It is kept in sync by the signal
+handlers in catalog/signals.py and rebuilt by the rebuild_search_index
+command. Other database backends fall back to icontains lookups.
+"""
+import re
+
+from django.db import connection
+from django.db.models import Q
+
+from catalog.database import batches
+from catalog.models import Book
+
+SEARCH_TABLE = 'catalog_book_fts'
+
+# Column weights for bm25 ranking: title, summary, isbn, author
+SEARCH_WEIGHTS = (10.0, 1.0, 5.0, 5.0)
+
+_TERM_RE = re.compile(r'\w+', re.UNICODE)
+
+_INDEX_SQL = (
+    f'INSERT INTO {SEARCH_TABLE} (rowid, title, summary, isbn, author) '
+    f'SELECT book.id, book.title, book.summary, book.isbn, '
+    f"COALESCE(author.first_name || ' ' || author.last_name, '') "
+    f'FROM catalog_book AS book LEFT JOIN catalog_author AS author ON author.id = book.author_id'
+)
+
+
+def search_enabled():
+    return connection.vendor == 'sqlite'
+
+
+def to_match_expression(query):
+    """Turn free user input into an FTS5 query matching every term as a prefix."""
+    terms = _TERM_RE.findall(query)
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def _placeholders(batch):
+    return ', '.join(['%s'] * len(batch))
+
+
+def index_books(book_ids):
+    """(Re)index the given books from their current database rows."""
+    if not search_enabled():
+        return
+    with connection.cursor() as cursor:
+        for batch in batches(book_ids):
+            cursor.execute(f'DELETE FROM {SEARCH_TABLE} WHERE rowid IN ({_placeholders(batch)})', batch)
+            cursor.execute(f'{_INDEX_SQL} WHERE book.id IN ({_placeholders(batch)})', batch)
+
+
+def remove_books(book_ids):
+    if not search_enabled():
+        return
+    with connection.cursor() as cursor:
+        for batch in batches(book_ids):
+            cursor.execute(f'DELETE FROM {SEARCH_TABLE} WHERE rowid IN ({_placeholders(batch)})', batch)
+
+
+def rebuild_index():
+    """Rebuild the whole search table from the catalog and return the number of books indexed."""
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {SEARCH_TABLE}')
+        cursor.execute(_INDEX_SQL)
+        indexed = cursor.rowcount
+        cursor.execute(f"INSERT INTO {SEARCH_TABLE} ({SEARCH_TABLE}) VALUES ('optimize')")
+    return indexed
+
+
+class SearchResults:
+    """Lazy, sliceable ranked search results, suitable for Django's Paginator."""
+
+    def __init__(self, query):
+        self.query = query
+        self.expression = to_match_expression(query)
+
+    def _fallback_queryset(self):
+        condition = Q()
+        for term in _TERM_RE.findall(self.query):
+            condition &= (
+                Q(title__icontains=term) | Q(summary__icontains=term) | Q(isbn__icontains=term)
+                | Q(author__first_name__icontains=term) | Q(author__last_name__icontains=term)
+            )
+        return Book.objects.filter(condition).select_related('author')
+
+    def count(self):
+        if not self.expression:
+            return 0
+        if not search_enabled():
+            return self._fallback_queryset().count()
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT COUNT(*) FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s', [self.expression])
+            return cursor.fetchone()[0]
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        start, stop = index.start or 0, index.stop
+        if not self.expression or (stop is not None and stop <= start):
+            return []
+        if not search_enabled():
+            return list(self._fallback_queryset()[index])
+
+        weights = ', '.join(str(weight) for weight in SEARCH_WEIGHTS)
+        limit = -1 if stop is None else stop - start
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s '
+                f'ORDER BY bm25({SEARCH_TABLE}, {weights}) LIMIT %s OFFSET %s',
+                [self.expression, limit, start],
+            )
+            ids = [row[0] for row in cursor.fetchall()]
+
+        books = Book.objects.select_related('author').in_bulk(ids)
+        return [books[pk] for pk in ids if pk in books]
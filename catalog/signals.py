@@ -0,0 +1,239 @@
+"""Signal handlers keeping denormalized catalog data in sync with its sources."""
+from django.core.signals import request_finished
+from django.db.models import DEFERRED
+from django.db.models.signals import m2m_changed, post_delete, post_init, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from catalog import api, facets, loans, search
+from catalog.caching import invalidate_pages
+from catalog.models import Author, Book, BookInstance, Genre, Language, LoanEvent
+from catalog.stats import flush_visits_if_due, invalidate_home_stats
+
+
+# What a save of a copy compares with its previous state: the book and status
+# for the copy counters, the borrower and due date for the loan history too
+COPY_STATE_FIELDS = ('book_id', 'status', 'borrower_id', 'due_back')
+
+
+def _remember_copy_state(instance):
+    """Store the book, status, borrower and due date the instance currently has in the database."""
+    # Read the instance dict, touching a deferred field would load it
+    instance._saved_copy_state = tuple(instance.__dict__.get(field, DEFERRED) for field in COPY_STATE_FIELDS)
+
+
+@receiver(post_init, sender=BookInstance)
+def track_copy_state(sender, instance, **kwargs):
+    _remember_copy_state(instance)
+
+
+@receiver(pre_save, sender=BookInstance)
+@receiver(pre_delete, sender=BookInstance)
+def load_deferred_copy_state(sender, instance, **kwargs):
+    # Instances loaded with only()/defer() don't know their saved state yet
+    if DEFERRED in instance._saved_copy_state and not instance._state.adding:
+        instance._saved_copy_state = BookInstance.objects.filter(pk=instance.pk) \
+            .values_list(*COPY_STATE_FIELDS).first() or (None,) * len(COPY_STATE_FIELDS)
+
+
+# Before update_copy_counts_on_save, which stores the new state of the copy
+@receiver(post_save, sender=BookInstance)
+def record_loan_events_on_save(sender, instance, created, raw=False, **kwargs):
+    # Loans made by editing a copy, in the admin for one, bypass the operations of catalog/loans.py
+    if not raw:
+        LoanEvent.objects.bulk_create(loans.saved_loan_events(instance, None if created else instance._saved_copy_state))
+
+
+@receiver(post_save, sender=BookInstance)
+def update_copy_counts_on_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+
+    # A freshly inserted row has no previous state to take counts away from
+    old_state = None if created else instance._saved_copy_state[:2]
+    new_state = (instance.book_id, instance.status)
+
+    if old_state != new_state:
+        if old_state and old_state[0]:
+            Book.objects.filter(pk=old_state[0]).adjust_copy_counts(old_state[1], -1)
+        if new_state[0]:
+            Book.objects.filter(pk=new_state[0]).adjust_copy_counts(new_state[1], 1)
+    elif new_state[0]:
+        # The book's stamp versions the cached fragment listing its copies
+        Book.objects.filter(pk=new_state[0]).update(modified=timezone.now())
+
+    book_ids = {new_state[0], old_state and old_state[0]} - {None}
+    if old_state != new_state:
+        # The books may have become available, or run out of copies
+        facets.refresh_books(book_ids)
+    api.invalidate_copy_stamps(book_ids, counts_changed=old_state != new_state)
+    _remember_copy_state(instance)
+
+
+@receiver(post_delete, sender=BookInstance)
+def update_copy_counts_on_delete(sender, instance, **kwargs):
+    book_id, status = instance._saved_copy_state[:2]
+    if book_id:
+        Book.objects.filter(pk=book_id).adjust_copy_counts(status, -1)
+        facets.refresh_books([book_id])
+        api.invalidate_copy_stamps({book_id}, counts_changed=True)
+
+
+@receiver(post_save, sender=Book)
+@receiver(post_save, sender=Author)
+@receiver(post_save, sender=BookInstance)
+@receiver(post_delete, sender=Book)
+@receiver(post_delete, sender=Author)
+@receiver(post_delete, sender=BookInstance)
+def invalidate_home_stats_on_change(sender, **kwargs):
+    invalidate_home_stats()
+
+
+@receiver(post_save, sender=Book)
+@receiver(post_save, sender=Author)
+@receiver(post_save, sender=BookInstance)
+@receiver(post_save, sender=Genre)
+@receiver(post_save, sender=Language)
+@receiver(post_delete, sender=Book)
+@receiver(post_delete, sender=Author)
+@receiver(post_delete, sender=BookInstance)
+@receiver(post_delete, sender=Genre)
+@receiver(post_delete, sender=Language)
+def invalidate_pages_on_change(sender, **kwargs):
+    invalidate_pages()
+
+
+@receiver(post_save, sender=Book)
+def index_book(sender, instance, raw=False, **kwargs):
+    if not raw:
+        search.index_books([instance.pk])
+
+
+@receiver(post_delete, sender=Book)
+def unindex_book(sender, instance, **kwargs):
+    search.remove_books([instance.pk])
+
+
+@receiver(post_save, sender=Author)
+def index_author_books(sender, instance, raw=False, **kwargs):
+    if not raw:
+        search.index_books(instance.book_set.values_list('pk', flat=True))
+
+
+@receiver(pre_delete, sender=Author)
+def remember_author_books(sender, instance, **kwargs):
+    # The books lose their author once it's deleted, remember them to reindex
+    instance._book_ids = list(instance.book_set.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Author)
+def reindex_author_books(sender, instance, **kwargs):
+    search.index_books(getattr(instance, '_book_ids', []))
+
+
+@receiver(post_save, sender=Book)
+def refresh_book_facets(sender, instance, raw=False, **kwargs):
+    if not raw:
+        facets.refresh_books([instance.pk])
+
+
+@receiver(pre_delete, sender=Book)
+def remove_book_facets(sender, instance, **kwargs):
+    facets.remove_books([instance.pk])
+
+
+@receiver(post_save, sender=Author)
+def refresh_author_book_facets(sender, instance, raw=False, **kwargs):
+    # The last name gives the initial of every book of the author
+    if not raw:
+        facets.refresh_books(instance.book_set.values_list('pk', flat=True))
+
+
+@receiver(pre_delete, sender=Genre)
+@receiver(pre_delete, sender=Language)
+def remember_facet_books(sender, instance, **kwargs):
+    # Deleting a genre or language changes its books without sending their signals
+    instance._book_ids = list(instance.book_set.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Author)
+@receiver(post_delete, sender=Genre)
+@receiver(post_delete, sender=Language)
+def refresh_facets_of_remembered_books(sender, instance, **kwargs):
+    facets.refresh_books(getattr(instance, '_book_ids', []))
+
+
+@receiver(post_save, sender=Genre)
+def rename_genre_facet(sender, instance, raw=False, **kwargs):
+    if not raw:
+        facets.rename_value('genre', instance.pk, instance.name)
+
+
+@receiver(post_save, sender=Language)
+def rename_language_facet(sender, instance, raw=False, **kwargs):
+    if not raw:
+        facets.rename_value('language', instance.pk, instance.name)
+
+
+@receiver(post_init, sender=Book)
+def track_book_author(sender, instance, **kwargs):
+    instance._saved_author_id = instance.__dict__.get('author_id', DEFERRED)
+
+
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+def invalidate_book_stamps(sender, instance, **kwargs):
+    if instance._saved_author_id is DEFERRED:
+        # The previous author is unknown, forget every stamp
+        api.bump_generation()
+    author_ids = {instance.author_id, instance._saved_author_id} - {None, DEFERRED}
+    api.invalidate_stamps(
+        ('book', instance.pk), ('books', ''), ('authors', ''),
+        *[('author', author_id) for author_id in author_ids],
+    )
+    instance._saved_author_id = instance.author_id
+
+
+@receiver(m2m_changed, sender=Book.genre.through)
+def refresh_facets_on_genre_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear' and reverse:
+        # The books of a cleared genre are only known before it's cleared
+        instance._cleared_book_ids = list(instance.book_set.values_list('pk', flat=True))
+    elif action in ('post_add', 'post_remove'):
+        facets.refresh_books(pk_set if reverse else [instance.pk])
+    elif action == 'post_clear':
+        facets.refresh_books(getattr(instance, '_cleared_book_ids', []) if reverse else [instance.pk])
+
+
+@receiver(m2m_changed, sender=Book.genre.through)
+def touch_books_on_genre_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    invalidate_pages()
+    if not reverse:
+        book_ids = {instance.pk}
+    elif pk_set:
+        book_ids = pk_set
+    else:
+        # A cleared genre doesn't say which books it had, start over
+        api.bump_generation()
+        return
+    Book.objects.filter(pk__in=book_ids).update(modified=timezone.now())
+    api.invalidate_stamps(('books', ''), *[('book', book_id) for book_id in book_ids])
+
+
+@receiver(post_save, sender=Author)
+@receiver(post_save, sender=Genre)
+@receiver(post_save, sender=Language)
+@receiver(post_delete, sender=Author)
+@receiver(post_delete, sender=Genre)
+@receiver(post_delete, sender=Language)
+def bump_api_generation(sender, **kwargs):
+    # Names of authors, genres and languages are embedded in many representations
+    api.bump_generation()
+
+
+@receiver(request_finished)
+def flush_visits_periodically(sender, **kwargs):
+    # After the response is sent, so that no request waits for the writes
+    flush_visits_if_due()
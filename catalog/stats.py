@@ -0,0 +1,180 @@
+"""Cached statistics and the visit counter of the catalog home page."""
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import F
+
+from catalog.caching import increment
+from catalog.database import reserve_write_lock
+from catalog.models import Author, Book, VisitCount
+
+HOME_STATS_CACHE_KEY = 'catalog:home-stats'
+HOME_STATS_TIMEOUT = getattr(settings, 'CATALOG_HOME_STATS_TIMEOUT', 60 * 60)
+
+# Visits counted in the cache and not yet flushed, by visitor
+VISITS_CACHE_KEY = 'catalog:visits:pending:{}'
+# Flushed visits, by visitor, cached to spare the home page a query
+SAVED_VISITS_CACHE_KEY = 'catalog:visits:saved:{}'
+SAVED_VISITS_TIMEOUT = 60 * 60
+# Queue of the visitors with pending visits: entries numbered from start (exclusive) to end
+VISITS_QUEUE_KEY = 'catalog:visits:queue:{}'
+VISITS_QUEUE_START_KEY = 'catalog:visits:queue-start'
+VISITS_QUEUE_END_KEY = 'catalog:visits:queue-end'
+# Position of the queue entry of a visitor, to find the entries the cache evicted
+VISITS_QUEUED_KEY = 'catalog:visits:queued:{}'
+# Held while visits are flushed; it expires in case the flush dies with it
+VISITS_FLUSH_LOCK_KEY = 'catalog:visits:flush-lock'
+VISITS_FLUSH_LOCK_TIMEOUT = 5 * 60
+# Present for CATALOG_VISITS_FLUSH_INTERVAL seconds after a flush after a response
+VISITS_FLUSHED_KEY = 'catalog:visits:flushed'
+
+VISITOR_COOKIE = 'catalog_visitor'
+VISITOR_COOKIE_MAX_AGE = 365 * 24 * 60 * 60
+
+
+def compute_home_stats():
+    """Count books, copies, available copies and authors in a single query."""
+    book_table = connection.ops.quote_name(Book._meta.db_table)
+    author_table = connection.ops.quote_name(Author._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT (SELECT COUNT(*) FROM {book_table}), '
+            f'(SELECT COALESCE(SUM(copies_total), 0) FROM {book_table}), '
+            f'(SELECT COALESCE(SUM(copies_available), 0) FROM {book_table}), '
+            f'(SELECT COUNT(*) FROM {author_table})'
+        )
+        num_books, num_instances, num_instances_available, num_authors = cursor.fetchone()
+
+    return {
+        'num_books': num_books,
+        'num_instances': num_instances,
+        'num_instances_available': num_instances_available,
+        'num_authors': num_authors,
+    }
+
+
+def get_home_stats():
+    """Return the home page counts, computing them only when the cache is cold."""
+    stats = cache.get(HOME_STATS_CACHE_KEY)
+    if stats is None:
+        stats = compute_home_stats()
+        cache.set(HOME_STATS_CACHE_KEY, stats, HOME_STATS_TIMEOUT)
+    return stats
+
+
+def invalidate_home_stats():
+    cache.delete(HOME_STATS_CACHE_KEY)
+
+
+def _enqueue(visitor):
+    position = increment(VISITS_QUEUE_END_KEY)
+    cache.set_many({VISITS_QUEUE_KEY.format(position): visitor, VISITS_QUEUED_KEY.format(visitor): position}, None)
+
+
+def _ensure_queued(visitor):
+    """Queue the visitor again if the cache evicted its queue entry."""
+    position = cache.get(VISITS_QUEUED_KEY.format(visitor))
+    if position is None or cache.get(VISITS_QUEUE_KEY.format(position)) != visitor:
+        _enqueue(visitor)
+
+
+def saved_visits(visitor):
+    visits = cache.get(SAVED_VISITS_CACHE_KEY.format(visitor))
+    if visits is None:
+        visits = VisitCount.objects.filter(pk=visitor).values_list('visits', flat=True).first() or 0
+        cache.set(SAVED_VISITS_CACHE_KEY.format(visitor), visits, SAVED_VISITS_TIMEOUT)
+    return visits
+
+
+def count_visit(request):
+    """Count a home page visit and return the number of previous visits.
+
+    The visitor is identified by a signed cookie rather than the session, so
+    that counting doesn't save the session, and the visit is counted in the
+    cache: the request writes nothing to the database. flush_visits() writes
+    the counts in bulk later. New visitors get their cookie from
+    remember_visitor().
+    """
+    visitor = request.get_signed_cookie(VISITOR_COOKIE, default=None, salt=VISITOR_COOKIE)
+    if visitor is None:
+        visitor = request.new_visitor = uuid.uuid4().hex
+        saved = 0
+    else:
+        saved = saved_visits(visitor)
+
+    pending = increment(VISITS_CACHE_KEY.format(visitor))
+    if pending == 1:
+        # First visit since the last flush, queue the visitor for the next one
+        _enqueue(visitor)
+    else:
+        # The queue entries never expire, but a bounded cache may still evict them
+        _ensure_queued(visitor)
+    return saved + pending - 1
+
+
+def remember_visitor(request, response):
+    """Give the visitor counted by count_visit() a cookie if it is new."""
+    visitor = getattr(request, 'new_visitor', None)
+    if visitor:
+        response.set_signed_cookie(
+            VISITOR_COOKIE, visitor, salt=VISITOR_COOKIE, max_age=VISITOR_COOKIE_MAX_AGE, httponly=True)
+    return response
+
+
+def flush_visits():
+    """Write the visits counted in the cache to VisitCount in bulk and return the number of visitors.
+
+    Nothing is flushed, and 0 returned, while another flush holds the lock:
+    two flushes reading the same counts would write them twice.
+    """
+    if not cache.add(VISITS_FLUSH_LOCK_KEY, 1, VISITS_FLUSH_LOCK_TIMEOUT):
+        return 0
+    try:
+        return _flush_visits()
+    finally:
+        cache.delete(VISITS_FLUSH_LOCK_KEY)
+
+
+def _flush_visits():
+    start = cache.get(VISITS_QUEUE_START_KEY, 0)
+    end = cache.get(VISITS_QUEUE_END_KEY, 0)
+    if end <= start:
+        return 0
+    queue_keys = [VISITS_QUEUE_KEY.format(position) for position in range(start + 1, end + 1)]
+    queued = set(cache.get_many(queue_keys).values())
+    pending_keys = {visitor: VISITS_CACHE_KEY.format(visitor) for visitor in queued}
+    pending = cache.get_many(list(pending_keys.values()))
+    counts = {visitor: pending[key] for visitor, key in pending_keys.items() if pending.get(key)}
+
+    with transaction.atomic():
+        reserve_write_lock(VisitCount)
+        existing = VisitCount.objects.in_bulk(list(counts))
+        for visitor, visit_count in existing.items():
+            visit_count.visits = F('visits') + counts[visitor]
+        VisitCount.objects.bulk_update(existing.values(), ['visits'])
+        VisitCount.objects.bulk_create(
+            [VisitCount(visitor=visitor, visits=count) for visitor, count in counts.items() if visitor not in existing])
+
+    cache.delete_many(
+        queue_keys
+        + [VISITS_QUEUED_KEY.format(visitor) for visitor in queued]
+        + [SAVED_VISITS_CACHE_KEY.format(visitor) for visitor in counts])
+    cache.set(VISITS_QUEUE_START_KEY, end, None)
+    for visitor, count in counts.items():
+        try:
+            left = cache.decr(pending_keys[visitor], count)
+        except ValueError:
+            continue
+        if left:
+            # Visits counted since the counts were read stay pending, for the next flush
+            _enqueue(visitor)
+    return len(counts)
+
+
+def flush_visits_if_due():
+    """Flush the visits at most once per CATALOG_VISITS_FLUSH_INTERVAL among the processes sharing the cache."""
+    interval = getattr(settings, 'CATALOG_VISITS_FLUSH_INTERVAL', None)
+    if interval and cache.add(VISITS_FLUSHED_KEY, 1, interval):
+        flush_visits()
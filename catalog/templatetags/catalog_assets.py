@@ -0,0 +1,11 @@
+from django import template
+
+from catalog import assets
+
+register = template.Library()
+
+
+@register.simple_tag
+def bundle_url(name):
+    """URL of a built static bundle, or None before build_assets has run."""
+    return assets.bundle_url(name)
@@ -1,3 +1,1296 @@
-from django.test import TestCase
+import contextvars
+import csv
+import datetime
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import uuid
+from io import StringIO
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import Permission, User
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.management import CommandError, call_command
+from django.db import connection, connections, reset_queries
+from django.db.models import Sum
+from django.templatetags.static import static
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils.formats import date_format
+
+from catalog.assets import load_manifest, minify_css
+from catalog.benchmark import (
+    benchmark_copy_keys, benchmark_sqlite_concurrency, benchmark_views, compare_concurrency, compare_to_baseline,
+    seed_catalog,
+)
+from catalog.middleware import ViewBudgetExceeded, get_view_stats, reset_view_stats
+from catalog.caching import BoundedLocMemCache
+from catalog.concurrent import fetch_concurrently
+from catalog.database import estimated_row_count
+from catalog.loans import check_out_copies, renew_copies, return_copies
+from catalog.models import (
+    Author, Book, BookFacet, BookInstance, BorrowerOverdue, Genre, Language, LoanEvent, OverdueLoan, SimilarBook,
+    VisitCount,
+)
+from catalog.pagination import EstimatedCountPaginator
+from catalog.recommendations import engines, refresh_similar_books
+from catalog.routers import PIN_COOKIE, ReplicaRouter
+from catalog.search import SearchResults
+from catalog.stats import (
+    VISITS_FLUSH_LOCK_KEY, VISITS_QUEUE_END_KEY, VISITS_QUEUE_KEY, flush_visits, get_home_stats,
+)
+
+
+def capture_queries():
+    """Capture the queries of a block, starting from an empty query log.
+
+    The log is cleared by the request_started signal, which would otherwise
+    confuse a capture started while it still holds earlier queries.
+    """
+    reset_queries()
+    return CaptureQueriesContext(connection)
+
+
+def create_book(author, title='Book', language=None, genres=(), copies=0):
+    """Create a book with the given genres and number of available copies."""
+    book = Book.objects.create(
+        title=title,
+        author=author,
+        summary='Summary',
+        isbn='1234567890123',
+        language=language,
+    )
+    book.genre.set(genres)
+    for i in range(copies):
+        BookInstance.objects.create(book=book, imprint=f'Imprint {i}', status='a')
+    return book
+
+
+class DetailViewQueryCountTest(TestCase):
+    """The detail pages must cost the same number of queries however much data they show."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.language = Language.objects.create(name='English')
+        cls.genres = [Genre.objects.create(name=f'Genre {i}') for i in range(3)]
+        cls.author = Author.objects.create(first_name='John', last_name='Smith')
+
+    def add_books(self, count, copies):
+        return [
+            create_book(self.author, f'Book {i}', self.language, self.genres, copies)
+            for i in range(count)
+        ]
+
+    def count_queries(self, url):
+        """Return the number of queries needed to render url."""
+        with capture_queries() as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_author_detail_query_count_is_constant(self):
+        self.add_books(1, copies=1)
+        url = reverse('author-detail', args=[self.author.pk])
+        baseline = self.count_queries(url)
+
+        self.add_books(10, copies=5)
+        self.assertEqual(self.count_queries(url), baseline)
+        response = self.client.get(url)
+        self.assertContains(response, 'Book 9')
+
+    def test_book_detail_query_count_is_constant(self):
+        book = self.add_books(1, copies=1)[0]
+        url = reverse('book-detail', args=[book.pk])
+        baseline = self.count_queries(url)
+
+        for i in range(20):
+            BookInstance.objects.create(book=book, imprint=f'Extra {i}', status='o')
+        self.assertEqual(self.count_queries(url), baseline)
+        response = self.client.get(url)
+        self.assertContains(response, 'Extra 19')
+        self.assertContains(response, 'Genre 2')
+
+
+class CopyCountersTest(TestCase):
+    """The denormalized copy counters on Book follow every BookInstance change."""
+
+    def setUp(self):
+        self.author = Author.objects.create(first_name='John', last_name='Smith')
+        self.book = create_book(self.author, 'First')
+        self.other_book = create_book(self.author, 'Second')
+
+    def assertCounts(self, book, **expected):
+        book.refresh_from_db()
+        for field, value in expected.items():
+            self.assertEqual(getattr(book, field), value, field)
+
+    def test_create_update_and_delete(self):
+        copy = BookInstance.objects.create(book=self.book, imprint='A', status='a')
+        BookInstance.objects.create(book=self.book, imprint='B', status='m')
+        self.assertCounts(self.book, copies_total=2, copies_available=1, copies_maintenance=1)
+
+        copy.status = 'o'
+        copy.save()
+        self.assertCounts(self.book, copies_total=2, copies_available=0, copies_on_loan=1)
+
+        copy = BookInstance.objects.get(pk=copy.pk)
+        copy.book = self.other_book
+        copy.status = 'r'
+        copy.save()
+        self.assertCounts(self.book, copies_total=1, copies_on_loan=0)
+        self.assertCounts(self.other_book, copies_total=1, copies_reserved=1)
+
+        copy.delete()
+        self.assertCounts(self.other_book, copies_total=0, copies_reserved=0)
+
+    def test_deferred_instances(self):
+        BookInstance.objects.create(book=self.book, imprint='A', status='a')
+        copy = BookInstance.objects.only('imprint').get()
+        copy.status = 'o'
+        copy.save()
+        self.assertCounts(self.book, copies_total=1, copies_available=0, copies_on_loan=1)
+
+        BookInstance.objects.only('pk').get().delete()
+        self.assertCounts(self.book, copies_total=0, copies_on_loan=0)
+
+    def test_saving_a_stale_book_keeps_the_counters(self):
+        stale = Book.objects.get(pk=self.book.pk)
+        BookInstance.objects.create(book=self.book, imprint='A', status='a')
+        BookInstance.objects.create(book=self.book, imprint='B', status='a')
+
+        stale.title = 'Renamed'
+        stale.save()
+        self.assertCounts(self.book, title='Renamed', copies_total=2, copies_available=2)
+
+    def test_rebuild_command_fixes_drift(self):
+        BookInstance.objects.create(book=self.book, imprint='A', status='a')
+        Book.objects.filter(pk=self.book.pk).update(copies_total=7, copies_available=0)
+
+        out = StringIO()
+        call_command('rebuild_copy_counts', '--dry-run', stdout=out)
+        self.assertIn('found 1', out.getvalue())
+        self.assertCounts(self.book, copies_total=7)
+
+        call_command('rebuild_copy_counts', stdout=StringIO())
+        self.assertCounts(self.book, copies_total=1, copies_available=1)
+
+
+class HomeStatsTest(TestCase):
+    """The home page counts are cached and invalidated when the catalog changes."""
+
+    def setUp(self):
+        cache.clear()
+        self.author = Author.objects.create(first_name='John', last_name='Smith')
+        create_book(self.author, 'First', copies=2)
+
+    def test_stats_are_computed_in_one_query_and_cached(self):
+        with self.assertNumQueries(1):
+            stats = get_home_stats()
+        self.assertEqual(stats, {
+            'num_books': 1,
+            'num_instances': 2,
+            'num_instances_available': 2,
+            'num_authors': 1,
+        })
+        with self.assertNumQueries(0):
+            get_home_stats()
+
+    def test_changes_invalidate_the_cache(self):
+        get_home_stats()
+        create_book(self.author, 'Second', copies=1)
+        self.assertEqual(get_home_stats()['num_instances'], 3)
+
+        Author.objects.create(first_name='Jane', last_name='Doe')
+        self.assertEqual(get_home_stats()['num_authors'], 2)
+
+    @override_settings(CATALOG_VISITS_FLUSH_INTERVAL=None)
+    def test_visits_are_counted_without_writes_and_flushed_in_bulk(self):
+        get_home_stats()
+        for visit in range(3):
+            with capture_queries() as queries:
+                response = self.client.get(reverse('index'))
+            self.assertEqual(response.context['num_visits'], visit)
+            self.assertEqual([query['sql'] for query in queries if not query['sql'].startswith('SELECT')], [])
+        self.assertFalse(VisitCount.objects.exists())
+
+        self.client_class().get(reverse('index'))
+        self.assertEqual(flush_visits(), 2)
+        self.assertEqual(sorted(VisitCount.objects.values_list('visits', flat=True)), [1, 3])
+
+        self.assertEqual(self.client.get(reverse('index')).context['num_visits'], 3)
+        self.assertEqual(flush_visits(), 1)
+        self.assertEqual(flush_visits(), 0)
+        self.assertEqual(sorted(VisitCount.objects.values_list('visits', flat=True)), [1, 4])
+        self.assertEqual(self.client.get(reverse('index')).context['num_visits'], 4)
+
+    @override_settings(CATALOG_VISITS_FLUSH_INTERVAL=None)
+    def test_evicted_queue_entries_and_concurrent_flushes(self):
+        self.client.get(reverse('index'))
+        # The cache evicts the queue entry of the visitor, whose next visit queues it again
+        cache.delete(VISITS_QUEUE_KEY.format(cache.get(VISITS_QUEUE_END_KEY)))
+        self.client.get(reverse('index'))
+
+        cache.add(VISITS_FLUSH_LOCK_KEY, 1)
+        self.assertEqual(flush_visits(), 0)
+        cache.delete(VISITS_FLUSH_LOCK_KEY)
+        self.assertEqual(flush_visits(), 1)
+        self.assertEqual(list(VisitCount.objects.values_list('visits', flat=True)), [2])
+
+    @override_settings(CATALOG_VISITS_FLUSH_INTERVAL=60)
+    def test_visits_are_flushed_after_the_response(self):
+        self.client.get(reverse('index'))
+        self.client.get(reverse('index'))
+        # The second request doesn't flush again within the interval
+        self.assertEqual(list(VisitCount.objects.values_list('visits', flat=True)), [1])
+
+class KeysetPaginationTest(TestCase):
+    """List views page with cursors, in order, at a constant query cost."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = Author.objects.create(first_name='John', last_name='Smith')
+        # Duplicate titles make sure the id tie-breaker is honoured
+        for title in ['Delta', 'Alpha', 'Charlie', 'Bravo', 'Alpha', 'Echo', 'Charlie']:
+            create_book(cls.author, title)
+
+        cls.librarian = User.objects.create_user('librarian', password='secret')
+        cls.librarian.user_permissions.add(Permission.objects.get(codename='can_mark_returned'))
+        book = Book.objects.first()
+        today = datetime.date.today()
+        for days in [3, None, 1, 3, 2, None, 3, 1, 5, 4, 3, 2]:
+            BookInstance.objects.create(
+                book=book, imprint='Imprint', status='o', borrower=cls.librarian,
+                due_back=None if days is None else today + datetime.timedelta(days=days),
+            )
+
+    def setUp(self):
+        # Measure rendered pages, not the anonymous page cache
+        cache.clear()
+
+    def walk(self, url, context_name):
+        """Follow the next links from the first page, then the previous links back."""
+        pages = []
+        response = self.client.get(url)
+        while True:
+            pages.append([obj.pk for obj in response.context[context_name]])
+            page = response.context['page_obj']
+            if not page.has_next():
+                break
+            response = self.client.get(url, {'cursor': page.next_cursor})
+
+        backwards = [pages[-1]]
+        while page.has_previous():
+            response = self.client.get(url, {'cursor': page.previous_cursor})
+            page = response.context['page_obj']
+            backwards.insert(0, [obj.pk for obj in page])
+        self.assertEqual(backwards, pages)
+        return pages
+
+    def test_book_list_pages_follow_title_and_id(self):
+        pages = self.walk(reverse('books'), 'my_book_list')
+        self.assertEqual(len(pages), 4)
+        expected = list(Book.objects.order_by('title', 'id').values_list('pk', flat=True))
+        self.assertEqual(sum(pages, []), expected)
+
+    def test_library_pages_follow_due_back_and_id_with_nulls(self):
+        self.client.force_login(self.librarian)
+        pages = self.walk(reverse('library-books'), 'bookinstance_list')
+        self.assertEqual([len(page) for page in pages], [10, 2])
+        copies = BookInstance.objects.in_bulk([pk for page in pages for pk in page])
+        keys = [(copies[pk].due_back is not None, copies[pk].due_back, pk) for page in pages for pk in page]
+        self.assertEqual(keys, sorted(keys))
+
+    def test_deep_pages_cost_the_same_as_the_first(self):
+        url = reverse('books')
+        with capture_queries() as first:
+            response = self.client.get(url)
+        page = response.context['page_obj']
+        response = self.client.get(url, {'cursor': page.next_cursor})
+        with capture_queries() as deep:
+            self.client.get(url, {'cursor': response.context['page_obj'].next_cursor})
+        self.assertEqual(len(deep), len(first))
+        self.assertFalse(any('COUNT' in query['sql'] or 'OFFSET' in query['sql'] for query in first))
+
+    def test_invalid_cursor_is_not_found(self):
+        response = self.client.get(reverse('books'), {'cursor': 'garbage'})
+        self.assertEqual(response.status_code, 404)
+
+
+class QueryPlanTest(TestCase):
+
+    def test_catalog_queries_use_indexes(self):
+        out = StringIO()
+        call_command('check_query_plans', stdout=out)
+        self.assertIn('All catalog queries use indexes.', out.getvalue())
+
+
+class BookSearchTest(TestCase):
+    """The full-text index follows the catalog and ranks title matches first."""
+
+    def setUp(self):
+        self.tolkien = Author.objects.create(first_name='John', last_name='Tolkien')
+        self.other = Author.objects.create(first_name='Jane', last_name='Austen')
+        self.hobbit = create_book(self.tolkien, 'The Hobbit')
+        self.emma = create_book(self.other, 'Emma')
+        self.emma.summary = 'Mentions a hobbit once'
+        self.emma.save()
+
+    def search(self, query):
+        response = self.client.get(reverse('book-search'), {'q': query})
+        self.assertEqual(response.status_code, 200)
+        return [book.pk for book in response.context['results']]
+
+    def test_ranks_title_matches_first(self):
+        self.assertEqual(self.search('hobb'), [self.hobbit.pk, self.emma.pk])
+
+    def test_index_follows_changes(self):
+        self.assertEqual(self.search('austen'), [self.emma.pk])
+
+        self.other.last_name = 'Bronte'
+        self.other.save()
+        self.assertEqual(self.search('austen'), [])
+        self.assertEqual(self.search('bronte'), [self.emma.pk])
+
+        self.emma.delete()
+        self.assertEqual(self.search('bronte'), [])
+
+    def test_rebuild_command(self):
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM catalog_book_fts')
+        self.assertEqual(self.search('tolkien'), [])
+
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(self.search('tolkien'), [self.hobbit.pk])
+
+    def test_query_syntax_is_not_interpreted(self):
+        self.assertEqual(self.search('"hobbit" OR NEAR('), [])
+        self.assertEqual(self.search(''), [])
+
+
+class BookFacetTest(TestCase):
+    """The facet counts follow the catalog and the book list filters on them."""
+
+    def setUp(self):
+        cache.clear()
+        self.english = Language.objects.create(name='English')
+        self.french = Language.objects.create(name='French')
+        self.fantasy = Genre.objects.create(name='Fantasy')
+        self.drama = Genre.objects.create(name='Drama')
+        self.tolkien = Author.objects.create(first_name='John', last_name='Tolkien')
+        self.hugo = Author.objects.create(first_name='Victor', last_name='Hugo')
+        self.hobbit = create_book(self.tolkien, 'The Hobbit', self.english, [self.fantasy], copies=1)
+        self.silmarillion = create_book(self.tolkien, 'The Silmarillion', self.english, [self.fantasy, self.drama])
+        self.miserables = create_book(self.hugo, 'Les Miserables', self.french, [self.drama], copies=2)
+
+    def counts(self):
+        return {(row.facet, row.label): row.books for row in BookFacet.objects.all()}
+
+    def test_counts_follow_changes(self):
+        self.assertEqual(self.counts(), {
+            ('available', 'Available now'): 2, ('available', 'All copies out'): 1,
+            ('genre', 'Drama'): 2, ('genre', 'Fantasy'): 2,
+            ('initial', 'H'): 1, ('initial', 'T'): 2,
+            ('language', 'English'): 2, ('language', 'French'): 1,
+        })
+
+        self.silmarillion.genre.remove(self.drama)
+        self.drama.book_set.clear()
+        self.miserables.refresh_from_db()
+        self.miserables.language = self.english
+        self.miserables.save()
+        reader = User.objects.create_user('reader', 'reader@example.com', 'secret')
+        due_back = datetime.date.today() + datetime.timedelta(weeks=3)
+        check_out_copies([BookInstance.objects.get(book=self.hobbit).uuid], reader, due_back)
+        self.hugo.last_name = 'Victor Hugo'
+        self.hugo.save()
+        self.fantasy.name = 'High fantasy'
+        self.fantasy.save()
+        self.silmarillion.delete()
+        self.french.delete()
+
+        expected = {
+            ('available', 'Available now'): 1, ('available', 'All copies out'): 1,
+            ('genre', 'High fantasy'): 1, ('initial', 'T'): 1, ('initial', 'V'): 1, ('language', 'English'): 2,
+        }
+        self.assertEqual(self.counts(), expected)
+        call_command('rebuild_facets', stdout=StringIO())
+        self.assertEqual(self.counts(), expected)
+
+    def test_saving_a_stale_book_keeps_its_availability(self):
+        stale = Book.objects.get(pk=self.hobbit.pk)
+        reader = User.objects.create_user('reader', 'reader@example.com', 'secret')
+        due_back = datetime.date.today() + datetime.timedelta(weeks=3)
+        check_out_copies([BookInstance.objects.get(book=self.hobbit).uuid], reader, due_back)
+
+        stale.title = 'The Hobbit, or There and Back Again'
+        stale.save()
+        counts = self.counts()
+        self.assertEqual((counts[('available', 'Available now')], counts[('available', 'All copies out')]), (1, 2))
+
+    def test_list_filters_on_facets_without_grouping(self):
+        create_book(self.tolkien, 'Unfinished Tales', self.french, [self.fantasy])
+        create_book(self.hugo, 'Notre-Dame de Paris', self.english)
+        with capture_queries() as queries:
+            response = self.client.get(reverse('books'), {'genre': self.fantasy.pk, 'language': self.english.pk})
+        self.assertEqual(
+            [book.title for book in response.context['my_book_list']], ['The Hobbit', 'The Silmarillion'])
+        self.assertFalse([query for query in queries if 'GROUP BY' in query['sql']])
+        self.assertFalse(response.context['page_obj'].has_next())
+
+        genres = next(facet for facet in response.context['facets'] if facet['facet'] == 'genre')
+        self.assertEqual(
+            [(value['label'], value['books'], value['selected']) for value in genres['values']],
+            [('Drama', 2, False), ('Fantasy', 3, True)])
+        # Choosing the selected genre again drops it from the filters
+        self.assertEqual(genres['values'][1]['query'], f'language={self.english.pk}')
+
+        response = self.client.get(reverse('books'), {'language': self.english.pk})
+        self.assertContains(response, f'?language={self.english.pk}&amp;cursor=')
+
+        response = self.client.get(reverse('books'), {'genre': self.drama.pk, 'initial': 'T', 'language': self.french.pk})
+        self.assertContains(response, 'No books match the selected filters.')
+
+
+class SimilarBooksTest(TestCase):
+    """Books borrowed by the same borrowers are listed on each other's page."""
+
+    def setUp(self):
+        cache.clear()
+        author = Author.objects.create(first_name='John', last_name='Smith')
+        self.books = {title: create_book(author, title, copies=3) for title in 'ABCD'}
+        self.readers = [User.objects.create_user(f'reader{i}', f'reader{i}@example.com', 'secret') for i in range(3)]
+        for reader, titles in zip(self.readers, ('AB', 'ABC', 'ACD')):
+            self.borrow(reader, titles)
+
+    def borrow(self, reader, titles):
+        copies = [BookInstance.objects.filter(book=self.books[title], status='a').first().uuid for title in titles]
+        check_out_copies(copies, reader, datetime.date.today() + datetime.timedelta(weeks=3))
+        return_copies(copies)
+
+    def similar(self, title):
+        response = self.client.get(reverse('book-detail', args=[self.books[title].pk]))
+        return [(entry.similar.title, entry.borrowers) for entry in response.context['similar_books']]
+
+    def test_full_and_incremental_runs(self):
+        call_command('refresh_similar_books', stdout=StringIO())
+        # B and C were both borrowed with A by two readers, but together by only one
+        self.assertEqual(self.similar('A'), [('B', 2), ('C', 2)])
+        self.assertEqual(self.similar('B'), [('A', 2)])
+        self.assertEqual(self.similar('D'), [])
+        self.assertContains(self.client.get(reverse('book-detail', args=[self.books['A'].pk])), 'also borrowed')
+
+        self.borrow(self.readers[0], 'C')
+        run = refresh_similar_books()
+        # Only the books of reader0, whose loans are new, are recomputed
+        self.assertEqual((run.full, run.books), (False, 3))
+        self.assertEqual(self.similar('B'), [('A', 2), ('C', 2)])
+        self.assertEqual(refresh_similar_books().books, 0)
+
+    def test_loans_of_copies_saved_one_at_a_time_count(self):
+        refresh_similar_books()
+        self.assertEqual(self.similar('D'), [])
+        # Lent and returned by editing the copy, as in the admin
+        copy = BookInstance.objects.filter(book=self.books['D'], status='a').first()
+        copy.status, copy.borrower, copy.due_back = 'o', self.readers[1], datetime.date.today()
+        copy.save()
+        copy.status, copy.borrower, copy.due_back = 'a', None, None
+        copy.save()
+
+        run = refresh_similar_books()
+        self.assertEqual((run.full, run.books), (False, 4))
+        self.assertEqual(self.similar('D'), [('C', 2), ('A', 2)])
+
+    @override_settings(CATALOG_SIMILAR_MIN_BORROWERS=1)
+    def test_engines_agree(self):
+        runs = {}
+        for engine in engines():
+            refresh_similar_books(full=True, engine=engine)
+            runs[engine] = [
+                (entry.book_id, entry.rank, entry.similar_id, round(entry.score, 6), entry.borrowers)
+                for entry in SimilarBook.objects.all()
+            ]
+        self.assertEqual(len(runs['python']), 10)
+        self.assertEqual(len(set(map(tuple, runs.values()))), 1)
+
+
+class ExportTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        author = Author.objects.create(first_name='John', last_name='Smith')
+        book = create_book(author, 'First, with comma')
+        cls.librarian = User.objects.create_user('librarian', password='secret')
+        cls.librarian.user_permissions.add(Permission.objects.get(codename='can_mark_returned'))
+        cls.copy = BookInstance.objects.create(
+            book=book, imprint='Imprint', status='o', borrower=cls.librarian,
+            due_back=datetime.date(2020, 1, 31),
+        )
+
+    def test_streams_copies_as_csv(self):
+        self.client.force_login(self.librarian)
+        response = self.client.get(reverse('catalog-export', args=['copies', 'csv']))
+        self.assertTrue(response.streaming)
+        rows = list(csv.reader(b''.join(response.streaming_content).decode().splitlines()))
+        self.assertEqual(rows, [
+            ['id', 'book_id', 'book_title', 'imprint', 'status', 'due_back', 'borrower'],
+            [str(self.copy.uuid), str(self.copy.book_id), 'First, with comma', 'Imprint', 'o', '2020-01-31', 'librarian'],
+        ])
+
+    def test_export_requires_permission(self):
+        response = self.client.get(reverse('catalog-export', args=['copies', 'csv']))
+        self.assertEqual(response.status_code, 302)
+
+    def test_command_writes_json_lines(self):
+        out = StringIO()
+        call_command('export_catalog', 'authors', '--format', 'jsonl', stdout=out)
+        self.assertEqual([json.loads(line) for line in out.getvalue().splitlines()], [{
+            'id': Author.objects.get().pk,
+            'first_name': 'John',
+            'last_name': 'Smith',
+            'date_of_birth': None,
+            'date_of_death': None,
+        }])
+
+
+class ImportCatalogTest(TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+
+    def write(self, name, content):
+        path = os.path.join(self.tmpdir.name, name)
+        with open(path, 'w', encoding='utf-8') as output:
+            output.write(content)
+        return path
+
+    def test_imports_books_and_copies(self):
+        books = self.write('books.csv', (
+            'title,author_first_name,author_last_name,isbn,language,summary,genres\n'
+            'Emma,Jane,Austen,111,English,A novel,Romance;Classic\n'
+            'Persuasion,Jane,Austen,222,English,Another novel,Romance\n'
+            'Emma again,Jane,Austen,111,English,Duplicate ISBN,Romance\n'
+        ))
+        copies = self.write('copies.jsonl', '\n'.join(json.dumps(row) for row in [
+            {'book_isbn': '111', 'imprint': 'First', 'status': 'a'},
+            {'book_isbn': '111', 'imprint': 'Second', 'status': 'o', 'due_back': '2020-01-31', 'borrower': 'reader'},
+            {'book_isbn': '999', 'imprint': 'Unknown book', 'status': 'a'},
+            {'book_isbn': '111', 'imprint': 'Bad id', 'status': 'a', 'id': 'not-a-uuid'},
+            {'book_isbn': '222', 'imprint': 'Known id', 'status': 'a', 'id': '12345678-1234-5678-1234-567812345678'},
+        ]))
+
+        reader = User.objects.create_user('reader', password='secret')
+        call_command('import_catalog', books, '--kind', 'books', '--batch-size', '2', stdout=StringIO())
+        out = StringIO()
+        call_command('import_catalog', copies, '--kind', 'copies', stdout=out)
+        # The unknown book and the malformed id are skipped, the rest of the batch is written
+        self.assertIn('Imported 3 copies', out.getvalue())
+        self.assertIn('skipped 2 rows', out.getvalue())
+
+        self.assertEqual(Author.objects.count(), 1)
+        self.assertEqual(Language.objects.count(), 1)
+        emma = Book.objects.get(isbn='111')
+        self.assertEqual(sorted(emma.genre.values_list('name', flat=True)), ['Classic', 'Romance'])
+        self.assertEqual(emma.author.last_name, 'Austen')
+        self.assertEqual((emma.copies_total, emma.copies_available, emma.copies_on_loan), (2, 1, 1))
+        self.assertEqual(BookInstance.objects.get(imprint='Known id').uuid,
+                         uuid.UUID('12345678-1234-5678-1234-567812345678'))
+        self.assertEqual(list(LoanEvent.objects.values_list('copy__imprint', 'borrower', 'action')),
+                         [('Second', reader.pk, LoanEvent.CHECKED_OUT)])
+        self.assertEqual([book.pk for book in SearchResults('persuasion')[:10]], [Book.objects.get(isbn='222').pk])
+
+    def test_resumes_from_checkpoint(self):
+        authors = self.write('authors.csv', 'first_name,last_name\nA,One\nB,Two\nC,Three\n')
+        self.write('authors.csv.checkpoint', '2')
+
+        call_command('import_catalog', authors, '--kind', 'authors', stdout=StringIO())
+        self.assertEqual(list(Author.objects.values_list('last_name', flat=True)), ['Three'])
+        self.assertFalse(os.path.exists(authors + '.checkpoint'))
+
+
+class CatalogApiTest(TestCase):
+    """The JSON API answers repeated conditional requests with 304 and no queries."""
+
+    def setUp(self):
+        cache.clear()
+        self.author = Author.objects.create(first_name='John', last_name='Smith')
+        self.genre = Genre.objects.create(name='Fantasy')
+        self.book = create_book(self.author, 'First', genres=[self.genre], copies=2)
+
+    def test_book_detail_with_field_selection(self):
+        url = reverse('api-book', args=[self.book.pk])
+        response = self.client.get(url, {'fields': 'title,genres,availability'})
+        self.assertEqual(response.json(), {
+            'title': 'First',
+            'genres': ['Fantasy'],
+            'availability': {'total': 2, 'available': 2, 'on_loan': 0, 'maintenance': 0, 'reserved': 0},
+        })
+        self.assertEqual(self.client.get(reverse('api-book', args=[0])).status_code, 404)
+
+    def test_conditional_get_skips_the_database(self):
+        url = reverse('api-book', args=[self.book.pk])
+        response = self.client.get(url)
+        etag = response['ETag']
+        self.assertIn('Last-Modified', response)
+
+        with capture_queries() as queries:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(len(queries), 0)
+
+        # A copy changing status changes the book's availability and so its ETag
+        copy = BookInstance.objects.filter(book=self.book).first()
+        copy.status = 'o'
+        copy.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['availability']['on_loan'], 1)
+
+    def test_lists_page_and_follow_renames(self):
+        create_book(self.author, 'Second')
+        response = self.client.get(reverse('api-books'), {'limit': 1, 'fields': 'id,author'})
+        data = response.json()
+        self.assertEqual(len(data['results']), 1)
+        self.assertEqual(data['results'][0]['author']['name'], 'John Smith')
+
+        etag = response['ETag']
+        self.author.first_name = 'Jack'
+        self.author.save()
+        response = self.client.get(data['next'], HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.json()['results'][0]['author']['name'], 'Jack Smith')
+        self.assertIsNone(response.json()['next'])
+
+        response = self.client.get(reverse('api-author', args=[self.author.pk]), {'fields': 'books'})
+        self.assertEqual([book['title'] for book in response.json()['books']], ['First', 'Second'])
+
+
+class ViewCostMiddlewareTest(TestCase):
+
+    def setUp(self):
+        reset_view_stats()
+        cache.clear()
+        self.staff = User.objects.create_user('staff', password='secret', is_staff=True)
+
+    def test_records_queries_and_latency_per_url_name(self):
+        author = Author.objects.create(first_name='John', last_name='Smith')
+        create_book(author, 'First', copies=3)
+        self.client.get(reverse('books'))
+        self.client.get(reverse('books'))
+
+        stats = get_view_stats()['books']
+        self.assertEqual(stats['requests'], 2)
+        # The page of books and the facet counts
+        self.assertEqual(stats['max']['queries'], 2)
+        self.assertGreater(stats['mean']['template_ms'], 0)
+        self.assertGreaterEqual(stats['mean']['total_ms'], stats['mean']['template_ms'])
+
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('view-stats-json'))
+        self.assertEqual(response.json()['views']['books']['requests'], 2)
+        self.assertContains(self.client.get(reverse('view-stats')), 'books')
+
+    def test_function_views_are_rendered_timed(self):
+        self.client.get(reverse('index'))
+        self.assertGreater(get_view_stats()['index']['max']['template_ms'], 0)
+
+    @override_settings(CATALOG_VIEW_BUDGETS={'books': {'queries': 0}})
+    def test_budget_overruns_are_logged(self):
+        with self.assertLogs('catalog.middleware', 'WARNING') as logs:
+            self.client.get(reverse('books'))
+        self.assertIn('View books exceeded its budget: queries 2 > 0', logs.output[0])
+        self.assertEqual(get_view_stats()['books']['over_budget'], 1)
+
+    @override_settings(CATALOG_VIEW_BUDGETS={'books': {'queries': 0}}, CATALOG_VIEW_BUDGET_ACTION='raise')
+    def test_budget_overruns_can_raise(self):
+        with self.assertRaises(ViewBudgetExceeded):
+            self.client.get(reverse('books'))
+
+    def test_stats_are_staff_only(self):
+        response = self.client.get(reverse('view-stats-json'))
+        self.assertEqual(response.status_code, 302)
+
+
+class BenchmarkTest(TestCase):
+
+    def test_seed_and_benchmark_every_url(self):
+        seed_catalog(authors=5, books=20, copies=100, users=5)
+        self.assertEqual(BookInstance.objects.count(), 100)
+        self.assertEqual(Book.objects.aggregate(total=Sum('copies_total'))['total'], 100)
+
+        User.objects.create_superuser('admin', 'admin@example.com', 'secret')
+        self.client.login(username='admin', password='secret')
+        results = benchmark_views(self.client, requests=2)
+        self.assertTrue({'index', 'books', 'author-detail', 'library-books'} <= set(results))
+        self.assertTrue(all(result['status'] == 200 for result in results.values()))
+
+    def test_compare_to_baseline(self):
+        baseline = {'books': {'p50_ms': 10, 'p95_ms': 20, 'queries': 2, 'peak_kib': 100}}
+        same = {'books': {'p50_ms': 11, 'p95_ms': 21, 'queries': 2, 'peak_kib': 100}}
+        worse = {'books': {'p50_ms': 11, 'p95_ms': 30, 'queries': 3, 'peak_kib': 100}}
+        self.assertEqual(compare_to_baseline(same, baseline), [])
+        self.assertEqual(compare_to_baseline(worse, baseline), [
+            'books: 3 queries, baseline 2',
+            'books: p95_ms 30, baseline 20',
+        ])
+
+    def test_compare_throughput(self):
+        throughput = {
+            'book-detail': {'requests_per_s': 100.0, 'concurrency': 8},
+            'book-detail-concurrent': {'requests_per_s': 150.0, 'concurrency': 8},
+            'index': {'requests_per_s': 200.0, 'concurrency': 8},
+        }
+        self.assertEqual(compare_concurrency(throughput), {'book-detail': 1.5})
+        baseline = {'book-detail-concurrent': {'requests_per_s': 200.0, 'concurrency': 8}}
+        self.assertEqual(compare_to_baseline(throughput, baseline), [
+            'book-detail-concurrent: requests_per_s 150.0, baseline 200.0',
+        ])
+
+    def test_command_compares_with_its_baseline(self):
+        # The command sets up and destroys a test database of its own, it runs in another process
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'baseline.json')
+
+            def benchmark(*args):
+                return subprocess.run(
+                    [sys.executable, 'manage.py', 'benchmark_catalog', '--authors', '5', '--books', '20',
+                     '--copies', '100', '--users', '5', '--requests', '1', '--concurrency', '2',
+                     '--baseline', path, *args],
+                    cwd=settings.BASE_DIR, capture_output=True, text=True,
+                )
+
+            saved = benchmark('--save-baseline')
+            self.assertEqual(saved.returncode, 0, saved.stderr)
+            self.assertRegex(saved.stdout, r'book-detail-concurrent +[\d.]+ requests/s at concurrency 2 \(status 200\)')
+            self.assertRegex(saved.stdout, r'book-detail-concurrent +[\d.]+x the requests/s of book-detail')
+            with open(path) as source:
+                baseline = json.load(source)
+            self.assertEqual(set(baseline['throughput']), {
+                'index', 'index-concurrent', 'book-detail', 'book-detail-concurrent',
+                'author-detail', 'author-detail-concurrent',
+            })
+
+            # Latency and memory out of reach, a throughput no run can match
+            for measured in baseline['views'].values():
+                measured.update(p50_ms=10 ** 6, p95_ms=10 ** 6, peak_kib=10 ** 6)
+            baseline['throughput']['book-detail-concurrent']['requests_per_s'] = 10 ** 6
+            with open(path, 'w') as output:
+                json.dump(baseline, output)
+            compared = benchmark()
+            self.assertEqual(compared.returncode, 1)
+            self.assertIn('Regressions against the baseline:', compared.stderr)
+            self.assertIn('book-detail-concurrent: requests_per_s', compared.stderr)
+
+
+class BatchLoanTest(TestCase):
+    """Copies are checked out, returned and renewed in batches with their counters kept."""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = Author.objects.create(first_name='John', last_name='Smith')
+        cls.book = create_book(author, 'First', copies=3)
+        cls.reader = User.objects.create_user('reader', password='secret')
+        cls.librarian = User.objects.create_user('librarian', password='secret')
+        cls.librarian.user_permissions.add(Permission.objects.get(codename='can_mark_returned'))
+        cls.copy_ids = [str(copy_uuid) for copy_uuid in BookInstance.objects.values_list('uuid', flat=True)]
+        cls.due_back = datetime.date.today() + datetime.timedelta(weeks=2)
+
+    def post(self, **data):
+        self.client.force_login(self.librarian)
+        return self.client.post(reverse('loans-batch'), data)
+
+    def test_check_out_return_and_renew(self):
+        response = self.post(action='checkout', copies=' '.join(self.copy_ids[:2]),
+                             borrower='reader', due_back=self.due_back)
+        self.assertRedirects(response, reverse('library-books'))
+        self.book.refresh_from_db()
+        self.assertEqual((self.book.copies_available, self.book.copies_on_loan), (1, 2))
+        self.assertEqual(BookInstance.objects.filter(borrower=self.reader, due_back=self.due_back).count(), 2)
+
+        later = self.due_back + datetime.timedelta(days=7)
+        self.post(action='renew', borrower='reader', due_back=later)
+        self.assertEqual(BookInstance.objects.filter(borrower=self.reader, due_back=later).count(), 2)
+
+        self.client.post(reverse('loans-batch'), {'action': 'return', 'copies': self.copy_ids[:2]})
+        self.book.refresh_from_db()
+        self.assertEqual((self.book.copies_available, self.book.copies_on_loan), (3, 0))
+        self.assertFalse(BookInstance.objects.filter(borrower=self.reader).exists())
+
+    def test_batch_is_all_or_nothing(self):
+        BookInstance.objects.filter(uuid=self.copy_ids[0]).update(status='m')
+        response = self.post(action='checkout', copies=','.join(self.copy_ids),
+                             borrower='reader', due_back=self.due_back)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(self.copy_ids[0], response.context['form'].non_field_errors()[0])
+        self.assertFalse(BookInstance.objects.filter(status='o').exists())
+
+    def test_empty_selection_is_refused(self):
+        check_out_copies(list(BookInstance.objects.values_list('uuid', flat=True)), self.reader, self.due_back)
+        for operation in (lambda: check_out_copies([], self.reader, self.due_back),
+                          lambda: return_copies([]), lambda: renew_copies([], due_back=self.due_back)):
+            with self.assertRaisesMessage(ValidationError, 'Select copies or a borrower.'):
+                operation()
+        self.assertEqual(BookInstance.objects.filter(borrower=self.reader, status='o').count(), 3)
+
+    def test_renew_single_copy(self):
+        BookInstance.objects.filter(uuid=self.copy_ids[0]).update(status='o', borrower=self.reader)
+        self.client.force_login(self.librarian)
+        response = self.client.post(reverse('renew-book-librarian', args=[self.copy_ids[0]]),
+                                    {'due_back': self.due_back})
+        self.assertRedirects(response, reverse('library-books'))
+        self.assertEqual(BookInstance.objects.get(uuid=self.copy_ids[0]).due_back, self.due_back)
+
+    def test_renewing_a_copy_not_on_loan_is_refused(self):
+        self.client.force_login(self.librarian)
+        response = self.client.post(reverse('renew-book-librarian', args=[self.copy_ids[0]]),
+                                    {'due_back': self.due_back})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['form'].non_field_errors(),
+                         [f'These copies cannot be renewed: {self.copy_ids[0]}'])
+        self.assertContains(response, 'cannot be renewed')
+        self.assertIsNone(BookInstance.objects.get(uuid=self.copy_ids[0]).due_back)
+
+
+class BorrowerDashboardTest(TestCase):
+    """Loan operations write a history that the dashboard shows in a fixed number of queries."""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = Author.objects.create(first_name='John', last_name='Smith')
+        cls.book = create_book(author, 'First', copies=3)
+        cls.reader = User.objects.create_user('reader', password='secret')
+        cls.copy_ids = list(BookInstance.objects.values_list('uuid', flat=True))
+
+    def lend_and_return(self, copy_ids, due_back):
+        check_out_copies(copy_ids, self.reader, due_back)
+        renew_copies(borrower=self.reader, due_back=due_back + datetime.timedelta(days=7))
+        return_copies(copy_ids)
+
+    def dashboard_queries(self):
+        with capture_queries() as queries:
+            response = self.client.get(reverse('my-dashboard'))
+        self.assertEqual(response.status_code, 200)
+        return response, len(queries)
+
+    def test_history_and_totals(self):
+        self.lend_and_return(self.copy_ids[:2], datetime.date.today() - datetime.timedelta(days=30))
+        check_out_copies(self.copy_ids[2:], self.reader, datetime.date.today())
+
+        events = LoanEvent.objects.filter(borrower=self.reader)
+        self.assertEqual(events.filter(action=LoanEvent.CHECKED_OUT).count(), 3)
+        self.assertEqual(events.filter(action=LoanEvent.RETURNED, book=self.book).count(), 2)
+
+        self.client.force_login(self.reader)
+        response, count = self.dashboard_queries()
+        totals = response.context['totals']
+        self.assertEqual((totals['loans'], totals['renewals'], totals['returns']), (3, 2, 2))
+        self.assertEqual((totals['late_returns'], totals['books']), (2, 1))
+        self.assertEqual(len(response.context['current_loans']), 1)
+        self.assertEqual(len(response.context['history']), 7)
+
+        for i in range(10):
+            self.lend_and_return(self.copy_ids[:2], datetime.date.today())
+        self.assertEqual(self.dashboard_queries()[1], count)
+
+    def test_loans_edited_in_the_admin_are_recorded(self):
+        admin = User.objects.create_superuser('admin', 'admin@example.com', 'secret')
+        other = User.objects.create_user('other', password='secret')
+        copy = BookInstance.objects.get(uuid=self.copy_ids[0])
+        today = datetime.date.today()
+        self.client.force_login(admin)
+
+        def edit(status, borrower, due_back):
+            response = self.client.post(reverse('admin:catalog_bookinstance_change', args=[copy.pk]), {
+                'book': self.book.pk, 'imprint': copy.imprint, 'status': status,
+                'borrower': borrower.pk if borrower else '', 'due_back': due_back or '',
+            })
+            self.assertEqual(response.status_code, 302)
+
+        edit('o', self.reader, today)
+        edit('o', self.reader, today + datetime.timedelta(days=7))
+        edit('o', other, today)
+        edit('o', other, today)
+        edit('a', None, None)
+        self.assertEqual(list(LoanEvent.objects.order_by('id').values_list('action', 'borrower', 'due_back')), [
+            (LoanEvent.CHECKED_OUT, self.reader.pk, today),
+            (LoanEvent.RENEWED, self.reader.pk, today + datetime.timedelta(days=7)),
+            (LoanEvent.RETURNED, self.reader.pk, today + datetime.timedelta(days=7)),
+            (LoanEvent.CHECKED_OUT, other.pk, today),
+            (LoanEvent.RETURNED, other.pk, today),
+        ])
+        self.assertEqual(set(LoanEvent.objects.values_list('copy', 'book').distinct()), {(copy.pk, self.book.pk)})
+
+
+class OverdueSweepTest(TestCase):
+    """The overdue sweep stores overdue loans and a per-borrower rollup."""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = Author.objects.create(first_name='John', last_name='Smith')
+        cls.book = create_book(author, 'First')
+        cls.reader = User.objects.create_user('reader', password='secret')
+        cls.librarian = User.objects.create_user('librarian', password='secret')
+        cls.librarian.user_permissions.add(Permission.objects.get(codename='can_mark_returned'))
+        cls.today = datetime.date.today()
+        cls.copies = [
+            BookInstance.objects.create(book=cls.book, imprint=str(days), status='o', borrower=cls.reader,
+                                        due_back=cls.today - datetime.timedelta(days=days))
+            for days in (10, 3, 0, -5)
+        ]
+
+    def test_sweep_and_rollup(self):
+        out = StringIO()
+        call_command('sweep_overdue_loans', stdout=out)
+        self.assertIn('Found 2 overdue loans of 1 borrowers', out.getvalue())
+        self.assertEqual(list(OverdueLoan.objects.values_list('copy', 'days_overdue')),
+                         [(self.copies[0].pk, 10), (self.copies[1].pk, 3)])
+        rollup = BorrowerOverdue.objects.get()
+        self.assertEqual((rollup.borrower, rollup.loans, rollup.max_days_overdue), (self.reader, 2, 10))
+
+        # Returning a copy forgets its overdue loan and updates the rollup
+        return_copies([self.copies[0].uuid])
+        self.assertEqual(list(OverdueLoan.objects.values_list('copy', flat=True)), [self.copies[1].pk])
+        rollup.refresh_from_db()
+        self.assertEqual((rollup.loans, rollup.max_days_overdue), (1, 3))
+
+    def test_library_overdue_filter(self):
+        call_command('sweep_overdue_loans', stdout=StringIO())
+        self.client.force_login(self.librarian)
+        response = self.client.get(reverse('library-books'), {'overdue': '1'})
+        self.assertEqual([copy.pk for copy in response.context['bookinstance_list']],
+                         [self.copies[0].pk, self.copies[1].pk])
+        self.assertEqual(response.context['overdue_count'], 2)
+        self.assertContains(response, '10 days overdue')
+
+        response = self.client.get(reverse('library-books'))
+        self.assertEqual(len(response.context['bookinstance_list']), 4)
+
+
+class PageCacheTest(TestCase):
+    """Anonymous catalog pages and template fragments are cached until the catalog changes."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = Author.objects.create(first_name='John', last_name='Smith')
+        cls.book = create_book(cls.author, 'First', copies=2)
+        cls.reader = User.objects.create_user('reader', password='secret')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_anonymous_pages_are_served_without_queries(self):
+        for url in [reverse('books'), reverse('authors'), self.book.get_absolute_url(),
+                    reverse('author-detail', args=[self.author.pk])]:
+            self.client.get(url)
+            with capture_queries() as queries:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(queries), 0, url)
+
+    def test_changes_invalidate_pages(self):
+        url = reverse('books')
+        self.client.get(url)
+        book = Book.objects.get(pk=self.book.pk)
+        book.title = 'Renamed'
+        book.save()
+        self.assertContains(self.client.get(url), 'Renamed')
+
+        BookInstance.objects.create(book=self.book, imprint='New', status='a')
+        self.assertContains(self.client.get(url), '3 of 3 available')
+
+    def test_copies_fragment_follows_loans(self):
+        copy = self.book.bookinstance_set.first()
+        self.client.force_login(self.reader)
+        self.client.get(self.book.get_absolute_url())
+
+        due_back = datetime.date.today() + datetime.timedelta(weeks=1)
+        check_out_copies([copy.uuid], self.reader, due_back)
+        self.assertContains(self.client.get(self.book.get_absolute_url()), '1 of 2 available')
+
+        later = due_back + datetime.timedelta(days=2)
+        renew_copies([copy.uuid], due_back=later)
+        response = self.client.get(self.book.get_absolute_url())
+        self.assertContains(response, date_format(later))
+
+    def test_bounded_locmem_evicts_least_recently_used(self):
+        bounded = BoundedLocMemCache('bounded-test', {'OPTIONS': {'MAX_BYTES': 1000}})
+        bounded.clear()
+        for key in 'abcde':
+            bounded.set(key, 'x' * 300)
+        self.assertLessEqual(bounded.used_bytes, 1000)
+        bounded.get('c')
+        bounded.set('f', 'x' * 300)
+        self.assertEqual([key for key in 'abcdef' if bounded.get(key) is not None], ['c', 'e', 'f'])
+
+
+class ConcurrentViewsTest(TestCase):
+    """The concurrent view variants render the same pages as the views they derive from."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = Author.objects.create(first_name='John', last_name='Smith')
+        cls.book = create_book(cls.author, 'First', genres=[Genre.objects.create(name='Poetry')], copies=2)
+        create_book(cls.author, 'Second', copies=1)
+        cls.reader = User.objects.create_user('reader', password='secret')
+
+    def test_pages_match_the_sync_views(self):
+        self.client.force_login(self.reader)
+        pairs = [
+            ('book-detail', 'book-detail-concurrent', [self.book.pk]),
+            ('author-detail', 'author-detail-concurrent', [self.author.pk]),
+        ]
+        for name, variant, args in pairs:
+            expected = self.client.get(reverse(name, args=args)).content.decode()
+            with capture_queries() as queries:
+                response = self.client.get(reverse(variant, args=args))
+            # Only the logout link, which carries the path, differs
+            content = response.content.decode().replace(reverse(variant, args=args), reverse(name, args=args))
+            self.assertEqual(content, expected)
+            self.assertFalse(any('IN (' in query['sql'] for query in queries), variant)
+
+        self.assertEqual(self.client.get(reverse('index-concurrent')).context['num_books'], 2)
+        self.assertEqual(self.client.get(reverse('book-detail-concurrent', args=[0])).status_code, 404)
+
+
+class FetchConcurrentlyTest(TransactionTestCase):
+
+    def test_loaders_run_in_other_threads(self):
+        Author.objects.create(first_name='John', last_name='Smith')
+        data = fetch_concurrently(
+            authors=lambda: Author.objects.count(),
+            thread=lambda: threading.get_ident(),
+        )
+        self.assertEqual(data['authors'], 1)
+        self.assertNotEqual(data['thread'], threading.get_ident())
+
+
+class ConcurrentViewCostTest(TransactionTestCase):
+
+    def test_queries_of_executor_threads_are_counted(self):
+        cache.clear()
+        reset_view_stats()
+        book = create_book(Author.objects.create(first_name='John', last_name='Smith'), copies=1)
+        self.client.get(reverse('book-detail', args=[book.pk]))
+        self.client.get(reverse('book-detail-concurrent', args=[book.pk]))
+        stats = get_view_stats()
+        self.assertEqual(stats['book-detail-concurrent']['max']['queries'], stats['book-detail']['max']['queries'])
+
+
+class ReplicaRoutingTest(TransactionTestCase):
+
+    def setUp(self):
+        cache.clear()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        connections.databases['replica'] = dict(
+            connections['default'].settings_dict, NAME=os.path.join(directory.name, 'replica.sqlite3'),
+        )
+        self.addCleanup(connections.databases.pop, 'replica')
+        self.addCleanup(lambda: connections['replica'].close())
+
+    @override_settings(CATALOG_READ_REPLICAS=['replica'])
+    def test_reads_go_to_the_replica_until_a_write(self):
+        author = Author.objects.create(first_name='John', last_name='Smith')
+        create_book(author, title='Replicated')
+        call_command('sync_sqlite_replicas', stdout=StringIO())
+        create_book(author, title='Not yet replicated')
+
+        # The writes above keep the reads of this context on the primary, a new one reads from the replica
+        self.assertEqual(ReplicaRouter().db_for_read(Book), 'default')
+        self.assertEqual(contextvars.Context().run(ReplicaRouter().db_for_read, Book), 'replica')
+        self.assertEqual(ReplicaRouter().db_for_write(Book), 'default')
+        response = self.client.get(reverse('books'))
+        self.assertEqual([book.title for book in response.context['my_book_list']], ['Replicated'])
+
+        librarian = User.objects.create_user('librarian', password='secret')
+        librarian.user_permissions.add(Permission.objects.get(codename='can_mark_returned'))
+        self.client.force_login(librarian)
+        response = self.client.post(reverse('author_create'), {'first_name': 'Jane', 'last_name': 'Doe'})
+        self.assertEqual(response.status_code, 302)
+        self.assertIn(PIN_COOKIE, response.cookies)
+
+        response = self.client.get(reverse('books'))
+        self.assertEqual(len(response.context['my_book_list']), 2)
+
+
+class SqliteTuningTest(TestCase):
+
+    def test_pragmas_are_applied_to_file_connections(self):
+        with tempfile.TemporaryDirectory() as directory:
+            settings_dict = dict(connection.settings_dict, NAME=os.path.join(directory, 'tuned.sqlite3'))
+            tuned = type(connections['default'])(settings_dict, alias='tuned')
+            try:
+                with tuned.cursor() as cursor:
+                    cursor.execute('PRAGMA journal_mode')
+                    self.assertEqual(cursor.fetchone()[0], 'wal')
+                    cursor.execute('PRAGMA busy_timeout')
+                    self.assertEqual(cursor.fetchone()[0], 5000)
+            finally:
+                tuned.close()
+
+    def test_tuned_profile_beats_the_default_under_contention(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'benchmark.sqlite3')
+            profiles = settings.CATALOG_DATABASE_PROFILES
+            # Same workload and seed for both, half writes to keep the lock contended
+            default, tuned = (
+                benchmark_sqlite_concurrency(path, profiles[name]['PRAGMAS'], reserve_write,
+                                             threads=4, seconds=0.5, write_share=0.5)
+                for name, reserve_write in (('default', False), ('tuned', True))
+            )
+        # The tuned profile does several times the work, twice leaves room for a
+        # loaded machine. Whether the default one fails on the lock depends on how
+        # the threads interleave, so only the tuned one's errors are checked
+        self.assertEqual(tuned['lock_errors'], 0)
+        self.assertGreater(tuned['reads_per_s'] + tuned['writes_per_s'],
+                           2 * (default['reads_per_s'] + default['writes_per_s']))
+
+
+class AdminPagesTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'secret')
+        cls.author = Author.objects.create(first_name='John', last_name='Smith')
+        cls.genres = [Genre.objects.create(name=name) for name in ('Fantasy', 'Poetry')]
+
+    def changelist_queries(self, model):
+        self.client.force_login(self.admin)
+        url = reverse(f'admin:catalog_{model}_changelist')
+        with capture_queries() as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_query_count_does_not_grow_with_rows(self):
+        create_book(self.author, genres=self.genres, copies=1)
+        counts = {model: self.changelist_queries(model) for model in ('book', 'bookinstance')}
+        for i in range(5):
+            create_book(self.author, title=f'Book {i}', genres=self.genres, copies=2)
+        for model, count in counts.items():
+            self.assertEqual(self.changelist_queries(model), count, model)
+
+    def test_large_unfiltered_tables_use_the_estimated_count(self):
+        for i in range(3):
+            create_book(self.author, title=f'Book {i}')
+        paginator = EstimatedCountPaginator(Book.objects.order_by('pk'), 2)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+            cursor.execute('UPDATE sqlite_stat1 SET stat = %s WHERE tbl = %s', ['5000000 1', Book._meta.db_table])
+
+        with override_settings(CATALOG_ESTIMATED_COUNT_ABOVE=1000):
+            self.assertEqual(paginator.count, 5000000)
+            self.assertEqual(EstimatedCountPaginator(Book.objects.filter(title='Book 1'), 2).count, 1)
+        with override_settings(CATALOG_ESTIMATED_COUNT_ABOVE=10 ** 7):
+            self.assertEqual(EstimatedCountPaginator(Book.objects.order_by('pk'), 2).count, 3)
+
+    def test_partial_indexes_do_not_shrink_the_estimate(self):
+        book = create_book(self.author, copies=4)
+        borrower = User.objects.create_user('reader', password='secret')
+        check_out_copies([BookInstance.objects.filter(book=book)[0].uuid], borrower, datetime.date.today())
+        table = BookInstance._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+            cursor.execute('SELECT idx, stat FROM sqlite_stat1 WHERE tbl = %s', [table])
+            stats = dict(cursor.fetchall())
+            self.assertEqual(int(stats['bookinstance_on_loan_idx'].split()[0]), 1)
+            # The partial index's row first, where an unordered read finds it
+            cursor.execute('DELETE FROM sqlite_stat1 WHERE tbl = %s', [table])
+            for idx in sorted(stats, key=lambda idx: idx != 'bookinstance_on_loan_idx'):
+                cursor.execute('INSERT INTO sqlite_stat1 (tbl, idx, stat) VALUES (%s, %s, %s)', [table, idx, stats[idx]])
+        self.assertEqual(estimated_row_count(BookInstance), 4)
+
+    def test_change_page_edits_one_page_of_copies(self):
+        book = create_book(self.author, copies=25)
+        self.client.force_login(self.admin)
+        url = reverse('admin:catalog_book_change', args=[book.pk])
+
+        response = self.client.get(url)
+        formset = response.context['inline_admin_formsets'][0].formset
+        self.assertEqual(len(formset.initial_forms), 20)
+        self.assertContains(response, '1&ndash;20 of 25 book instances')
+        response = self.client.get(url, {f'{formset.prefix}-page': 2})
+        self.assertEqual(len(response.context['inline_admin_formsets'][0].formset.initial_forms), 5)
+
+        rows = self.client.get(reverse('admin:catalog_book_inline_rows', args=[book.pk, formset.prefix])).json()
+        self.assertEqual((rows['count'], rows['pages'], len(rows['rows'])), (25, 2, 20))
+        self.assertEqual(self.client.get(
+            reverse('admin:catalog_book_inline_rows', args=[book.pk, 'nothing'])).status_code, 404)
+
+
+class AssetPipelineTest(TestCase):
+    default_bundles = settings.CATALOG_ASSET_BUNDLES
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        overrides = override_settings(
+            CATALOG_ASSET_BUNDLES={'catalog.css': ['css/styles.css']},
+            CATALOG_ASSETS_ROOT=directory.name,
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.addCleanup(load_manifest.cache_clear)
+        load_manifest.cache_clear()
+        cache.clear()
+
+    def test_bundles_are_hashed_minified_and_compressed(self):
+        self.assertContains(self.client.get(reverse('index')), static('css/styles.css'))
+        call_command('build_assets', stdout=StringIO())
+        target = load_manifest()['catalog.css']
+        self.assertRegex(target, r'^catalog\.[0-9a-f]{12}\.css$')
+        response = self.client.get(reverse('index'))
+        self.assertContains(response, settings.CATALOG_ASSETS_URL + target)
+        self.assertNotContains(response, static('css/styles.css'))
+
+        url = reverse('asset', args=[target])
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip;q=0')
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(b''.join(response.streaming_content), b'.sidebar-nav{margin-top:20px;padding:0;list-style:none}')
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        self.assertEqual(self.client.get(reverse('asset', args=['styles.css'])).status_code, 404)
+
+    def test_minify_keeps_selectors_and_licenses(self):
+        css = '/*! License */\n/* note */\ndiv :first-child {\n  color : red ;\n}\na:hover > b { top: 0; }\n'
+        self.assertEqual(minify_css(css), '/*! License */ div :first-child{color:red}a:hover>b{top:0}')
+
+    def test_minify_keeps_strings_and_urls(self):
+        css = ".a::before { content: \"a > b; c\" ; }\n/* it's */\n.b { background: url( \"x, y).png\" ) , url(a b.png) }\n"
+        self.assertEqual(minify_css(css), '.a::before{content:"a > b; c"}.b{background:url( "x, y).png" ),url(a b.png)}')
+
+    def test_default_bundles_build(self):
+        with override_settings(CATALOG_ASSET_BUNDLES=self.default_bundles):
+            call_command('build_assets', stdout=StringIO())
+        self.assertEqual(set(load_manifest()), set(self.default_bundles))
+
+    def test_missing_sources_fail_the_build(self):
+        with override_settings(CATALOG_ASSET_BUNDLES={'catalog.css': ['vendor/missing.css', 'css/styles.css']}):
+            with self.assertRaisesMessage(CommandError, 'vendor/missing.css'):
+                call_command('build_assets', stdout=StringIO())
+
+
+class CopyKeyTest(TestCase):
+
+    def test_copies_are_found_by_their_uuid(self):
+        author = Author.objects.create(first_name='John', last_name='Smith')
+        copy = BookInstance.objects.get(book=create_book(author, copies=1))
+        self.assertIsInstance(copy.pk, int)
+        admin = User.objects.create_superuser('admin', 'admin@example.com', 'secret')
+        self.client.force_login(admin)
+        for object_id in (copy.pk, copy.uuid):
+            response = self.client.get(reverse('admin:catalog_bookinstance_change', args=[object_id]))
+            self.assertEqual(response.context['original'], copy)
+
+    def test_integer_keys_shrink_the_indexes(self):
+        with tempfile.TemporaryDirectory() as directory:
+            results = benchmark_copy_keys(directory, rows=5000, seconds=0.1)
+        self.assertLess(results['integer']['index_bytes'], results['uuid']['index_bytes'])
+        self.assertGreater(results['integer']['pages_per_s'], 0)
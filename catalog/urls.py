@@ -1,15 +1,29 @@
 from django.urls import path
-from . import views
+from . import api, views
 
 urlpatterns = [
     path('', views.index, name='index'),
     path('books/', views.BookListView.as_view(), name='books'),
+    path('search/', views.BookSearchView.as_view(), name='book-search'),
     path('book/<int:pk>', views.BookDetailView.as_view(), name='book-detail'),
     path('authors/', views.AuthorsView.as_view(), name='authors'),
     path('author-detail/<int:pk>', views.AuthorDetail.as_view(), name='author-detail'),
     path('mybooks/', views.LoanedBookByUserListView.as_view(), name='my-borrowed'),
+    path('mybooks/dashboard/', views.BorrowerDashboardView.as_view(), name='my-dashboard'),
     path('library-books', views.LibraryBooksListView.as_view(), name='library-books'),
     path('book/<uuid:pk>/renew/', views.renew_book_librarian, name='renew-book-librarian'),
+    path('loans/batch/', views.batch_loans, name='loans-batch'),
+    path('export/<str:name>.<str:fmt>', views.export_catalog, name='catalog-export'),
+    path('stats/', views.view_stats, name='view-stats'),
+    path('stats.json', views.view_stats_json, name='view-stats-json'),
+]
+
+# Variants of the read views loading their data concurrently
+urlpatterns += [
+    path('concurrent/', views.index_concurrent, name='index-concurrent'),
+    path('concurrent/book/<int:pk>', views.ConcurrentBookDetailView.as_view(), name='book-detail-concurrent'),
+    path('concurrent/author-detail/<int:pk>', views.ConcurrentAuthorDetail.as_view(),
+         name='author-detail-concurrent'),
 ]
 
 urlpatterns += [  
@@ -22,4 +36,12 @@ urlpatterns += [
     path('book/create/', views.BookCreate.as_view(), name='book_create'),
     path('book/<int:pk>/update/', views.BookUpdate.as_view(), name='book_update'),
     path('book/<int:pk>/delete/', views.BookDelete.as_view(), name='book_delete'),
-]
\ No newline at end of file
+]
+
+urlpatterns += [
+    path('api/books/', api.book_list, name='api-books'),
+    path('api/books/<int:pk>/', api.book_detail, name='api-book'),
+    path('api/books/<int:pk>/copies/', api.copy_list, name='api-copies'),
+    path('api/authors/', api.author_list, name='api-authors'),
+    path('api/authors/<int:pk>/', api.author_detail, name='api-author'),
+]
@@ -1,13 +1,32 @@
-from django.shortcuts import render, get_object_or_404
-from catalog.models import Book, Author, BookInstance, Genre
+from django.shortcuts import get_object_or_404
+from django.template.response import TemplateResponse
+from django.db.models import Prefetch
+from catalog.models import Book, Author, BookInstance, BorrowerOverdue, Genre, LoanEvent
 from django.views import generic
-from django.http import HttpResponseRedirect
+from django.http import Http404, HttpResponseRedirect, JsonResponse, StreamingHttpResponse
 from django.urls import reverse, reverse_lazy
 from django.contrib.auth.mixins import LoginRequiredMixin, PermissionRequiredMixin
 from django.contrib.auth.decorators import permission_required
+from django.contrib.admin.views.decorators import staff_member_required
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.utils.decorators import method_decorator
+from django.utils.http import urlencode
 
 import datetime
-from catalog.forms import RenewBookForm
+from catalog.caching import cache_anonymous_page
+from catalog.concurrent import fetch_concurrently, set_prefetched
+from catalog.export import EXPORTS, FORMATS, export_lines
+from catalog.facets import facet_sidebar, filter_books, selected_facets
+from catalog.forms import BatchLoanForm, RenewBookForm
+from catalog.loans import check_out_copies, loan_totals, renew_copies, return_copies
+from catalog.middleware import get_view_stats
+from catalog.overdue import overdue_summary
+from catalog.pagination import KeysetPaginationMixin
+from catalog.recommendations import similar_books
+from catalog.routers import pin_to_primary
+from catalog.search import SearchResults
+from catalog.stats import count_visit, get_home_stats, remember_visitor
 
 # generic CRUD
 from django.views.generic.edit import CreateView, UpdateView, DeleteView
@@ -17,41 +36,80 @@ from catalog.models import Author, Book
 def index(request):
     """View function for home page of site."""
 
-    # Generate counts of some of the main objects
-    num_books = Book.objects.all().count()
-    num_instances = BookInstance.objects.all().count()
+    # Counts of the main objects, served from the cache
+    context = get_home_stats().copy()
 
-    # Available books (status = 'a')
-    num_instances_available = BookInstance.objects.filter(status__exact='a').count()
+    # Number of visits to this view, counted in the cache and flushed to the database later
+    context['num_visits'] = count_visit(request)
 
-    # The 'all()' is implied by default
-    num_authors = Author.objects.count()
+    # Render the HTML template index.html with the data in the context variable
+    return remember_visitor(request, TemplateResponse(request, 'index.html', context=context))
 
-    # Number of visits to this view, as counted in the session variable.
-    num_visits = request.session.get('num_visits', 0)
-    request.session['num_visits'] = num_visits + 1
 
-    context = {
-        'num_books': num_books,
-        'num_instances': num_instances,
-        'num_instances_available': num_instances_available,
-        'num_authors': num_authors,
-        'num_visits': num_visits,
-    }
-
-    # Render the HTML template index.html with the data in the context variable
-    return render(request, 'index.html', context=context)
+def index_concurrent(request):
+    """Home page, with the counts and the visit counter loaded concurrently."""
+    data = fetch_concurrently(stats=get_home_stats, num_visits=lambda: count_visit(request))
+    context = data['stats'].copy()
+    context['num_visits'] = data['num_visits']
+    return remember_visitor(request, TemplateResponse(request, 'index.html', context=context))
 
 
-class BookListView(generic.ListView):
+@method_decorator(cache_anonymous_page, name='dispatch')
+class BookListView(KeysetPaginationMixin, generic.ListView):
     model = Book
     paginate_by = 2
+    keyset_ordering = ('title', 'id')
     context_object_name = 'my_book_list' # own name for the list as a template variable
-    queryset = Book.objects.all()
+    queryset = Book.objects.select_related('author')
+
+    def selected_facets(self):
+        return selected_facets(self.request.GET)
+
+    def get_queryset(self):
+        return filter_books(super().get_queryset(), self.selected_facets())
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        selected = self.selected_facets()
+        # Counts precomputed by catalog.facets, one query whatever the size of the catalog
+        context['facets'] = facet_sidebar(selected)
+        context['facet_query'] = urlencode(sorted(selected.items()))
+        return context
+
+class BookSearchView(generic.ListView):
+    """Generic class-based view listing the books matching a full-text query, best first."""
+    template_name = 'catalog/book_search.html'
+    context_object_name = 'results'
+    paginate_by = 10
 
+    def get_queryset(self):
+        return SearchResults(self.request.GET.get('q', ''))
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['query'] = self.request.GET.get('q', '')
+        return context
+
+@method_decorator(cache_anonymous_page, name='dispatch')
 class BookDetailView(generic.DetailView):
     model = Book
-
+    # Load author, language and genres up front so the template renders in a
+    # fixed number of queries; the copies are loaded by the template in one
+    # query, and only when their cached fragment is stale
+    queryset = Book.objects \
+        .select_related('author', 'language') \
+        .prefetch_related('genre')
+
+    def get_similar_books(self):
+        return list(similar_books(self.object.pk))
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        # Precomputed by the refresh_similar_books command, one indexed query
+        context['similar_books'] = self.get_similar_books()
+        return context
+
+@method_decorator(pin_to_primary(), name='dispatch')
 class BookCreate(PermissionRequiredMixin, CreateView):
     permission_required = 'catalog.can_mark_returned'
     
@@ -59,24 +117,28 @@ class BookCreate(PermissionRequiredMixin, CreateView):
     model = Book
     fields = '__all__'
 
+@method_decorator(pin_to_primary(), name='dispatch')
 class BookUpdate(PermissionRequiredMixin, UpdateView):
     permission_required = 'catalog.can_mark_returned'
 
     model = Book
     fields = '__all__'
 
+@method_decorator(pin_to_primary(), name='dispatch')
 class BookDelete(PermissionRequiredMixin, DeleteView):
     permission_required = 'catalog.can_mark_returned'
 
     model = Book
     success_url = reverse_lazy('books')
 
+@method_decorator(cache_anonymous_page, name='dispatch')
 class AuthorsView(generic.ListView):
     model = Author
     context_object_name = 'authors_list'
     queryset = Author.objects.all()
     template_name = 'catalog/authors.html'
 
+@method_decorator(pin_to_primary(), name='dispatch')
 class AuthorCreate(PermissionRequiredMixin, CreateView):
     permission_required = 'catalog.can_mark_returned'
 
@@ -84,34 +146,123 @@ class AuthorCreate(PermissionRequiredMixin, CreateView):
     fields = '__all__'
     initial = {'date_of_death': '05/01/2018'}
 
+@method_decorator(pin_to_primary(), name='dispatch')
 class AuthorUpdate(PermissionRequiredMixin, UpdateView):
     permission_required = 'catalog.can_mark_returned'
 
     model = Author
     fields = ['first_name', 'last_name', 'date_of_birth', 'date_of_death']
 
+@method_decorator(pin_to_primary(), name='dispatch')
 class AuthorDelete(PermissionRequiredMixin, DeleteView):
     permission_required = 'catalog.can_mark_returned'
 
     model = Author
     success_url = reverse_lazy('authors')
 
+@method_decorator(cache_anonymous_page, name='dispatch')
 class AuthorDetail(generic.DetailView):
     model = Author
-
-class LoanedBookByUserListView(LoginRequiredMixin, generic.ListView):
+    # One query for the author, one for its books and one per prefetched
+    # relation of the books (genres, copies) - independent of the book count
+    queryset = Author.objects.prefetch_related(
+        Prefetch(
+            'book_set',
+            queryset=Book.objects
+                .select_related('language')
+                .prefetch_related('genre', 'bookinstance_set'),
+        ),
+    )
+
+
+class ConcurrentBookDetailView(BookDetailView):
+    """BookDetailView loading the book, its genres and its copies concurrently."""
+
+    def get_object(self, queryset=None):
+        pk = self.kwargs['pk']
+        data = fetch_concurrently(
+            book=lambda: Book.objects.select_related('author', 'language').filter(pk=pk).first(),
+            genres=lambda: list(Genre.objects.filter(book=pk)),
+            copies=lambda: list(BookInstance.objects.filter(book=pk)),
+            similar=lambda: list(similar_books(pk)),
+        )
+        book = data['book']
+        if book is None:
+            raise Http404('No book found matching the query')
+        set_prefetched(book, 'genre', data['genres'])
+        set_prefetched(book, 'bookinstance_set', data['copies'])
+        self.similar_books = data['similar']
+        return book
+
+    def get_similar_books(self):
+        return self.similar_books
+
+
+class ConcurrentAuthorDetail(AuthorDetail):
+    """AuthorDetail loading the author, its books and their copies concurrently."""
+
+    def get_object(self, queryset=None):
+        pk = self.kwargs['pk']
+        data = fetch_concurrently(
+            author=lambda: Author.objects.filter(pk=pk).first(),
+            books=lambda: list(Book.objects.filter(author=pk).select_related('language')),
+            copies=lambda: list(BookInstance.objects.filter(book__author=pk)),
+        )
+        author = data['author']
+        if author is None:
+            raise Http404('No author found matching the query')
+        copies = {}
+        for copy in data['copies']:
+            copies.setdefault(copy.book_id, []).append(copy)
+        for book in data['books']:
+            set_prefetched(book, 'bookinstance_set', copies.get(book.pk, []))
+        set_prefetched(author, 'book_set', data['books'])
+        return author
+
+class LoanedBookByUserListView(LoginRequiredMixin, KeysetPaginationMixin, generic.ListView):
     """Generic class-based view listing books on loan to current user."""
     model = BookInstance
     template_name = 'catalog/bookinstance_list_borrowed_user.html'
     paginate_by = 10
+    keyset_ordering = ('due_back', 'id')
 
     def get_queryset(self):
         return BookInstance.objects.filter(borrower=self.request.user) \
             .filter(status__exact='o') \
+            .select_related('book', 'overdue') \
             .order_by('due_back')
 
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        # The user's overdue loans as of the last overdue sweep
+        context['overdue_rollup'] = BorrowerOverdue.objects.filter(borrower=self.request.user).first()
+        return context
+
+
+class BorrowerDashboardView(LoginRequiredMixin, generic.ListView):
+    """The current user's loans, loan history and totals, in the same few queries however long the history."""
+    model = LoanEvent
+    template_name = 'catalog/borrower_dashboard.html'
+    context_object_name = 'history'
+    paginate_by = 20
+
+    def get_queryset(self):
+        return LoanEvent.objects.filter(borrower=self.request.user) \
+            .select_related('book') \
+            .order_by('-at', '-id')
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['current_loans'] = BookInstance.objects.filter(borrower=self.request.user) \
+            .filter(status__exact='o') \
+            .select_related('book', 'overdue') \
+            .order_by('due_back', 'id')
+        context['totals'] = loan_totals(self.request.user)
+        context['overdue_rollup'] = BorrowerOverdue.objects.filter(borrower=self.request.user).first()
+        return context
 
-class LibraryBooksListView(PermissionRequiredMixin, generic.ListView):
+
+class LibraryBooksListView(PermissionRequiredMixin, KeysetPaginationMixin, generic.ListView):
     """Generic class-based view Library books of the users that took them"""
     permission_required = 'catalog.can_mark_returned'
     # or multiple
@@ -120,16 +271,35 @@ class LibraryBooksListView(PermissionRequiredMixin, generic.ListView):
     model = BookInstance
     template_name = 'catalog/bookinstance_list_library.html'
     paginate_by = 10
+    keyset_ordering = ('due_back', 'id')
 
     def get_queryset(self):
-        return BookInstance.objects \
+        queryset = BookInstance.objects \
             .filter(status__exact='o') \
+            .select_related('book', 'borrower', 'overdue') \
             .order_by('due_back')
+        if self.overdue_only():
+            # Copies found by the last overdue sweep
+            queryset = queryset.filter(overdue__isnull=False)
+        return queryset
+
+    def overdue_only(self):
+        return self.request.GET.get('overdue') == '1'
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        summary = overdue_summary()
+        context['overdue_only'] = self.overdue_only()
+        context['overdue_count'] = summary['count']
+        context['overdue_swept'] = summary['swept']
+        context['overdue_borrowers'] = BorrowerOverdue.objects.select_related('borrower')[:10]
+        return context
 
 @permission_required('catalog.can_mark_returned')
+@pin_to_primary()
 def renew_book_librarian(request, pk):
     """View function for renewinga specific BookInstance by librarian."""
-    book_instance = get_object_or_404(BookInstance, pk=pk)
+    book_instance = get_object_or_404(BookInstance, uuid=pk)
 
     # If this is a POST request then process the Form data
     if request.method == 'POST':
@@ -140,21 +310,80 @@ def renew_book_librarian(request, pk):
         # Check if the form is valid:
         if form.is_valid():
             # process the data in form.cleaned_data as 
-            # required (here we just write it to the model due_back field)
-
-            book_instance.due_back = form.cleaned_data['renewal_date']
-            book_instance.save()
-
-            # redirect to a new URL:
-            return HttpResponseRedirect(reverse('library-books'))
+            # required (here we move the due date of the copy on loan)
+            try:
+                renew_copies([book_instance.uuid], due_back=form.cleaned_data['due_back'])
+            except ValidationError as error:
+                form.add_error(None, error)
+            else:
+                # redirect to a new URL:
+                return HttpResponseRedirect(reverse('library-books'))
 
     else:
         proposed_renewal_date = datetime.date.today() + datetime.timedelta(weeks=3)
-        form = RenewBookForm(initial={'renewal_data': proposed_renewal_date})
+        form = RenewBookForm(initial={'due_back': proposed_renewal_date})
 
     context = {
         'form': form,
         'book_instance': book_instance,
     }
 
-    return render(request, 'catalog/book_renew_librarian.html', context)
\ No newline at end of file
+    return TemplateResponse(request, 'catalog/book_renew_librarian.html', context)
+
+
+@permission_required('catalog.can_mark_returned')
+@pin_to_primary()
+def batch_loans(request):
+    """View function checking out, returning or renewing many copies in one transaction."""
+    if request.method == 'POST':
+        form = BatchLoanForm(request.POST)
+
+        if form.is_valid():
+            data = form.cleaned_data
+            try:
+                if data['action'] == BatchLoanForm.CHECK_OUT:
+                    check_out_copies(data['copies'], data['borrower'], data['due_back'])
+                elif data['action'] == BatchLoanForm.RETURN:
+                    return_copies(data['copies'], borrower=data['borrower'])
+                else:
+                    renew_copies(data['copies'], borrower=data['borrower'], due_back=data['due_back'])
+            except ValidationError as error:
+                form.add_error(None, error)
+            else:
+                return HttpResponseRedirect(reverse('library-books'))
+    else:
+        proposed_due_date = datetime.date.today() + datetime.timedelta(weeks=3)
+        form = BatchLoanForm(initial={'due_back': proposed_due_date})
+
+    return TemplateResponse(request, 'catalog/batch_loans.html', {'form': form})
+
+
+@permission_required('catalog.can_mark_returned')
+def export_catalog(request, name, fmt):
+    """View function streaming a catalog export (books, authors or copies) as CSV or JSON lines."""
+    if name not in EXPORTS or fmt not in FORMATS:
+        raise Http404('Unknown export.')
+
+    response = StreamingHttpResponse(export_lines(name, fmt), content_type=FORMATS[fmt])
+    response['Content-Disposition'] = f'attachment; filename="{name}.{fmt}"'
+    return response
+
+
+@staff_member_required
+def view_stats(request):
+    """View function showing the recorded cost of each catalog view against its budget."""
+    budgets = getattr(settings, 'CATALOG_VIEW_BUDGETS', {})
+    stats = [
+        {'name': name, 'budget': budgets.get(name, {}), **data}
+        for name, data in get_view_stats().items()
+    ]
+    return TemplateResponse(request, 'catalog/view_stats.html', {'stats': stats})
+
+
+@staff_member_required
+def view_stats_json(request):
+    """View function dumping the recorded cost of each catalog view as JSON."""
+    return JsonResponse({
+        'budgets': getattr(settings, 'CATALOG_VIEW_BUDGETS', {}),
+        'views': get_view_stats(),
+    })
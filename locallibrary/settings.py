@@ -42,6 +42,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so that it sees the queries of every other middleware
+    'catalog.middleware.ViewCostMiddleware',
+    'catalog.routers.ReplicaPinningMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -77,13 +80,120 @@ WSGI_APPLICATION = 'locallibrary.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/3.0/ref/settings/#databases
 
+# Database tuning profiles, picked with the CATALOG_DATABASE_PROFILE environment variable.
+# PRAGMAS are applied to every new SQLite connection by catalog.database.
+CATALOG_DATABASE_PROFILES = {
+    # SQLite and Django defaults: rollback journal, a new connection per request
+    'default': {
+        'CONN_MAX_AGE': 0,
+        'PRAGMAS': {},
+    },
+    'tuned': {
+        'CONN_MAX_AGE': 600,
+        'PRAGMAS': {
+            'journal_mode': 'wal',
+            'synchronous': 'normal',
+            'mmap_size': 256 * 1024 * 1024,
+            # Negative sizes are in KiB
+            'cache_size': -64 * 1024,
+            'busy_timeout': 5000,
+            'temp_store': 'memory',
+        },
+    },
+}
+CATALOG_DATABASE_PROFILE = os.environ.get('CATALOG_DATABASE_PROFILE', 'tuned')
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        'CONN_MAX_AGE': CATALOG_DATABASE_PROFILES[CATALOG_DATABASE_PROFILE]['CONN_MAX_AGE'],
+    }
+}
+
+CATALOG_SQLITE_PRAGMAS = CATALOG_DATABASE_PROFILES[CATALOG_DATABASE_PROFILE]['PRAGMAS']
+
+# Read replicas of the default database, given as SQLite files in the CATALOG_REPLICAS environment
+# variable (separated by os.pathsep); catalog.routers sends the catalog reads to them
+CATALOG_READ_REPLICAS = []
+for number, path in enumerate(filter(None, os.environ.get('CATALOG_REPLICAS', '').split(os.pathsep)), 1):
+    DATABASES[f'replica{number}'] = dict(DATABASES['default'], NAME=path, TEST={'MIRROR': 'default'})
+    CATALOG_READ_REPLICAS.append(f'replica{number}')
+
+DATABASE_ROUTERS = ['catalog.routers.ReplicaRouter']
+
+# Seconds the reads of a client stay on the primary after it wrote: the replication lag tolerated
+CATALOG_REPLICA_LAG = 5
+
+# Close persistent connections that stopped answering before a request reuses them
+CATALOG_DB_HEALTH_CHECKS = True
+
+
+# Sessions
+# https://docs.djangoproject.com/en/3.0/topics/http/sessions/
+
+# Session engines, picked with the CATALOG_SESSION_PROFILE environment variable
+CATALOG_SESSION_PROFILES = {
+    # Django's default: every request changing a session writes its django_session row
+    'db': 'django.contrib.sessions.backends.db',
+    # Reads served from the cache, writes go to both the cache and the database
+    'cached_db': 'django.contrib.sessions.backends.cached_db',
+    # The whole session in a signed cookie, no server-side storage
+    'signed_cookies': 'django.contrib.sessions.backends.signed_cookies',
+}
+CATALOG_SESSION_PROFILE = os.environ.get('CATALOG_SESSION_PROFILE', 'cached_db')
+SESSION_ENGINE = CATALOG_SESSION_PROFILES[CATALOG_SESSION_PROFILE]
+
+
+# Cache
+# https://docs.djangoproject.com/en/3.0/topics/cache/
+
+CACHES = {
+    'default': {
+        # Local-memory cache with least recently used entries evicted over MAX_BYTES
+        'BACKEND': 'catalog.caching.BoundedLocMemCache',
+        'LOCATION': 'locallibrary',
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+            'MAX_BYTES': 64 * 1024 * 1024,
+        },
     }
 }
 
+# Seconds whole catalog pages stay cached for anonymous users (they are also invalidated on change)
+CATALOG_PAGE_CACHE_TIMEOUT = 10 * 60
+
+# Seconds the home page statistics stay cached (they are also invalidated on change)
+CATALOG_HOME_STATS_TIMEOUT = 60 * 60
+
+# Seconds between the writes of the home page visits counted in the cache, done after a response
+# is sent; None leaves them to the flush_visits command, which shared caches allow to schedule
+CATALOG_VISITS_FLUSH_INTERVAL = 60
+
+# Number of similar books stored per book by the refresh_similar_books command, and the fewest
+# borrowers two books must share to be listed as similar
+CATALOG_SIMILAR_BOOKS = 5
+CATALOG_SIMILAR_MIN_BORROWERS = 2
+
+# Row count above which admin changelists take the count of an unfiltered table from its statistics
+CATALOG_ESTIMATED_COUNT_ABOVE = 100000
+
+# Per view (URL name) budgets checked by catalog.middleware.ViewCostMiddleware,
+# with limits on 'queries', 'sql_ms', 'template_ms' and 'total_ms'
+CATALOG_VIEW_BUDGETS = {
+    'index': {'queries': 6, 'total_ms': 200},
+    'books': {'queries': 5, 'total_ms': 200},
+    'book-detail': {'queries': 7, 'total_ms': 300},
+    'authors': {'queries': 4, 'total_ms': 300},
+    'author-detail': {'queries': 8, 'total_ms': 500},
+    'my-borrowed': {'queries': 5, 'total_ms': 200},
+    'my-dashboard': {'queries': 9, 'total_ms': 200},
+    'library-books': {'queries': 8, 'total_ms': 200},
+}
+
+# What to do when a view exceeds its budget: 'log' a warning or 'raise' ViewBudgetExceeded
+CATALOG_VIEW_BUDGET_ACTION = 'log'
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.0/ref/settings/#auth-password-validators
@@ -122,6 +232,16 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/3.0/howto/static-files/
 
 STATIC_URL = '/static/'
+STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
+
+# Bundles built by the build_assets command: the static files of each are concatenated and minified.
+# Until they are built, the pages link the sources. Bootstrap is linked from its CDN either way; a
+# vendored copy can join the bundle once it is committed under catalog/static/.
+CATALOG_ASSET_BUNDLES = {
+    'catalog.css': ['css/styles.css'],
+}
+CATALOG_ASSETS_ROOT = os.path.join(BASE_DIR, 'assets')
+CATALOG_ASSETS_URL = STATIC_URL + 'assets/'
 
 # Redirect to home URL after login (Default redirects to /accounts/profile/)
 LOGIN_REDIRECT_URL = '/'
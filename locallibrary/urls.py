@@ -23,6 +23,8 @@ from django.conf.urls.static import static
 
 from django.views.generic import RedirectView
 
+from catalog.assets import serve_asset
+
 urlpatterns = [
     path('admin/', admin.site.urls),
 ]
@@ -41,5 +43,10 @@ urlpatterns += [
     path('accounts/', include('django.contrib.auth.urls')),
 ]
 
+# Built bundles, pre-compressed and cached for good by browsers, in production too
+urlpatterns += [
+    path(settings.CATALOG_ASSETS_URL.lstrip('/') + '<path:path>', serve_asset, name='asset'),
+]
+
 # static handling
 urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
\ No newline at end of file